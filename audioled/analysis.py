@@ -0,0 +1,266 @@
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import math
+import threading
+from collections import namedtuple
+from typing import Dict
+
+import numpy as np
+
+import audioled.dsp as dsp
+
+
+# Captured chunks audio was read from: the channel, its samples before gain, the gain of the audio,
+# the sequence number of the last chunk in the audio ring buffer and the number of chunks
+Source = namedtuple('Source', ['channel', 'samples', 'gain', 'sequence', 'numChunks'])
+
+
+class AudioAnalysis(object):
+    """Features of the audio of one channel, computed once per frame and shared by all effects reading it
+
+    Effects request features by name and parameters, e.g. get('peak', 50., 200.) for the peak of the
+    50 - 200 Hz band. The first request of a frame computes the feature, identical requests of other
+    effects get the cached result until setAudio() starts the next frame.
+    Features can request other features, so the peak and rms of the same band share one bandpass.
+    Returned arrays are shared between effects and must not be modified.
+
+    Stateful features like bandpass filters and rolling windows keep their state across frames.
+    State that wasn't used for maxStateAge frames is dropped, e.g. filters of a modulated cutoff frequency.
+    Bandpass filters of captured audio are shared with the analyses of other audio inputs, see FilterRegistry.
+    """
+    maxStateAge = 60
+
+    def __init__(self):
+        self.audio = None
+        self.sampleRate = None
+        self.source = None  # type: Source
+        self._frame = 0
+        self._features = {}
+        self._state = {}
+        self._stateUsed = {}
+        self._requested = 0
+        self._computed = 0
+        # Effects of one level of the filtergraph are processed in parallel
+        self._lock = threading.RLock()
+
+    def setAudio(self, audio, sampleRate, source=None):
+        """Starts a new frame with the given samples, read from the captured chunks of source if given
+        """
+        with self._lock:
+            self.audio = audio
+            self.sampleRate = sampleRate
+            self.source = source
+            self._frame += 1
+            self._features = {}
+            for key in [key for key, used in self._stateUsed.items() if self._frame - used > self.maxStateAge]:
+                self._state.pop(key)
+                self._stateUsed.pop(key)
+
+    def get(self, name, *params):
+        """Returns the feature name with the given parameters for the audio of the current frame, see features
+        """
+        if name not in features:
+            raise ValueError("Unknown audio feature {}".format(name))
+        key = (name, ) + params
+        with self._lock:
+            self._requested += 1
+            if key not in self._features:
+                self._features[key] = features[name](self, *params)
+                self._computed += 1
+            return self._features[key]
+
+    def getState(self, key, create):
+        """Returns the state of a feature kept across frames, created by create() on first use
+        """
+        with self._lock:
+            if key not in self._state:
+                self._state[key] = create()
+            self._stateUsed[key] = self._frame
+            return self._state[key]
+
+    def getStats(self):
+        """Returns the number of requested and computed features and the number of feature states
+        """
+        with self._lock:
+            return {'requested': self._requested, 'computed': self._computed, 'states': len(self._state)}
+
+
+class _SharedFilter(object):
+    def __init__(self, bandpass, sequence):
+        self.bandpass = bandpass
+        # Sequence number of the last filtered chunk
+        self.sequence = sequence
+        self.used = sequence
+        self.outputs = {}
+
+
+class FilterRegistry(object):
+    """Bandpass filters of captured audio, shared by all audio inputs of a process
+
+    Filters are keyed by (channel, lowcut, highcut, order, fs) and run once per captured chunk, identified by its
+    sequence number in the audio ring buffer. Audio inputs of different filtergraphs reading the same channel,
+    e.g. of all devices with the thread backend or of both scenes of a transition, get the same filtered samples.
+    Filtered chunks are kept for readers of up to maxChunks older chunks, filters not used for maxAge chunks
+    are dropped. Filters used for chunks more than maxChunks ahead are reset, the sequence numbers then
+    restarted with a new ring buffer.
+    """
+    maxChunks = 8
+    maxAge = 60
+
+    def __init__(self):
+        self._filters: Dict[tuple, _SharedFilter] = {}
+        self._requested = 0
+        self._computed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, key, samples, sequence, numChunks=1):
+        """Returns the samples of numChunks chunks up to sequence, filtered by the bandpass of key
+
+        Returned arrays are shared and must not be modified.
+        """
+        channel, lowcut, highcut, order, fs = key
+        first = sequence - numChunks + 1
+        with self._lock:
+            self._requested += 1
+            # Filters of other frequencies and of a previous ring buffer with other sequence numbers
+            for unused in [k for k, f in self._filters.items() if not self._isCurrent(f, sequence)]:
+                self._filters.pop(unused)
+            if key not in self._filters:
+                self._filters[key] = _SharedFilter(dsp.Bandpass(lowcut, highcut, fs, order), first - 1)
+            sharedFilter = self._filters[key]
+            sharedFilter.used = sequence
+            outputs = []
+            for chunkSequence, chunk in zip(range(first, sequence + 1), np.array_split(samples, numChunks)):
+                if chunkSequence > sharedFilter.sequence:
+                    sharedFilter.outputs[chunkSequence] = sharedFilter.bandpass.filter(chunk, fs)
+                    sharedFilter.sequence = chunkSequence
+                    self._computed += 1
+                # Chunks older than the filter or than maxChunks aren't available any more
+                outputs.append(sharedFilter.outputs.get(chunkSequence, np.zeros(len(chunk))))
+            for old in [s for s in sharedFilter.outputs if s <= sharedFilter.sequence - self.maxChunks]:
+                sharedFilter.outputs.pop(old)
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def _isCurrent(self, sharedFilter, sequence):
+        # Readers lag behind by up to maxChunks chunks, sequence numbers further back restarted
+        return sharedFilter.used - self.maxChunks < sequence <= sharedFilter.used + self.maxAge
+
+    def reset(self):
+        """Drops all filters, e.g. when the sequence numbers restart with a new ring buffer
+        """
+        with self._lock:
+            self._filters = {}
+
+    def getStats(self):
+        """Returns the number of requested filter outputs, filtered chunks and filters
+        """
+        with self._lock:
+            return {'requested': self._requested, 'computed': self._computed, 'filters': len(self._filters)}
+
+
+# Filters of all audio inputs of this process
+sharedFilters = FilterRegistry()
+
+
+def _signal(analysis, lowcut=None, highcut=None):
+    if lowcut is None and highcut is None:
+        return analysis.audio
+    return analysis.get('bandpass', lowcut, highcut)
+
+
+def _stft(analysis, fmax, n_overlaps):
+    fs = analysis.sampleRate
+    return analysis.getState(('stft', fmax, n_overlaps, fs), lambda: dsp.STFT(fs, fmax, n_overlaps))
+
+
+def bandpass(analysis, lowcut, highcut, order=3):
+    """Audio filtered by a butterworth bandpass
+    """
+    fs = analysis.sampleRate
+    source = analysis.source
+    if source is not None:
+        filtered = sharedFilters.filter((source.channel, lowcut, highcut, order, fs), source.samples, source.sequence,
+                                        source.numChunks)
+        return filtered * source.gain
+    key = ('bandpass', lowcut, highcut, order, fs)
+    bandpassFilter = analysis.getState(key, lambda: dsp.Bandpass(lowcut, highcut, fs, order))
+    return bandpassFilter.filter(np.array(analysis.audio), fs)
+
+
+def rms(analysis, lowcut=None, highcut=None):
+    """RMS of the audio, of the lowcut - highcut band if given
+    """
+    return dsp.rms(_signal(analysis, lowcut, highcut))
+
+
+def peak(analysis, lowcut=None, highcut=None):
+    """Maximum sample of the audio, of the lowcut - highcut band if given
+    """
+    return np.max(_signal(analysis, lowcut, highcut)) * 1.0
+
+
+def envelope(analysis, lowcut=None, highcut=None, release=0.2):
+    """Peak envelope of the audio, rises with every peak and decays exponentially with the release time in seconds
+    """
+    value = analysis.get('peak', lowcut, highcut)
+    state = analysis.getState(('envelope', lowcut, highcut, release), lambda: [0.])
+    decay = math.exp(-len(analysis.audio) / analysis.sampleRate / release) if release > 0 else 0.
+    state[0] = max(value, state[0] * decay)
+    return state[0]
+
+
+def spectrum(analysis):
+    """Power spectrum of the hanning windowed audio
+    """
+    N = len(analysis.audio)
+    window = analysis.getState(('hanning', N), lambda: np.hanning(N))
+    return dsp.power_spectrum(analysis.audio * window)
+
+
+def bands(analysis, bins, fmin, fmax, scale='bark'):
+    """Power spectrum of the audio mapped to bins bands between fmin and fmax on the bark or mel scale
+    """
+    return dsp.warp_spectrum(analysis.get('spectrum'), len(analysis.audio), bins, analysis.sampleRate, [fmin, fmax],
+                             scale)
+
+
+def rollingWindow(analysis, fmax, n_overlaps):
+    """Hanning windowed audio of the last n_overlaps frames, downsampled for frequencies up to fmax
+
+    Returns the samples, zero-padded to a power of two, and their sample rate.
+    The samples are overwritten by the next frame.
+    """
+    stft = _stft(analysis, fmax, n_overlaps)
+    return stft.update(analysis.audio), stft.fs
+
+
+def rollingBands(analysis, fmax, n_overlaps, bins, fmin, fmax_band, scale='bark'):
+    """Power spectrum of rollingWindow mapped to bins bands between fmin and fmax_band on the bark or mel scale
+
+    All bands of the same rolling window share its power spectrum.
+    """
+    y, fs = analysis.get('rollingWindow', fmax, n_overlaps)
+    power = analysis.get('rollingSpectrum', fmax, n_overlaps)
+    return dsp.warp_spectrum(power, len(y), bins, fs, [fmin, fmax_band], scale)
+
+
+def rollingSpectrum(analysis, fmax, n_overlaps):
+    """Power spectrum of rollingWindow
+    """
+    # Adds the audio of this frame to the STFT
+    analysis.get('rollingWindow', fmax, n_overlaps)
+    return _stft(analysis, fmax, n_overlaps).spectrum()
+
+
+# Features by name, called with the analysis and the parameters of the request
+features = {
+    'bandpass': bandpass,
+    'rms': rms,
+    'peak': peak,
+    'envelope': envelope,
+    'spectrum': spectrum,
+    'bands': bands,
+    'rollingWindow': rollingWindow,
+    'rollingSpectrum': rollingSpectrum,
+    'rollingBands': rollingBands,
+}
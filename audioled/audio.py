@@ -1,5 +1,8 @@
 from __future__ import (absolute_import, division, print_function, unicode_literals)
 
+import ctypes
+import multiprocessing as mp
+import threading
 import time
 import traceback
 from collections import OrderedDict
@@ -7,6 +10,7 @@ from collections import OrderedDict
 import numpy as np
 import pyaudio
 
+from audioled import analysis
 from audioled.effects import Effect
 from audioled.effect import AudioBuffer
 
@@ -35,11 +39,150 @@ def numInputChannels(device_index=None):
     return info['maxInputChannels']
 
 
+class AudioRingBuffer(object):
+    """Multi-reader ring buffer for audio chunks in shared memory
+
+    The audio callback writes each float32 chunk into the next slot and stamps it with an increasing sequence number
+    and the capture time of its first sample. Capture times are time.perf_counter() seconds, like the frame times.
+    Readers in other processes get chunks as views into the shared memory without copying:
+    read() returns the latest chunk, readSince() all chunks after a sequence number and readLast() the latest samples.
+    Slots are stored twice in a row, so every range of up to numChunks - 1 chunks is contiguous in memory.
+    Multi-chunk reads assume chunks of chunkLength samples, as delivered by the audio callback,
+    shorter chunks are padded with zeros.
+
+    The ring has to be created before the reading processes are started and passed to them on start.
+    Views stay valid until the writer wraps around, i.e. for numChunks - 1 further writes after their latest chunk.
+    """
+    def __init__(self, chunkLength, numChunks=8, numChannels=1):
+        self.chunkLength = chunkLength
+        self.numChunks = numChunks
+        self.numChannels = numChannels
+        self._data = mp.RawArray(ctypes.c_float, chunkLength * numChunks * 2)
+        self._timestamps = mp.RawArray(ctypes.c_double, numChunks * 2)
+        self._lengths = mp.RawArray(ctypes.c_long, numChunks)
+        self._sequences = mp.RawArray(ctypes.c_longlong, numChunks)
+        self._writeSequence = mp.RawValue(ctypes.c_longlong, 0)
+        self.__initstate__()
+
+    def __initstate__(self):
+        self._chunks = np.frombuffer(self._data, dtype=np.float32).reshape(self.numChunks * 2, self.chunkLength)
+        self._chunkTimes = np.frombuffer(self._timestamps, dtype=np.float64)
+        # Reader state is local to each process
+        self._lastSequence = 0
+        self.droppedChunks = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_chunks')
+        state.pop('_chunkTimes')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__initstate__()
+
+    def write(self, chunk, timestamp=None):
+        """Writes a chunk into the next slot, returns the written slot as numpy view
+
+        timestamp is the capture time of the first sample in seconds, time.perf_counter() by default.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        sequence = self._writeSequence.value + 1
+        slot = sequence % self.numChunks
+        length = min(len(chunk), self.chunkLength)
+        # Mark slot as being written
+        self._sequences[slot] = -1
+        for index in [slot, slot + self.numChunks]:
+            self._chunks[index, :length] = chunk[:length]
+            self._chunks[index, length:] = 0.
+            self._chunkTimes[index] = timestamp
+        self._lengths[slot] = length
+        self._sequences[slot] = sequence
+        self._writeSequence.value = sequence
+        return self._chunks[slot, :length]
+
+    def getSequence(self):
+        return self._writeSequence.value
+
+    def read(self):
+        """Returns the latest chunk as numpy view, or None if nothing was written yet
+
+        Chunks written since the previous read are counted in droppedChunks.
+        """
+        chunk, _ = self.readLatest()
+        return chunk
+
+    def readLatest(self):
+        """Returns the latest chunk as numpy view and its sequence number, (None, 0) if nothing was written yet
+        """
+        while True:
+            sequence = self._writeSequence.value
+            if sequence == 0:
+                return None, 0
+            slot = sequence % self.numChunks
+            chunk = self._chunks[slot, :self._lengths[slot]]
+            if self._sequences[slot] == sequence:
+                break
+            # Writer wrapped around while reading, retry with the latest chunk
+        if self._lastSequence and sequence > self._lastSequence + 1:
+            self.droppedChunks += sequence - self._lastSequence - 1
+        self._lastSequence = sequence
+        return chunk, sequence
+
+    def _readChunks(self, numChunks):
+        """Returns the latest numChunks chunks and their timestamps as contiguous views and the latest sequence
+        """
+        while True:
+            sequence = self._writeSequence.value
+            numChunks = min(numChunks, sequence, self.numChunks - 1)
+            end = sequence % self.numChunks + self.numChunks + 1
+            samples = self._chunks[end - numChunks:end].reshape(-1)
+            timestamps = self._chunkTimes[end - numChunks:end]
+            # Oldest chunk still unchanged after taking the views
+            first = sequence - numChunks + 1
+            if numChunks == 0 or self._sequences[first % self.numChunks] == first:
+                return samples, timestamps, sequence
+
+    def readSince(self, sequence):
+        """Returns all samples written after the given sequence number as one numpy view
+
+        Returns the samples, the timestamps of their chunks and the sequence number to pass on the next call.
+        Pass 0 to start reading with the latest chunk. Chunks already overwritten are counted in droppedChunks.
+        """
+        latest = self._writeSequence.value
+        numChunks = latest - sequence if 0 < sequence <= latest else 1
+        if numChunks > self.numChunks - 1:
+            self.droppedChunks += numChunks - self.numChunks + 1
+        return self._readChunks(numChunks)
+
+    def readLast(self, numFrames):
+        """Returns the latest numFrames samples per channel as numpy view, interleaved like the chunks
+
+        At most numChunks - 1 chunks can be read, fewer samples are returned if not available.
+        """
+        numSamples = numFrames * self.numChannels
+        samples, _, _ = self._readChunks(-(-numSamples // self.chunkLength))
+        return samples[-numSamples:] if numSamples > 0 else samples[:0]
+
+    def getStats(self):
+        return {'sequence': self._lastSequence, 'dropped': self.droppedChunks}
+
+
+# Audio of the frame rendered by the current thread, see GlobalAudio.setFrameAudio
+_frameAudio = threading.local()
+
+
 class GlobalAudio():
     device_index = None
     buffer = None
     chunk_rate = None
     sample_rate = None
+    ringBuffer = None  # type: AudioRingBuffer
+    # Latest captured chunk and its sequence number in the ring buffer, replaced as a whole by the audio callback
+    _captured = None
+    # Seconds of audio kept in the ring buffer
+    history = 2.
 
     def __init__(self, device_index=None, chunk_rate=60, num_channels=1):
         GlobalAudio.device_index = device_index
@@ -52,10 +195,78 @@ class GlobalAudio():
             traceback.print_tb(e.__traceback__)
 
     def _audio_callback(self, in_data, frame_count, time_info, status):
-        chunk = np.fromstring(in_data, np.float32).astype(np.float)
+        chunk = np.frombuffer(in_data, np.float32)
+        chunk = GlobalAudio.ringBuffer.write(chunk, GlobalAudio._captureTime(frame_count, time_info))
+        GlobalAudio._captured = (chunk, GlobalAudio.ringBuffer.getSequence())
         GlobalAudio.buffer = chunk
         return (None, pyaudio.paContinue)
 
+    @staticmethod
+    def _captureTime(frame_count, time_info):
+        """Returns the capture time of the first sample of a chunk in time.perf_counter() seconds
+
+        PortAudio reports times in the clock of the stream, so only the input latency is taken from it.
+        Host APIs that report no ADC time (0) are assumed to deliver the chunk right after its last sample.
+        """
+        now = time.perf_counter()
+        adcTime = time_info.get('input_buffer_adc_time', 0.)
+        currentTime = time_info.get('current_time', 0.)
+        if adcTime > 0. and currentTime >= adcTime:
+            return now - (currentTime - adcTime)
+        if GlobalAudio.sample_rate:
+            return now - frame_count / GlobalAudio.sample_rate
+        return now
+
+    @staticmethod
+    def setFrameAudio(buffer, sequence=None):
+        """Sets the audio buffer of the frame rendered by the current thread, None to use the latest captured chunk
+
+        sequence is the number of the buffer in the ring buffer, None if the audio wasn't captured into it.
+        Worker threads set the chunk of each frame, so they don't share it with other workers through GlobalAudio.buffer.
+        """
+        _frameAudio.chunk = (buffer, sequence) if buffer is not None else None
+
+    @staticmethod
+    def getFrameAudio():
+        """Returns the audio buffer of the frame rendered by the current thread and its sequence number
+
+        Returns the buffer of setFrameAudio() if set, GlobalAudio.buffer otherwise.
+        The sequence number is None if the buffer wasn't captured into the ring buffer.
+        """
+        frameAudio = getattr(_frameAudio, 'chunk', None)
+        if frameAudio is not None:
+            return frameAudio
+        while True:
+            captured = GlobalAudio._captured
+            buffer = GlobalAudio.buffer
+            # The callback replaces _captured before buffer, so a new buffer comes with a new _captured
+            if GlobalAudio._captured is captured:
+                break
+        if captured is not None and captured[0] is buffer:
+            return captured
+        return buffer, None
+
+    @staticmethod
+    def readSince(sequence):
+        """Returns all samples captured after the given sequence number of the ring buffer as one numpy view
+
+        Returns the samples, the timestamps of their chunks and the sequence number to pass on the next call,
+        see AudioRingBuffer.readSince. Samples are None if no audio was captured yet.
+        """
+        ring = GlobalAudio.ringBuffer
+        if ring is None or ring.getSequence() == 0:
+            return None, None, sequence
+        return ring.readSince(sequence)
+
+    @staticmethod
+    def readLast(seconds):
+        """Returns the last seconds of captured samples as numpy view, None if no audio was captured yet
+        """
+        ring = GlobalAudio.ringBuffer
+        if ring is None or ring.getSequence() == 0 or GlobalAudio.sample_rate is None:
+            return None
+        return ring.readLast(int(seconds * GlobalAudio.sample_rate))
+
     def _open_input_stream(self, chunk_length, device_index=None, channels=1, retry=0):
         """Opens a PyAudio audio input stream
 
@@ -80,6 +291,12 @@ class GlobalAudio():
 
         try:
             frameRate = int(device_info['defaultSampleRate'])
+            numChunks = max(8, int(np.ceil(frameRate / chunk_length * GlobalAudio.history)) + 1)
+            ring = GlobalAudio.ringBuffer
+            if ring is None or ring.chunkLength != chunk_length * channels or ring.numChunks != numChunks:
+                GlobalAudio.ringBuffer = AudioRingBuffer(chunk_length * channels, numChunks, channels)
+                # Sequence numbers restart with the new ring buffer
+                analysis.sharedFilters.reset()
             stream = p.open(format=pyaudio.paFloat32,
                             channels=channels,
                             rate=frameRate,
@@ -132,16 +349,22 @@ class AudioInput(Effect):
             "Audio input captures audio from your device and " \
             "makes each channel available as an output. "
 
-    def __init__(self, num_channels=2, autogain_max=10.0, autogain=False, autogain_time=10.0):
+    def __init__(self, num_channels=2, autogain_max=10.0, autogain=False, autogain_time=10.0, lossless=False):
         self.num_channels = num_channels
         self.autogain_max = autogain_max
         self.autogain = autogain
         self.autogain_time = autogain_time
+        self.lossless = lossless
         self.__initstate__()
 
     def __initstate__(self):
         super(AudioInput, self).__initstate__()
         self._buffer = []
+        # Sequence number of the last chunk read from the ring buffer
+        self._sequence = 0
+        # Sequence number and number of the captured chunks in _buffer, None if not captured into the ring buffer
+        self._chunkSequence = None
+        self._numChunks = 1
         self._outBuffer = []
         self._autogain_perc = None
         self._cur_gain = 1.0
@@ -163,6 +386,7 @@ class AudioInput(Effect):
                 ("autogain", False),
                 ("autogain_max", [1.0, 0.01, 50.0, 0.01]),
                 ("autogain_time", [30.0, 1.0, 100.0, 0.1]),
+                ("lossless", False),
             ])
         }
         return definition
@@ -180,7 +404,11 @@ class AudioInput(Effect):
                 "Automatically adjust the gain of the input channels.\nThe input signal will be scaled up to 'autogain_max', "
                     "gain will be reduced if the audio signal would clip.",
                 "autogain_max": "Maximum gain makeup.",
-                "autogain_time": "Control the lag of the gain adjustment. Higher values will result in slower gain makeup."
+                "autogain_time": "Control the lag of the gain adjustment. Higher values will result in slower gain makeup.",
+                "lossless":
+                "Output all samples captured since the last frame instead of the latest audio chunk.\n"
+                    "Nothing is missed if frames are rendered slower than audio is captured, "
+                    "but the number of samples varies per frame."
             }
         }
         return help
@@ -202,7 +430,14 @@ class AudioInput(Effect):
             # min_value * (perc)^N = 1.0?
             # perc = root(1.0 / min_value, N) = (1./min_value)**(1/N)
             self._autogain_perc = (1.0 / min_value)**float(1 / N)
-        self._buffer = GlobalAudio.buffer
+        self._buffer, self._chunkSequence = GlobalAudio.getFrameAudio()
+        self._numChunks = 1
+        if self.lossless:
+            samples, timestamps, self._sequence = GlobalAudio.readSince(self._sequence)
+            if samples is not None:
+                self._buffer = samples
+                self._chunkSequence = self._sequence
+                self._numChunks = len(timestamps)
         if len(self._outBuffer) != self.num_channels:
             self._outBuffer = []
             for i in range(0, self.num_channels):
@@ -227,6 +462,12 @@ class AudioInput(Effect):
         for i in range(0, self.num_channels):
             # layout for multiple channel is interleaved:
             # 00 01 .. 0n 10 11 .. 1n
-            self._outBuffer[i].audio = self._cur_gain * self._buffer[i::self.num_channels]
+            samples = self._buffer[i::self.num_channels]
+            source = None
+            if self._chunkSequence is not None:
+                # Bandpass filters of the captured chunks are shared with other audio inputs
+                source = analysis.Source((i, self.num_channels), samples, self._cur_gain, self._chunkSequence,
+                                         self._numChunks)
+            self._outBuffer[i].setAudio(self._cur_gain * samples, source)
             self._outputBuffer[i] = self._outBuffer[i]
             # print("{}: {}".format(i, self._outputBuffer[i]))
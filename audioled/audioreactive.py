@@ -49,11 +49,8 @@ class Spectrum(Effect):
         self._fft_dist = np.linspace(0, 1, self.fft_bins)
         self._max_filter = np.ones(8)
         self._min_feature_win = np.hamming(8)
-        self._fs_ds = 0.0
         self._bass_rms = None
         self._melody_rms = None
-        self._lastAudioChunk = None
-        self._gen = None
         super(Spectrum, self).__initstate__()
 
     def numInputChannels(self):
@@ -94,14 +91,6 @@ class Spectrum(Effect):
     def getModulateableParameters(self):
         return []  # Disable all modulations
 
-    def _audio_gen(self, audio_gen):
-        audio, self._fs_ds = dsp.preprocess(audio_gen, self._fs, self.fmax, self.n_overlaps)
-        return audio
-
-    def buffer_coroutine(self):
-        while True:
-            yield self._lastAudioChunk
-
     async def update(self, dt):
         await super().update(dt)
         if self._num_pixels is None:
@@ -116,7 +105,6 @@ class Spectrum(Effect):
             self._outputBuffer[0] = None
             return
         audio = self._inputBuffer[0].audio
-        self._fs = self._inputBuffer[0].sample_rate
         col_melody = self._inputBuffer[1]
         col_bass = self._inputBuffer[2]
         if col_melody is None:
@@ -126,15 +114,11 @@ class Spectrum(Effect):
             # default color: all white
             col_bass = np.ones(self._num_pixels) * np.array([[255.0], [255.0], [255.0]])
         if audio is not None:
-            if self._gen is None:
-                g = self.buffer_coroutine()
-                next(g)
-                self._lastAudioChunk = audio
-                self._gen = self._audio_gen(g)
-            self._lastAudioChunk = audio
-            y = next(self._gen)
-            bass = dsp.warped_psd(y, self.fft_bins, self._fs_ds, [32.7, 261.0], 'bark')
-            melody = dsp.warped_psd(y, self.fft_bins, self._fs_ds, [261.0, self.fmax], 'bark')
+            # Spectrum of the rolling window is shared by bass and melody
+            audioBuffer = self._inputBuffer[0]
+            bass = audioBuffer.getFeature('rollingBands', self.fmax, self.n_overlaps, self.fft_bins, 32.7, 261.0, 'bark')
+            melody = audioBuffer.getFeature('rollingBands', self.fmax, self.n_overlaps, self.fft_bins, 261.0, self.fmax,
+                                            'bark')
             bass = self.process_line(bass)
             melody = self.process_line(melody)
             pixels = colors.blend(
@@ -187,7 +171,6 @@ class VUMeterRMS(Effect):
     def __initstate__(self):
         super().__initstate__()
         self._hold_values = []
-        self._bandpass = None
         self._default_color = None
 
     def numInputChannels(self):
@@ -256,19 +239,10 @@ class VUMeterRMS(Effect):
         if color is None:
             color = self._default_color
 
-        y = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
-
         if self.lowcut_hz > 0 or self.highcut_hz < 20000:
-            # construct filter if needed
-            if self._bandpass is None:
-                self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-            # update bandpass
-            self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-            # process audio
-            y = self._bandpass.filter(np.array(y), fs)
-
-        rms = dsp.rms(y)
+            rms = self._inputBuffer[0].getFeature('rms', self.lowcut_hz, self.highcut_hz)
+        else:
+            rms = self._inputBuffer[0].getFeature('rms', None, None)
         # calculate rms over hold_time
         while len(self._hold_values) > self.n_overlaps:
             self._hold_values.pop()
@@ -308,7 +282,6 @@ class VUMeterPeak(Effect):
     def __initstate__(self):
         super().__initstate__()
         self._hold_values = []
-        self._bandpass = None
         self._default_color = None
 
     def numInputChannels(self):
@@ -377,19 +350,10 @@ class VUMeterPeak(Effect):
         if color is None:
             color = self._default_color
 
-        y = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
-
         if self.lowcut_hz > 0 or self.highcut_hz < 20000:
-            # construct filter if needed
-            if self._bandpass is None:
-                self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-            # update bandpass params
-            self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-            # process audio
-            y = self._bandpass.filter(np.array(y), fs)
-
-        peak = np.max(y)
+            peak = self._inputBuffer[0].getFeature('peak', self.lowcut_hz, self.highcut_hz)
+        else:
+            peak = self._inputBuffer[0].getFeature('peak', None, None)
         # calculate max over hold_time
         while len(self._hold_values) > self.n_overlaps:
             self._hold_values.pop()
@@ -442,7 +406,6 @@ class MovingLight(Effect):
         super(MovingLight, self).__initstate__()
         # state
         self._pixel_state = None
-        self._bandpass = None
         self._last_t = 0.0
         self._last_move_t = 0.0
         self._hold_values = []
@@ -499,19 +462,10 @@ class MovingLight(Effect):
         if not self._inputBufferValid(0, buffer_type=effect.AudioBuffer.__name__):
             self._outputBuffer[0] = None
             return
-        audio = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
         color = self._inputBuffer[1]
         if color is None:
             # default color: all white
             color = np.ones(self._num_pixels) * np.array([[255.0], [255.0], [255.0]])
-        # construct filter if needed
-        if self._bandpass is None:
-            self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # update bandpass
-        self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # apply bandpass to audio
-        y = self._bandpass.filter(np.array(audio), fs)
         # move in speed
         dt_move = self._t - self._last_move_t
         # calculate number of pixels to shift
@@ -532,7 +486,7 @@ class MovingLight(Effect):
         self._pixel_state = gaussian_filter1d(self._pixel_state, sigma=0.5, axis=1)
         self._pixel_state = gaussian_filter1d(self._pixel_state, sigma=0.5, axis=1)
         # calculate current peak
-        peak = np.max(y) * 1.0
+        peak = self._inputBuffer[0].getFeature('peak', self.lowcut_hz, self.highcut_hz)
         while len(self._hold_values) > 20 * self.smoothing:
             self._hold_values.pop()
         self._hold_values.insert(0, peak)
@@ -582,7 +536,6 @@ class Bonfire(Effect):
         self.__initstate__()
 
     def __initstate__(self):
-        self._bandpass = None
         self._hold_values = []
         super(Bonfire, self).__initstate__()
 
@@ -635,17 +588,7 @@ class Bonfire(Effect):
             # default color: all white
             pixelbuffer = np.ones(self._num_pixels) * np.array([[255.0], [255.0], [255.0]])
 
-        audio = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
-
-        # construct filter if needed
-        if self._bandpass is None:
-            self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # update bandpass
-        self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # apply bandpass to audio
-        y = self._bandpass.filter(np.array(audio), fs)
-        peak = np.max(y) * 1.0
+        peak = self._inputBuffer[0].getFeature('peak', self.lowcut_hz, self.highcut_hz)
         while len(self._hold_values) > 20 * self.smoothing:
             self._hold_values.pop()
         self._hold_values.insert(0, peak)
@@ -696,7 +639,6 @@ class FallingStars(Effect):
         self._spawnArray = []
         self._peakArray = []
         self._starCounter = 0
-        self._bandpass = None
         super(FallingStars, self).__initstate__()
 
     @staticmethod
@@ -787,19 +729,8 @@ class FallingStars(Effect):
         else:
             color = np.ones(self._num_pixels) * np.array([[255.0], [255.0], [255.0]])
 
-        audio = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
-
-        # construct filter if needed
-        if self._bandpass is None:
-            self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # update bandpass
-        self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # apply bandpass to audio
-        y = self._bandpass.filter(np.array(audio), fs)
-
         # adjust probability according to peak of audio
-        peak = np.max(y) * 1.0
+        peak = self._inputBuffer[0].getFeature('peak', self.lowcut_hz, self.highcut_hz)
         try:
             peak = peak**self.peak_filter
         except Exception:
@@ -829,7 +760,6 @@ class Oscilloscope(Effect):
 
     def __initstate__(self):
         super().__initstate__()
-        self._bandpass = None
         self._audioBuffer = None
         self._last_process_dt = 0.0
 
@@ -903,17 +833,8 @@ class Oscilloscope(Effect):
             color = np.ones(cols) * np.array([[255], [255], [255]])
 
         # Init audio
-        audio = self._inputBuffer[0].audio * self.gain
         fs = self._inputBuffer[0].sample_rate
-
-        # construct filter if needed
-        if self._bandpass is None:
-            self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # update bandpass
-        self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-        
-        # apply bandpass to audio
-        y = self._bandpass.filter(np.array(audio), fs)
+        y = self._inputBuffer[0].getFeature('bandpass', self.lowcut_hz, self.highcut_hz) * self.gain
 
         # adjust number of samples to respect window_fq_hz.
         # if we have 440 samples @ 44000 Hz -> 440/44000 = 0.01 s of data -> 100 Hz
@@ -1019,8 +940,7 @@ class Blink(Effect):
             return
         if not self._inputBufferValid(0, buffer_type=effect.AudioBuffer.__name__):
             return
-        y = self._inputBuffer[0].audio
-        rms = dsp.rms(y)
+        rms = self._inputBuffer[0].getFeature('rms', None, None)
         # calculate rms over hold_time
         while len(self._hold_values) > 20 * self.smoothing:
             self._hold_values.pop()
@@ -1058,7 +978,6 @@ class Shift(Effect):
 
     def __initstate__(self):
         super().__initstate__()
-        self._bandpass = None
         self._hold_values = []
         self._shift_pixels = 0
         self._last_t = self._t
@@ -1111,20 +1030,8 @@ class Shift(Effect):
             self._outputBuffer[0] = None
             return
 
-        # Init audio
-        audio = self._inputBuffer[0].audio
-        fs = self._inputBuffer[0].sample_rate
-
-        # construct filter if needed
-        if self._bandpass is None:
-            self._bandpass = dsp.Bandpass(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # update bandpass
-        self._bandpass.updateParams(self.lowcut_hz, self.highcut_hz, fs, 3)
-        # apply bandpass to audio
-        y = self._bandpass.filter(np.array(audio), fs)
-
         x = self._inputBuffer[1]
-        rms = dsp.rms(y)
+        rms = self._inputBuffer[0].getFeature('rms', self.lowcut_hz, self.highcut_hz)
         # calculate rms over hold_time
         while len(self._hold_values) > 20 * self.smoothing:
             self._hold_values.pop()
@@ -128,9 +128,18 @@ class StaticRGBColor(Effect):
     def setOutputBuffer(self, buffer):
         self._outputBuffer = buffer
 
+    def processesInPlace(self):
+        return True
+
     async def update(self, dt):
         await super(StaticRGBColor, self).update(dt)
-        self._color = np.ones(self._num_pixels) * np.array([[self.r], [self.g], [self.b]])
+        if self._num_pixels is None:
+            self._color = np.ones(self._num_pixels) * np.array([[self.r], [self.g], [self.b]])
+            return
+        self._color = self._getOutputPixelBuffer(0)
+        self._color[0] = self.r
+        self._color[1] = self.g
+        self._color[2] = self.b
 
     def process(self):
         if self._outputBuffer is not None:
@@ -0,0 +1,131 @@
+import os
+from typing import Dict, List
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+# Thread pools of numpy's BLAS and OpenMP, read when a library is loaded
+_threadEnvironmentVariables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS']
+_blasWarningShown = False
+
+
+def getAvailableCores():
+    """Returns the CPU cores this process may run on
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def limitBlasThreads(numThreads):
+    """Limits the BLAS and OpenMP threads of this process and of processes started by it
+
+    Thread pools of libraries already loaded can only be limited with threadpoolctl.
+    Returns False if threadpoolctl isn't installed.
+    """
+    for variable in _threadEnvironmentVariables:
+        os.environ[variable] = str(numThreads)
+    if threadpoolctl is None:
+        global _blasWarningShown
+        if not _blasWarningShown:
+            print('Unable to limit BLAS threads of process {}'.format(os.getpid()))
+            print('You can install the threadpoolctl library with `pip install threadpoolctl`')
+            _blasWarningShown = True
+        return False
+    threadpoolctl.threadpool_limits(numThreads)
+    return True
+
+
+def _setAffinity(pid, cores):
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(pid, cores)
+        return True
+    except OSError as e:
+        print("Unable to pin process {} to cores {}: {}".format(pid, cores, e))
+        return False
+
+
+def _setNiceness(pid, niceness):
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, niceness)
+        return True
+    except (OSError, AttributeError) as e:
+        # Raising the priority needs root or CAP_SYS_NICE
+        print("Unable to set niceness of process {} to {}: {}".format(pid, niceness, e))
+        return False
+
+
+class CpuBudget(object):
+    """Placement of the worker and output processes of a project on CPU cores
+
+    Each filtergraph worker is pinned to one of workerCores, assigned round robin, so workers don't migrate
+    between cores. Output processes share outputCores and can run with a raised priority (negative niceness).
+    Every process limits its BLAS and OpenMP thread pools to blasThreads, so numpy doesn't spread
+    small matrix operations over cores used by other processes.
+
+    By default, output processes run on the first available core and workers on the remaining ones.
+    """
+    def __init__(self, workerCores=None, outputCores=None, blasThreads=1, outputNiceness=None):
+        available = getAvailableCores()
+        if outputCores is None:
+            outputCores = available[:1]
+        if workerCores is None:
+            workerCores = [core for core in available if core not in outputCores] or available
+        for core in list(workerCores) + list(outputCores):
+            if core not in available:
+                raise ValueError("Core {} is not available, available cores: {}".format(core, available))
+        if not workerCores or not outputCores:
+            raise ValueError("Worker and output processes need at least one core")
+        if blasThreads < 1:
+            raise ValueError("BLAS threads have to be at least 1")
+        self.workerCores: List[int] = list(workerCores)
+        self.outputCores: List[int] = list(outputCores)
+        self.blasThreads = blasThreads
+        self.outputNiceness = outputNiceness
+        self._processes: Dict[int, Dict] = {}
+        self._numWorkers = 0
+
+    def placeWorker(self, pid, deviceId):
+        """Pins a worker process to the next worker core
+        """
+        cores = [self.workerCores[self._numWorkers % len(self.workerCores)]]
+        self._numWorkers += 1
+        self._place(pid, 'worker', deviceId, cores, None)
+
+    def placeOutput(self, pid, deviceId):
+        """Pins an output process to the output cores and sets its priority
+        """
+        self._place(pid, 'output', deviceId, self.outputCores, self.outputNiceness)
+
+    def _place(self, pid, role, deviceId, cores, niceness):
+        pinned = _setAffinity(pid, cores)
+        if niceness is not None and not _setNiceness(pid, niceness):
+            niceness = None
+        self._processes[pid] = {
+            'role': role,
+            'device': deviceId,
+            'cores': cores if pinned else None,
+            'niceness': niceness,
+        }
+
+    def remove(self, pid):
+        self._processes.pop(pid, None)
+
+    def reset(self):
+        self._processes = {}
+        self._numWorkers = 0
+
+    def getLayout(self):
+        return {
+            'availableCores': getAvailableCores(),
+            'workerCores': self.workerCores,
+            'outputCores': self.outputCores,
+            'blasThreads': self.blasThreads,
+            'blasThreadsLimited': threadpoolctl is not None,
+            'outputNiceness': self.outputNiceness,
+            'processes': {str(pid): process for pid, process in self._processes.items()},
+        }
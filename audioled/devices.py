@@ -7,6 +7,11 @@ from typing import List
 import time
 import numpy as np
 import multiprocessing
+import ctypes
+import mmap
+import os
+import tempfile
+import weakref
 from audioled.effect import Effect
 
 _GAMMA_TABLE = [
@@ -384,6 +389,9 @@ class LEDOutput(Effect):
         # Don't want anything to show in the UI
         return 0
 
+    def processesInPlace(self):
+        return True
+
     def process(self):
         if self._inputBuffer is not None and self._outputBuffer is not None:
             # Make output buffer same size as input buffer
@@ -391,15 +399,75 @@ class LEDOutput(Effect):
                 for i in range(self.numInputChannels() - len(self._outputBuffer)):
                     self._outputBuffer.append(None)
             if self._inputBuffer[0] is not None:
-                self._outputBuffer[0] = self.brightness * self._inputBuffer[0]
+                y = self._inputBuffer[0]
+                if self._num_pixels is not None and np.shape(y) == (3, self._num_pixels):
+                    self._outputBuffer[0] = np.multiply(y, self.brightness, out=self._getOutputPixelBuffer(0))
+                else:
+                    self._outputBuffer[0] = self.brightness * y
             else:
                 self._outputBuffer[0] = None
 
 
+# Number of pixel banks of shared arrays, frames are rendered into alternating banks
+NUM_PIXEL_BANKS = 2
+
+
+class SharedPixelArray(object):
+    """Byte array in shared memory that can be passed to running processes by message
+
+    In contrast to multiprocessing.Array, which can only be inherited on process start, the array is backed by a
+    file in /dev/shm and pickled by its path. The file is removed when the array of the creating process is
+    garbage collected, processes that already mapped it keep their mapping.
+    """
+    def __init__(self, size):
+        shmDir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, path = tempfile.mkstemp(prefix='molecole-pixels-', dir=shmDir)
+        try:
+            os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._path = path
+        self._size = size
+        self._array = (ctypes.c_uint8 * size).from_buffer(self._mmap)
+        weakref.finalize(self, _unlinkQuietly, path)
+
+    def __getstate__(self):
+        return {'_path': self._path, '_size': self._size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        with open(self._path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), self._size)
+        self._array = (ctypes.c_uint8 * self._size).from_buffer(self._mmap)
+
+    def __len__(self):
+        return self._size
+
+    def get_obj(self):
+        return self._array
+
+
+def _unlinkQuietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def createSharedPixelArray(num_pixels):
+    """Creates a shared pixel array for a VirtualOutput with NUM_PIXEL_BANKS banks of num_pixels pixels
+    """
+    return SharedPixelArray(NUM_PIXEL_BANKS * 3 * num_pixels)
+
+
 class VirtualOutput(LEDController):
     """VirtualOutput that stores output data in a process-safe buffer array
+
+    The array is split into banks of pixels of the real device. Frame i is written to bank i % num_banks,
+    so a frame can be rendered while the output process still transmits the previous one.
     """
-    def __init__(self, device, num_pixels, shared_array: multiprocessing.Array, shared_lock: multiprocessing.Lock, num_rows=1,
+    def __init__(self, device, num_pixels, shared_array: SharedPixelArray, shared_lock: multiprocessing.Lock, num_rows=1,
                  start_index=0):
         self.device = device
         self.num_pixels = num_pixels
@@ -408,6 +476,28 @@ class VirtualOutput(LEDController):
         self.start_index = start_index
         self._shared_array = shared_array
         self._shared_lock = shared_lock
+        self._bank = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Locks can't be sent by message, the shared array doesn't need one
+        state['_shared_lock'] = None
+        return state
+
+    def getNumBanks(self):
+        return max(1, len(self._shared_array) // (3 * self.device.getNumPixels()))
+
+    def setFrameIndex(self, frameIndex):
+        """Selects the bank the pixels of the given frame are written to
+        """
+        self._bank = frameIndex % self.getNumBanks()
+
+    def getFramePixels(self, frameIndex):
+        """Returns the pixels of the real device for the given frame
+        """
+        numBanks = self.getNumBanks()
+        npArray = np.ctypeslib.as_array(self._shared_array.get_obj()).reshape(numBanks, 3, -1)
+        return npArray[frameIndex % numBanks]
 
     def getBrightness(self):
         return self.device.getBrightness()
@@ -429,8 +519,8 @@ class VirtualOutput(LEDController):
 
     def show(self, pixels):
         # print("propagating virtual from {} to {}".format(self.start_index, (self.start_index+self.num_pixels)))
-        npArray = np.ctypeslib.as_array(self._shared_array.get_obj()).reshape(3, -1)
-        npArray[:, self.start_index:self.start_index+self.num_pixels] = pixels
+        npArray = np.ctypeslib.as_array(self._shared_array.get_obj()).reshape(self.getNumBanks(), 3, -1)
+        npArray[self._bank, :, self.start_index:self.start_index+self.num_pixels] = pixels
 
 class PanelWrapper(LEDController):
     """Device Wrapper for LED Panels
@@ -1,10 +1,12 @@
 from __future__ import (absolute_import, division, print_function, unicode_literals)
 
+import functools
 import itertools
 import math
 
 import numpy as np
-from scipy.signal import butter, lfilter_zi, lfilter
+import scipy.sparse
+from scipy.signal import butter, sosfilt, sosfilt_zi
 
 
 def rollwin(signal, n_overlaps):
@@ -85,9 +87,7 @@ def downsample(signal, fs, fmax):
         The downsampled sampling rate. If downsampling is not possible
         then the original sampling rate is returned.
     """
-    if fs < 2 * fmax:
-        raise ValueError('Sampling frequency fs must be at least 2 * fmax')
-    n = int(fs / (2 * fmax))
+    n = downsample_factor(fs, fmax)
     if n == 1:
         # Downsampling is not possible
         return signal, fs
@@ -98,6 +98,13 @@ def downsample(signal, fs, fmax):
         return ds_signal, ds_fs
 
 
+def downsample_factor(fs, fmax):
+    """Returns the integer factor a signal sampled at fs can be downsampled by keeping frequencies up to fmax"""
+    if fs < 2 * fmax:
+        raise ValueError('Sampling frequency fs must be at least 2 * fmax')
+    return int(fs / (2 * fmax))
+
+
 def pad_zeros(signal):
     """Pad chunks with zeros until chunk length is a power of two
 
@@ -135,26 +142,7 @@ def preemphasis(signal, coeff=0.97):
     return np.append(signal[0], signal[1:] - coeff * signal[:-1])
 
 
-def memoize(function):
-    """Provides a decorator for memoizing functions"""
-    from functools import wraps
-    memo = {}
-
-    @wraps(function)
-    def wrapper(*args):
-        if args in memo:
-            return memo[args]
-        else:
-            rv = function(*args)
-            memo[args] = rv
-            return rv
-
-    return wrapper
-
-
-@memoize
-def filter_bank(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale):
-    """Returns an overlapping triangular filterbank"""
+def _filter_bank_bins(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale):
     if scale == 'mel':
         fmin_mel = 2595. * np.log10(1 + fmin_hz / 700.)
         fmax_mel = 2595. * np.log10(1 + fmax_hz / 700.)
@@ -166,75 +154,135 @@ def filter_bank(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale):
         f_bark = np.linspace(fmin_bark, fmax_bark, n_filters + 2)
         f_hz = 600.0 * np.sinh(f_bark / 6.0)
     # Convert from Hz points to FFT bin number
-    bins = np.floor((n_fft + 1.) * f_hz / fs)
-    # Construct the filter bank
-    filters = np.zeros((n_filters, n_fft // 2 + 1))
-    for m in range(1, n_filters + 1):
-        f_m_minus = int(bins[m - 1])  # left
-        f_m = int(bins[m])  # center
-        f_m_plus = int(bins[m + 1])  # right
-        for k in range(f_m_minus, f_m):
-            filters[m - 1, k] = (k - bins[m - 1]) / (bins[m] - bins[m - 1])
-        for k in range(f_m, f_m_plus):
-            filters[m - 1, k] = (bins[m + 1] - k) / (bins[m + 1] - bins[m])
+    return np.floor((n_fft + 1.) * f_hz / fs), f_hz
+
+
+def _ranges(starts, stops):
+    """Returns row and column indices of the column ranges starts[row] to stops[row] of all rows"""
+    lengths = np.maximum(stops - starts, 0)
+    rows = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return rows, np.repeat(starts, lengths) + offsets
+
+
+@functools.lru_cache(maxsize=32)
+def sparse_filter_bank(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale):
+    """Returns an overlapping triangular filterbank as sparse CSR matrix
+
+    Filter m rises from FFT bin left[m] to center[m] and falls until right[m], all other bins are zero.
+    """
+    bins, f_hz = _filter_bank_bins(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale)
+    n_columns = n_fft // 2 + 1
+    left = bins[:-2].astype(int)
+    center = bins[1:-1].astype(int)
+    right = bins[2:].astype(int)
+    rising_rows, rising_cols = _ranges(left, np.minimum(center, n_columns))
+    falling_rows, falling_cols = _ranges(center, np.minimum(right, n_columns))
+    rising = (rising_cols - left[rising_rows]) / (center - left)[rising_rows]
+    falling = (right[falling_rows] - falling_cols) / (right - center)[falling_rows]
+    filters = scipy.sparse.csr_matrix(
+        (np.concatenate([rising, falling]),
+         (np.concatenate([rising_rows, falling_rows]), np.concatenate([rising_cols, falling_cols]))),
+        shape=(n_filters, n_columns))
+    # Filters start with a zero weight
+    filters.eliminate_zeros()
     return filters, f_hz[1:-1]
 
 
+@functools.lru_cache(maxsize=32)
+def filter_bank(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale):
+    """Returns an overlapping triangular filterbank"""
+    filters, f = sparse_filter_bank(n_filters, n_fft, fs, fmin_hz, fmax_hz, scale)
+    return filters.toarray(), f
+
+
+def power_spectrum(y):
+    """Returns the one-sided power spectrum of y"""
+    return np.abs(np.fft.rfft(y))**2 * (2 / len(y))
+
+
 def warped_psd(y, bins, fs, frange, scale):
     """Returns the power spectrum mapped to a perceptual scale"""
-    N = len(y)
-    # Transform to frequency domain
-    pow_spectrum = np.abs(np.fft.rfft(y))**2 * (2 / N)
-    # Construct triangular filter bank
-    output, f = filter_bank(bins, N, fs, frange[0], frange[1], scale)
-    # Apply filter bank to power spectrum
-    # Remark: Numpy matrix multiplication uses all available CPU cores for a rather small matrix multiplication
-    # output_np = np.dot(pow_spectrum, output.T)
-
-    # Own MM:
-    pow_spectrum = pow_spectrum.reshape(1, -1)
-    output = np.sum(pow_spectrum[:, :, None]*output.T[None, :, :], axis=1)
-    output = output.reshape(-1)
-    # print(np.allclose(output, output_np))
-    return output
-
-
-def preprocess(audio, fs, fmax, n_overlaps):
-    # Downsample if we don't need high frequencies
-    audio, fs = downsample(audio, fs=fs, fmax=fmax)
-    # Create rolling window of last audio chunks
-    audio = rollwin(audio, n_overlaps)
-    # Construct hanning window to smooth audio at the edges
-    hanning_window = np.hanning(len(next(audio)))
-    # Apply hanning window
-    audio = (x * hanning_window for x in audio)
-    # Don't know what this should do but breaks processing if no audio input present...
-    # audio = (x for x in audio if np.sqrt(np.mean(np.square(x))) > 1e-5)
-    audio = pad_zeros(audio)
-    return audio, fs
+    return warp_spectrum(power_spectrum(y), len(y), bins, fs, frange, scale)
+
+
+def warp_spectrum(pow_spectrum, N, bins, fs, frange, scale):
+    """Maps the power spectrum of N samples to bins bands of a perceptual scale"""
+    # Sparse mat-vec, dense BLAS would spread this small product over all cores
+    filters, f = sparse_filter_bank(bins, N, fs, frange[0], frange[1], scale)
+    return filters.dot(pow_spectrum)
+
+
+class STFT():
+    """Short-time Fourier transform of a stream of audio chunks
+
+    Keeps the last n_overlaps chunks, downsampled for frequencies up to fmax, in a circular buffer.
+    Each update() writes one chunk and multiplies the buffer with a hanning window into a zero-padded
+    FFT input of the next power of two, all buffers are allocated once for the length of the first chunk.
+    """
+    def __init__(self, fs, fmax, n_overlaps):
+        self._step = downsample_factor(fs, fmax)
+        self.fs = int(fs // self._step)
+        self._n_overlaps = max(n_overlaps, 1)
+        self._buffer = None
+        self._window = None
+        self._frame = None
+        self._pos = 0
+
+    def _initBuffers(self, chunkLength):
+        N = chunkLength * self._n_overlaps
+        self._buffer = np.zeros(N)
+        self._window = np.hanning(N)
+        self._frame = np.zeros(int(2**np.ceil(np.log2(N))))
+        self._pos = 0
+
+    def update(self, chunk):
+        """Adds the next chunk and returns the windowed and zero-padded samples
+
+        The returned array is overwritten by the next update().
+        """
+        chunk = chunk[::self._step]
+        if self._buffer is None:
+            self._initBuffers(len(chunk))
+        N = len(self._buffer)
+        chunk = chunk[-N:]
+        S = len(chunk)
+        head = min(S, N - self._pos)
+        self._buffer[self._pos:self._pos + head] = chunk[:head]
+        self._buffer[:S - head] = chunk[head:]
+        self._pos = (self._pos + S) % N
+        # Oldest samples start at the write position
+        tail = N - self._pos
+        np.multiply(self._buffer[self._pos:], self._window[:tail], out=self._frame[:tail])
+        np.multiply(self._buffer[:self._pos], self._window[tail:], out=self._frame[tail:N])
+        return self._frame
+
+    def spectrum(self):
+        """Returns the one-sided power spectrum of the current frame"""
+        return power_spectrum(self._frame)
 
 
 def rms(normalized_sample_points):
-    N = len(normalized_sample_points)
-    sum_squares = sum(s**2 for s in normalized_sample_points)
-    return math.sqrt(sum_squares / (N / 2))
+    samples = np.asarray(normalized_sample_points, dtype=np.float64)
+    return math.sqrt(np.dot(samples, samples) / (len(samples) / 2))
 
 
 def design_filter(lowcut, highcut, fs, order=3):
+    """Returns the second-order sections and the initial state of a butterworth bandpass"""
     nyq = 0.5 * fs
     lowcut = max(lowcut, 10)
     highcut = min(highcut, 22000)
     low = lowcut / nyq
     high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a, lfilter_zi(b, a)
+    # Second-order sections stay stable for low cutoffs, where the transfer function coefficients lose precision
+    sos = butter(order, [low, high], btype='band', output='sos')
+    return sos, sosfilt_zi(sos)
 
 
 class Bandpass():
     def __init__(self, lowcut, highcut, fs, order=3):
         self._fs = fs
-        self._filter_a = None
-        self._filter_b = None
+        self._filter_sos = None
         self._filter_zi = None
         self._lowcut = lowcut
         self._highcut = highcut
@@ -244,7 +292,7 @@ class Bandpass():
     def filter(self, audio, fs):
         if fs != self._fs:
             self._initFilter()
-        y, self._filter_zi = lfilter(b=self._filter_b, a=self._filter_a, x=audio, zi=self._filter_zi)
+        y, self._filter_zi = sosfilt(self._filter_sos, audio, zi=self._filter_zi)
         return y
 
     def updateParams(self, lowcut, highcut, fs, order):
@@ -256,4 +304,4 @@ class Bandpass():
             self._initFilter()
 
     def _initFilter(self):
-        self._filter_b, self._filter_a, self._filter_zi = design_filter(self._lowcut, self._highcut, self._fs, self._order)
+        self._filter_sos, self._filter_zi = design_filter(self._lowcut, self._highcut, self._fs, self._order)
@@ -1,5 +1,9 @@
 import inspect
 
+import numpy as np
+
+from audioled.analysis import AudioAnalysis
+
 
 class PixelBuffer(object):
     def __init__(self):
@@ -7,10 +11,35 @@ class PixelBuffer(object):
 
 
 class AudioBuffer(object):
+    """Audio of one channel, passed from audio inputs to audio reactive effects
+
+    Features of the audio are requested with getFeature() and computed once per frame for all effects
+    reading the buffer, see audioled.analysis. Assigning new audio starts the next frame.
+    """
     def __init__(self, sample_rate):
         super().__init__()
-        self.audio = None
+        self.analysis = AudioAnalysis()
         self.sample_rate = sample_rate
+        self.audio = None
+
+    @property
+    def audio(self):
+        return self._audio
+
+    @audio.setter
+    def audio(self, audio):
+        self.setAudio(audio)
+
+    def setAudio(self, audio, source=None):
+        """Starts the next frame with the given samples
+
+        source describes the captured chunks the samples were read from, see analysis.Source.
+        """
+        self._audio = audio
+        self.analysis.setAudio(audio, self.sample_rate, source)
+
+    def getFeature(self, name, *params):
+        return self.analysis.get(name, *params)
 
 
 class Effect(object):
@@ -22,6 +51,11 @@ class Effect(object):
 
     Input values can be accessed by self._inputBuffer[channelNumber], output values
     are to be written into self_outputBuffer[channelNumber].
+
+    Effects can opt in to in-place processing by returning True in processesInPlace().
+    They then write their pixel output into the preallocated array from self._getOutputPixelBuffer(channel)
+    instead of allocating a new array every frame. The whole buffer has to be rewritten every frame,
+    since downstream effects may modify their input.
     """
     def __init__(self):
         self.__initstate__()
@@ -55,6 +89,10 @@ class Effect(object):
             self._outputBuffer
         except AttributeError:
             self._outputBuffer = None
+        try:
+            self._outputPixelBuffers
+        except AttributeError:
+            self._outputPixelBuffers = None
         # make sure all default values are set (basic backwards compatibility)
         argspec = inspect.getargspec(self.__init__)
         if argspec.defaults is not None:
@@ -88,6 +126,35 @@ class Effect(object):
         """
         self._inputBuffer = buffer
 
+    def processesInPlace(self):
+        """
+        Returns True if the effect writes its pixel output into the buffers from _getOutputPixelBuffer()
+        """
+        return False
+
+    def setOutputPixelBuffers(self, buffers):
+        """
+        Set preallocated pixel buffers of shape (3, num_pixels), one per output channel
+        """
+        self._outputPixelBuffers = buffers
+
+    def _getOutputPixelBuffer(self, channel=0):
+        """
+        Returns the preallocated pixel buffer for the given output channel.
+
+        If no matching buffer was provided by the FilterGraph, a buffer owned by the effect is allocated once.
+        """
+        buffers = self._outputPixelBuffers
+        buffer = buffers[channel] if buffers is not None and len(buffers) > channel else None
+        if buffer is None or buffer.shape != (3, self._num_pixels):
+            buffer = np.zeros((3, self._num_pixels))
+            buffers = list(buffers or [])
+            while len(buffers) <= channel:
+                buffers.append(None)
+            buffers[channel] = buffer
+            self._outputPixelBuffers = buffers
+        return buffer
+
     def process(self):
         """
         The main processing function:
@@ -100,6 +167,9 @@ class Effect(object):
     async def update(self, dt):
         """
         Update timing, can be used to precalculate stuff that doesn't depend on input values
+
+        Updates that don't await anything are called directly by the FilterGraph without an event loop.
+        Updates awaiting asynchronous work are moved to a separate event loop thread and may run concurrently to process().
         """
         if self._t:
             self._last_t = self._t
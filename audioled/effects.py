@@ -150,12 +150,19 @@ class Append(Effect):
         del definition['parameters']['num_channels']  # not editable at runtime
         return definition
 
+    def processesInPlace(self):
+        return True
+
     def process(self):
         if self._inputBuffer is None or self._outputBuffer is None:
             return
         if self._inputBuffer[0] is None:
             self._outputBuffer[0] = None
             return
+        if self._num_pixels is not None and self._numInputPixels() <= self._num_pixels:
+            self._outputBuffer[0] = self._appendInPlace(self._getOutputPixelBuffer(0))
+            return
+        # Inputs longer than num_pixels are all kept, the output is longer then
         state = np.zeros((3, 0))
         for i in range(0, self.num_channels):
             if self._inputBuffer[i] is not None:
@@ -173,6 +180,26 @@ class Append(Effect):
             state = np.concatenate((state, remainder), axis=1)
         self._outputBuffer[0] = state
 
+    def _numInputPixels(self):
+        return sum(np.size(y, axis=1) for y in self._inputBuffer[:self.num_channels] if y is not None)
+
+    def _appendInPlace(self, state):
+        num_pixels = np.size(state, axis=1)
+        idx = 0
+        for i in range(0, self.num_channels):
+            if self._inputBuffer[i] is None:
+                continue
+            y = self._inputBuffer[i]
+            if self._flipMask is not None and self._flipMask[i] > 0:
+                y = y[:, ::-1]
+            n = np.size(y, axis=1)
+            state[:, idx:idx + n] = y
+            idx += n
+        # Make sure the remaining pixels are filled with the last value
+        if idx < num_pixels:
+            state[:, idx:] = state[:, idx - 1:idx]
+        return state
+
     def getNumInputPixels(self, channel):
         # Override get num input pixels
         if self._num_pixels is not None:
@@ -260,6 +287,9 @@ class AfterGlow(Effect):
     def numOutputChannels(self):
         return 1
 
+    def processesInPlace(self):
+        return True
+
     @staticmethod
     def getParameterDefinition():
         definition = {
@@ -287,7 +317,7 @@ class AfterGlow(Effect):
         if dt > 0:
             # Dim state
             if self.glow_time > 0 and self._pixel_state is not None:
-                self._pixel_state = self._pixel_state * (1.0 - dt / self.glow_time)
+                self._pixel_state *= (1.0 - dt / self.glow_time)
             else:
                 self._pixel_state = None
 
@@ -306,9 +336,16 @@ class AfterGlow(Effect):
 
             y[:, mask] = self._pixel_state[:, mask]
 
-        self._pixel_state = y.clip(0.0, 255.0)
+        if self._pixel_state is not None and np.shape(self._pixel_state) == np.shape(y):
+            np.clip(y, 0.0, 255.0, out=self._pixel_state)
+        else:
+            self._pixel_state = y.clip(0.0, 255.0)
 
-        self._outputBuffer[0] = y.clip(0.0, 255.0)
+        if self._num_pixels is not None and np.shape(y) == (3, self._num_pixels):
+            self._outputBuffer[0] = self._getOutputPixelBuffer(0)
+            np.copyto(self._outputBuffer[0], self._pixel_state)
+        else:
+            self._outputBuffer[0] = self._pixel_state.copy()
 
 
 class Mirror(Effect):
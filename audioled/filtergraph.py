@@ -1,9 +1,17 @@
 import asyncio
+import bisect
+import collections
+import concurrent.futures
+import hashlib
+import importlib
+import json
+import os
+import threading
 import uuid
 import traceback
-import jsonpickle
+import numpy as np
 from timeit import default_timer as timer
-from typing import List
+from typing import List, Dict, Tuple
 
 from audioled import modulation
 from audioled import devices
@@ -34,7 +42,14 @@ class Node(object):
 
         self._outputBuffer = [None for i in range(0, self.effect.numOutputChannels())]
         self._inputBuffer = [None for i in range(0, self.effect.numInputChannels())]
-        self._incomingConnections = []
+        self._incomingConnections = []  # type: List[Connection]
+        self._outgoingConnections = []  # type: List[Connection]
+        # (toChannel, fromOutputBuffer, fromChannel), compiled by ExecutionPlan
+        self._inputBindings = ()
+        # Whether the update of the effect awaits asynchronous work, None until the first update
+        self._updatesAsync = None
+        self._pendingUpdate = None  # type: concurrent.futures.Future
+        self._pendingDt = 0.
 
         self.effect.setOutputBuffer(self._outputBuffer)
         self.effect.setInputBuffer(self._inputBuffer)
@@ -44,8 +59,8 @@ class Node(object):
         for i in range(self.numInputChannels):
             self._inputBuffer[i] = None
         # propagate values
-        for con in self._incomingConnections:
-            self._inputBuffer[con.toChannel] = con.fromNode._outputBuffer[con.fromChannel]
+        for toChannel, fromBuffer, fromChannel in self._inputBindings:
+            self._inputBuffer[toChannel] = fromBuffer[fromChannel]
         # process
         try:
             self.effect.process()
@@ -53,7 +68,65 @@ class Node(object):
             traceback.print_exc()
             raise NodeException("{}".format(e), self, e)
 
-    async def update(self, dt):
+    def update(self, dt, event_loop):
+        """Updates the effect, without running the event loop if the effect doesn't await anything
+
+        The first update runs as task on event_loop and finds out whether the effect awaits asynchronous work.
+        Such effects are marked with _updatesAsync and are updated by the FilterGraph on an event loop from then on.
+        All other effects get their update coroutine driven directly. Should one of them start awaiting
+        asynchronous work later, that update is finished on event_loop and the node is marked as well.
+        """
+        if self._updatesAsync is None:
+            event_loop.run_until_complete(self._firstUpdate(dt))
+            return
+        try:
+            coro = self.effect.update(dt)
+            yielded = coro.send(None)
+        except StopIteration:
+            return
+        except Exception as e:
+            traceback.print_exc()
+            raise NodeException("{}".format(e), self, e)
+        self._updatesAsync = True
+        event_loop.run_until_complete(self._finishUpdate(coro, yielded))
+
+    async def _firstUpdate(self, dt):
+        # Steps the update within the running event loop, so the effect can use it before its first await
+        try:
+            coro = self.effect.update(dt)
+            yielded = coro.send(None)
+        except StopIteration:
+            self._updatesAsync = False
+            return
+        except Exception as e:
+            traceback.print_exc()
+            raise NodeException("{}".format(e), self, e)
+        self._updatesAsync = True
+        await self._finishUpdate(coro, yielded)
+
+    async def _finishUpdate(self, coro, yielded):
+        """Drives a suspended update coroutine to its end, like a task awaiting the futures it yields
+        """
+        try:
+            while True:
+                try:
+                    if yielded is None:
+                        # Bare yield, e.g. of asyncio.sleep(0)
+                        await asyncio.sleep(0)
+                    else:
+                        # The coroutine gets the result or exception of the future when resumed
+                        await asyncio.wait([yielded])
+                except asyncio.CancelledError as e:
+                    yielded = coro.throw(e)
+                    continue
+                yielded = coro.send(None)
+        except StopIteration:
+            return
+        except Exception as e:
+            traceback.print_exc()
+            raise NodeException("{}".format(e), self, e)
+
+    async def updateAsync(self, dt):
         try:
             await self.effect.update(dt)
         except Exception as e:
@@ -98,7 +171,7 @@ class Connection(object):
         state['to_node_channel'] = self.toChannel
         state['uid'] = self.uid
         return state
-    
+
     def __setstate__(self, dict):
         print("Not pickable")
 
@@ -148,23 +221,6 @@ class Modulation(object):
     def updateParameter(self, stateDict):
         self.__setstate__(stateDict)
 
-    def propagate(self):
-        if self.modulationSource is None or self.targetEffect is None or self.targetParameter is None:
-            return
-        # Get current value
-        curValue = self.modulationSource.modulator.getValue()
-        # Propagate change
-        # calculate and propagate new offset for this parameter
-        curOffset = self.targetEffect.getParameterOffset(self.targetParameter)
-        if curOffset is None:
-            curOffset = 0
-        newOffset = curValue * self.amount
-        if self.inverted:
-            newOffset = -1 * newOffset
-        newOffset = curOffset + newOffset
-        self.targetEffect.setParameterOffset(self.targetParameter, self.targetEffect.getParameterDefinition(), newOffset)
-        self._lastValue = curValue
-
 
 class Timing(object):
     def __init__(self):
@@ -187,6 +243,318 @@ class Timing(object):
         self._count = min(100, self._count)
 
 
+class LatencyHistogram(object):
+    """Fixed-bucket histogram of durations in seconds
+
+    Buckets are spaced logarithmically with 8 buckets per octave from 1us to about 16s,
+    so percentiles are accurate to about 9%. Recording a duration doesn't allocate.
+    """
+    bucketEdges = [1e-6 * 2**(i / 8) for i in range(8 * 24)]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._counts = [0] * (len(self.bucketEdges) + 1)
+        self._count = 0
+        self._sum = 0.
+        self._max = 0.
+
+    def record(self, duration):
+        self._counts[bisect.bisect_left(self.bucketEdges, duration)] += 1
+        self._count += 1
+        self._sum += duration
+        if duration > self._max:
+            self._max = duration
+
+    def percentile(self, percent):
+        """Returns the upper bucket edge of the given percentile, limited by the maximum duration
+        """
+        if self._count == 0:
+            return None
+        threshold = self._count * percent / 100.
+        cumulative = 0
+        for i, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= threshold and count > 0:
+                if i >= len(self.bucketEdges):
+                    break
+                return min(self.bucketEdges[i], self._max)
+        return self._max
+
+    def getStats(self):
+        if self._count == 0:
+            return None
+        return {
+            'count': self._count,
+            'avg': self._sum / self._count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self._max,
+        }
+
+
+class ExecutionPlan(object):
+    """Compiled execution plan of a FilterGraph
+
+    The plan is built once by a topological sort over the connections of the graph and holds
+    the flat node order, the input bindings of every node and the order for pixel propagation.
+    It stays valid until nodes or connections are added or removed.
+
+    For parallel processing the nodes are additionally grouped into levels. All inputs of a node
+    are produced by nodes of earlier levels, so the nodes of one level can be processed concurrently.
+    """
+    def __init__(self, nodes, outputNode):
+        self._nodes = list(nodes)  # type: List[Node]
+        self._outputNode = outputNode  # type: Node
+        numOutgoing = {node: len(node._outgoingConnections) for node in self._nodes}
+
+        # Kahn's algorithm on the reversed graph, starting with the output node and all other sinks
+        ready = collections.deque([outputNode])
+        ready.extend(node for node in self._nodes if numOutgoing[node] == 0 and node is not outputNode)
+        reverseOrder = []
+        while ready:
+            node = ready.popleft()
+            reverseOrder.append(node)
+            for con in node._incomingConnections:
+                numOutgoing[con.fromNode] -= 1
+                if numOutgoing[con.fromNode] == 0:
+                    ready.append(con.fromNode)
+        # Nodes not reached here are part of a cycle and are never processed
+        self._reverseOrder = reverseOrder  # type: List[Node]
+        self.order = reverseOrder[::-1]  # type: List[Node]
+        self.processOrder = []  # type: List[Node]
+        self.levels = []  # type: List[List[Node]]
+
+        # Precompute input bindings
+        for node in self._nodes:
+            node._inputBindings = tuple(
+                (con.toChannel, con.fromNode._outputBuffer, con.fromChannel) for con in node._incomingConnections)
+
+    def propagateNumPixels(self):
+        """Propagates number of pixels and rows from the output node to all preceding nodes
+
+        Nodes that don't end up with a number of pixels are excluded from processOrder.
+        """
+        # Reset number of pixels
+        for node in self._nodes:
+            if node is not self._outputNode:
+                node.effect.setNumOutputPixels(None)
+        # Propagate num pixels and num rows, beginning at the output
+        for node in self._reverseOrder:
+            for con in node._incomingConnections:
+                num_pixels = node.effect.getNumInputPixels(con.toChannel)
+                num_rows = node.effect.getNumInputRows(con.toChannel)
+                con.fromNode.effect.setNumOutputRows(num_rows)
+                con.fromNode.effect.setNumOutputPixels(num_pixels)
+        self.processOrder = [node for node in self.order if node.effect._num_pixels is not None]
+        self._computeLevels()
+
+    def _computeLevels(self):
+        levelOfNode: Dict[Node, int] = {}
+        levels = []
+        for node in self.processOrder:
+            level = 0
+            for con in node._incomingConnections:
+                if con.fromNode in levelOfNode:
+                    level = max(level, levelOfNode[con.fromNode] + 1)
+            levelOfNode[node] = level
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(node)
+        self.levels = levels
+
+
+class BufferPool(object):
+    """Preallocated pixel buffers for the nodes of a FilterGraph
+
+    Buffers have a fixed shape (3, num_pixels) and dtype and are kept per node and output channel.
+    They are only reallocated if the propagated number of pixels of a node changes.
+    """
+    def __init__(self, dtype=np.float64):
+        self._dtype = dtype
+        self._buffers: Dict[Tuple[Node, int], np.ndarray] = {}
+
+    def getBuffer(self, node, channel, num_pixels):
+        key = (node, channel)
+        shape = (3, num_pixels)
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.zeros(shape, dtype=self._dtype)
+            self._buffers[key] = buffer
+        return buffer
+
+    def retain(self, nodes):
+        """Releases the buffers of all nodes not contained in nodes
+        """
+        nodes = set(nodes)
+        for key in [key for key in self._buffers if key[0] not in nodes]:
+            del self._buffers[key]
+
+    def numBytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+_threadPools: Dict[int, concurrent.futures.ThreadPoolExecutor] = {}
+_asyncUpdateLoop = None  # type: asyncio.AbstractEventLoop
+
+
+def _getThreadPool(numThreads):
+    """Returns a thread pool with the given number of workers, shared by all FilterGraphs of this process
+    """
+    pool = _threadPools.get(numThreads)
+    if pool is None:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=numThreads)
+        _threadPools[numThreads] = pool
+    return pool
+
+
+def _getAsyncUpdateLoop():
+    """Returns the long-lived event loop for updates of effects awaiting asynchronous work
+
+    The loop runs in its own daemon thread, shared by all FilterGraphs of this process.
+    """
+    global _asyncUpdateLoop
+    if _asyncUpdateLoop is None:
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="FilterGraph async update", daemon=True)
+        thread.start()
+        _asyncUpdateLoop = loop
+    return _asyncUpdateLoop
+
+
+def _resetAfterFork():
+    # Threads are not inherited by forked worker processes
+    global _asyncUpdateLoop
+    _threadPools.clear()
+    _asyncUpdateLoop = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_resetAfterFork)
+
+
+class ModulationTable(object):
+    """Compiled parameter modulations of a FilterGraph
+
+    Parameter ranges of all modulation targets are resolved once when the table is built.
+    Modulations targeting the same parameter are summed up, the resulting parameter value is
+
+        clip(originalValue + (max - min) * sum(sourceValue * amount), min, max)
+
+    with a negative amount for inverted modulations, following Effect.setParameterOffset.
+    The table stays valid until modulations are added, removed or updated.
+    """
+    def __init__(self, modulations):
+        sources = []  # type: List[ModulationSourceNode]
+        sourceIndex: Dict[ModulationSourceNode, int] = {}
+        targets: List[Tuple[dict, str, str, str]] = []
+        targetIndex: Dict[Tuple[int, str], int] = {}
+        ranges = []
+        modSources = []
+        modTargets = []
+        amounts = []
+        for mod in modulations:
+            if mod.modulationSource.modulator is None or mod.targetParameter is None:
+                continue
+            paramId = mod.targetParameter
+            paramDef = mod.targetEffect.getParameterDefinition()['parameters'].get(paramId)
+            if paramDef is None or len(paramDef) != 4:
+                continue
+            state = mod.targetEffect.__dict__
+            if state.get('~' + paramId, state.get(paramId)) is None:
+                continue
+            key = (id(mod.targetEffect), paramId)
+            if key not in targetIndex:
+                # Store original value, same as Effect.setParameterOffset
+                state.setdefault('~' + paramId, state[paramId])
+                targetIndex[key] = len(targets)
+                targets.append((state, paramId, '~' + paramId, '@' + paramId))
+                ranges.append((paramDef[1], paramDef[2]))
+            if mod.modulationSource not in sourceIndex:
+                sourceIndex[mod.modulationSource] = len(sources)
+                sources.append(mod.modulationSource)
+            modSources.append(sourceIndex[mod.modulationSource])
+            modTargets.append(targetIndex[key])
+            amounts.append(-mod.amount if mod.inverted else mod.amount)
+        self._sources = sources
+        self._targets = targets
+        self._modSources = np.array(modSources, dtype=np.intp)
+        self._modTargets = np.array(modTargets, dtype=np.intp)
+        self._amounts = np.array(amounts, dtype=np.float64)
+        ranges = np.array(ranges, dtype=np.float64).reshape(-1, 2)
+        self._min = ranges[:, 0]
+        self._max = ranges[:, 1]
+        self._range = self._max - self._min
+
+    def apply(self):
+        """Sets all modulated parameters from the current values of the modulation sources
+        """
+        numTargets = len(self._targets)
+        if numTargets == 0:
+            return
+        values = np.fromiter((source.modulator.getValue() for source in self._sources), np.float64, len(self._sources))
+        offsets = np.bincount(self._modTargets, weights=values[self._modSources] * self._amounts, minlength=numTargets)
+        origValues = np.fromiter((state[origKey] for state, _, origKey, _ in self._targets), np.float64, numTargets)
+        adjustedValues = np.clip(origValues + self._range * offsets, self._min, self._max)
+        for (state, paramId, _, offsetKey), value, offset in zip(self._targets, adjustedValues.tolist(), offsets.tolist()):
+            state[paramId] = value
+            state[offsetKey] = offset
+
+    def restore(self):
+        """Resets all modulated parameters to their original values
+        """
+        for state, paramId, origKey, offsetKey in self._targets:
+            if origKey in state:
+                state[paramId] = state[origKey]
+            state.pop(offsetKey, None)
+
+
+def _describe(obj, uid):
+    # Class and state of an effect or modulation source, like pickle stores them
+    return {
+        'uid': uid,
+        'class': "{}.{}".format(type(obj).__module__, type(obj).__qualname__),
+        'state': obj.__getstate__(),
+    }
+
+
+def _instantiate(description):
+    moduleName, _, className = description['class'].rpartition('.')
+    cls = importlib.import_module(moduleName)
+    for name in className.split('.'):
+        cls = getattr(cls, name)
+    obj = cls.__new__(cls)
+    obj.__setstate__(dict(description['state']))
+    return obj
+
+
+def _jsonDefault(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def getSnapshotHash(snapshot):
+    """Returns the content hash of a snapshot returned by FilterGraph.getSnapshot()
+
+    Graphs with the same nodes, parameters, connections and modulations have the same hash.
+    """
+    data = json.dumps(snapshot, sort_keys=True, default=_jsonDefault)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _bufferBase(buffer):
+    """Returns the array owning the memory of a numpy view, other buffers unchanged
+    """
+    while isinstance(buffer, np.ndarray) and buffer.base is not None:
+        buffer = buffer.base
+    return buffer
+
+
 class Updateable(object):
     def update(self, dt: float, event_loop):
         raise NotImplementedError("Update not implemented")
@@ -196,18 +564,32 @@ class Updateable(object):
 
 
 class FilterGraph(Updateable):
-    def __init__(self, recordTimings=False, asyncUpdate=True):
+    def __init__(self, recordTimings=False, asyncUpdate=True, numThreads=1):
         self.recordTimings = recordTimings
+        # Updates of effects awaiting asynchronous work run in the background without blocking the frame if True,
+        # otherwise they are awaited on the event loop passed to update()
         self.asyncUpdate = asyncUpdate
-        self.__filterConnections = []  # type: List[Connection]
-        self.__filterNodes = []  # type: List[Node]
-        self.__processOrder = []  # type: List[Node]
-        self._updateTimings = {}
-        self._processTimings = {}
+        # Number of threads used to process independent nodes, 1 processes all nodes sequentially
+        self.numThreads = numThreads
+        # Indexes by uid, insertion ordered
+        self.__filterConnections: Dict[str, Connection] = {}
+        self.__filterNodes: Dict[str, Node] = {}
+        self.__nodesByEffect: Dict[int, Node] = {}
+        self.__executionPlan = None  # type: ExecutionPlan
+        self._bufferPool = BufferPool()
+        self.__modulationTable = None  # type: ModulationTable
+        # Instrumentation, only recorded with recordTimings
+        self.frameBudget = 1. / 60
+        self._updateTimings: Dict[Node, LatencyHistogram] = {}
+        self._processTimings: Dict[Node, LatencyHistogram] = {}
+        self._frameTimings = LatencyHistogram()
+        self._frameOverruns = 0
+        self._frameStart = None
         self._outputNode = None
         self._contentRoot = None
-        self.__modulationsources = []  # type: List[ModulationSourceNode]
-        self.__modulations = []  # type: List[Modulation]
+        self.__modulationsources: Dict[str, ModulationSourceNode] = {}
+        self.__modulations: Dict[str, Modulation] = {}
+        self.__modulationsBySource: Dict[ModulationSourceNode, List[Modulation]] = {}
         # Events
         self._onNodeAdded = None
         self._onNodeRemoved = None
@@ -223,48 +605,58 @@ class FilterGraph(Updateable):
 
     def update(self, dt: float, event_loop=asyncio.get_event_loop()):
         """Update method from Updateable
-        
+
+        Effects that don't await anything in their update are called directly, without any event loop overhead.
+
         Arguments:
             dt {float} -- Time since last update
-        
+
         Keyword Arguments:
-            event_loop {[type]} -- Optional event loop to process (default: {asyncio.get_event_loop()})
+            event_loop {[type]} -- Optional event loop for effects awaiting asynchronous work
+                                   (default: {asyncio.get_event_loop()})
         """
-        
         if self._outputNode is None:
             # Pass the update, since no num_pixels can be provided to the effects
             return
+        if self.recordTimings:
+            self._frameStart = timer()
+        processOrder = self._getExecutionPlan().processOrder
         # Update modulation sources
-        for modSource in self.__modulationsources:
+        for modSource in self.__modulationsources.values():
             modSource.update(dt)
-        # Reset parameter offsets
-        for modCon in self.__modulations:
-            modCon.targetEffect.resetParameterOffsets()
         # Propagate modulated parameters to effects
-        for modCon in self.__modulations:
-            modCon.propagate()
+        self._getModulationTable().apply()
         # The actual update on the FilterGraph
-        if self.asyncUpdate:
-            time = timer()
-            # gather all async updates
-            asyncio.set_event_loop(event_loop)
-
-            async def handle_async_exception(node, func, param):
-                await func(param)
+        asyncio.set_event_loop(event_loop)
+        for node in processOrder:
+            if node._updatesAsync:
+                self._updateAsyncNode(node, dt, event_loop)
+                continue
+            if self.recordTimings:
+                time = timer()
+            node.update(dt, event_loop)
+            if self.recordTimings:
+                self._updateUpdateTiming(node, timer() - time)
 
-            all_tasks = asyncio.gather(
-                *[asyncio.ensure_future(handle_async_exception(node, node.update, dt)) for node in self.__processOrder])
-            # wait for completion
-            event_loop.run_until_complete(all_tasks)
-            self._updateUpdateTiming("all_async", timer() - time)
-        else:
-            for node in self.__processOrder:
+    def _updateAsyncNode(self, node, dt, event_loop):
+        """Updates an effect awaiting asynchronous work
 
-                if self.recordTimings:
-                    time = timer()
-                event_loop.run_until_complete(node.update(dt))
-                if self.recordTimings:
-                    self._updateUpdateTiming(str(node.effect), timer() - time)
+        With asyncUpdate the update is scheduled on the long-lived update loop and the frame doesn't wait for it.
+        While the previous update is still running, the time is accumulated for the next one.
+        """
+        if not self.asyncUpdate:
+            event_loop.run_until_complete(node.updateAsync(dt))
+            return
+        node._pendingDt += dt
+        pending = node._pendingUpdate
+        if pending is not None:
+            if not pending.done():
+                return
+            node._pendingUpdate = None
+            # Raises the NodeException of a failed update
+            pending.result()
+        dt, node._pendingDt = node._pendingDt, 0.
+        node._pendingUpdate = asyncio.run_coroutine_threadsafe(node.updateAsync(dt), _getAsyncUpdateLoop())
 
     def process(self):
         """Process method of Updateable
@@ -275,145 +667,253 @@ class FilterGraph(Updateable):
             # Pass the process, since no num_pixels can be provided to the effects
             return
 
-        for node in self.__processOrder:
-            if self.recordTimings:
-                time = timer()
-            node.process()
-            if self.recordTimings:
-                self._updateProcessTiming(node, timer() - time)
+        plan = self._getExecutionPlan()
+        if self.numThreads > 1:
+            self._processLevels(plan)
+        else:
+            for node in plan.processOrder:
+                if self.recordTimings:
+                    time = timer()
+                node.process()
+                if self.recordTimings:
+                    self._updateProcessTiming(node, timer() - time)
+
+        if self.recordTimings and self._frameStart is not None:
+            self._updateFrameTiming(timer() - self._frameStart)
+            self._frameStart = None
+
+    def _processLevels(self, plan):
+        """Processes the nodes level by level, nodes of the same level run concurrently on the thread pool
+
+        Most numpy and scipy kernels release the GIL, so independent branches of the graph can make use of multiple cores.
+        Nodes reading the same buffer aren't independent, since effects like AfterGlow modify their input.
+        They are processed one after the other, see _splitSharedInputs.
+        """
+        pool = _getThreadPool(self.numThreads)
+        for level in plan.levels:
+            for batch in self._splitSharedInputs(level):
+                if len(batch) == 1:
+                    self._processNode(batch[0])
+                    continue
+                futures = [pool.submit(self._processNode, node) for node in batch]
+                # Wait for the whole batch before raising, so no node is still running during the next batch or frame
+                concurrent.futures.wait(futures)
+                for future in futures:
+                    future.result()
+
+    @staticmethod
+    def _splitSharedInputs(level):
+        """Splits the nodes of a level into batches of nodes without a common input buffer
+
+        Readers of the same buffer stay in process order, so the result matches sequential processing.
+        Buffers are compared after processing the previous levels, pass-through effects forward their input.
+        """
+        batches = []
+        batchOfBuffer = {}
+        for node in level:
+            buffers = [id(_bufferBase(fromBuffer[fromChannel])) for _, fromBuffer, fromChannel in node._inputBindings
+                       if fromBuffer[fromChannel] is not None]
+            index = max([batchOfBuffer.get(buffer, -1) for buffer in buffers], default=-1) + 1
+            if index == len(batches):
+                batches.append([])
+            batches[index].append(node)
+            for buffer in buffers:
+                batchOfBuffer[buffer] = index
+        return batches
+
+    def _processNode(self, node):
+        if self.recordTimings:
+            time = timer()
+        node.process()
+        if self.recordTimings:
+            self._updateProcessTiming(node, timer() - time)
+
+    def setNumThreads(self, numThreads):
+        """Sets the number of threads used to process independent nodes of the graph
+
+        Arguments:
+            numThreads {int} -- Number of threads, 1 processes all nodes sequentially
+        """
+        self.numThreads = max(1, int(numThreads))
 
     def _updateProcessTiming(self, node, timing):
         if node not in self._processTimings:
-            self._processTimings[node] = Timing()
+            self._processTimings[node] = LatencyHistogram()
 
-        self._processTimings[node].update(timing)
+        self._processTimings[node].record(timing)
 
     def _updateUpdateTiming(self, node, timing):
         if node not in self._updateTimings:
-            self._updateTimings[node] = Timing()
+            self._updateTimings[node] = LatencyHistogram()
 
-        self._updateTimings[node].update(timing)
+        self._updateTimings[node].record(timing)
+
+    def _updateFrameTiming(self, timing):
+        self._frameTimings.record(timing)
+        if timing > self.frameBudget:
+            self._frameOverruns += 1
+
+    def setRecordTimings(self, recordTimings):
+        """Enables or disables the instrumentation, collected timings are reset
+        """
+        self.recordTimings = recordTimings
+        self.resetTimings()
+
+    def resetTimings(self):
+        self._updateTimings = {}
+        self._processTimings = {}
+        self._frameTimings = LatencyHistogram()
+        self._frameOverruns = 0
+        self._frameStart = None
+
+    def getTimings(self):
+        """Returns the collected timings in seconds
+
+        Returns:
+            {
+                "enabled": bool,
+                "frameBudget": float,
+                "frame": {"count", "avg", "p50", "p95", "p99", "max"} or None,
+                "overruns": int -- Number of frames exceeding the frame budget,
+                "nodes": {
+                    "nodeUid": {"effect": str, "update": {...} or None, "process": {...} or None}
+                }
+            }
+        """
+        nodes = {}
+        for node in self.__filterNodes.values():
+            update = self._updateTimings.get(node)
+            process = self._processTimings.get(node)
+            nodes[node.uid] = {
+                'effect': type(node.effect).__name__,
+                'update': update.getStats() if update is not None else None,
+                'process': process.getStats() if process is not None else None,
+            }
+        return {
+            'enabled': self.recordTimings,
+            'frameBudget': self.frameBudget,
+            'frame': self._frameTimings.getStats(),
+            'overruns': self._frameOverruns,
+            'nodes': nodes,
+        }
 
     def printUpdateTimings(self):
-        if self._updateTimings is None:
-            print("No metrics collected")
-            return
-        print("Update timings:")
-        for key, val in self._updateTimings.items():
-            print("{0:30s}: min {1:1.8f}, max {2:1.8f}, avg {3:1.8f}".format(key[0:30], val._min, val._max, val._avg))
+        self._printTimings("Update timings:", self._updateTimings)
 
     def printProcessTimings(self):
-        if self._processTimings is None:
+        self._printTimings("Process timings:", self._processTimings)
+        frame = self._frameTimings.getStats()
+        if frame is not None:
+            print("Frame: p50 {0:1.8f}, p95 {1:1.8f}, p99 {2:1.8f}, max {3:1.8f}, overruns {4} of {5}".format(
+                frame['p50'], frame['p95'], frame['p99'], frame['max'], self._frameOverruns, frame['count']))
+
+    def _printTimings(self, title, timings):
+        if not timings:
             print("No metrics collected")
             return
-        print("Process timings:")
-        for key, val in self._processTimings.items():
-            print("{0:30s}: min {1:1.8f}, max {2:1.8f}, avg {3:1.8f}".format(
-                str(key.effect)[0:30], val._min, val._max, val._avg))
+        print(title)
+        for node, histogram in list(timings.items()):
+            stats = histogram.getStats()
+            print("{0:30s}: p50 {1:1.8f}, p95 {2:1.8f}, p99 {3:1.8f}, max {4:1.8f}".format(
+                str(node.effect)[0:30], stats['p50'], stats['p95'], stats['p99'], stats['max']))
 
-    def addEffectNode(self, effectToAdd: effect.Effect):
+    def addEffectNode(self, effectToAdd: effect.Effect, uid=None):
         """Adds a filter node to the graph
 
         Parameters
         ----------
-        filterNode: node to add
+        effectToAdd: effect to add
+        uid: uid of the new node, a new uid is generated if None
         """
         effectToAdd._filterGraph = self
         node = Node(effectToAdd)
-        node.uid = uuid.uuid4().hex
+        node.uid = uid if uid is not None else uuid.uuid4().hex
         if isinstance(effectToAdd, devices.LEDOutput):
             if self._outputNode is None:
                 self._outputNode = node
             else:
                 raise RuntimeError("Filtergraph can only have one LED Output")
 
-        self.__filterNodes.append(node)
+        self.__filterNodes[node.uid] = node
+        self.__nodesByEffect[id(effectToAdd)] = node
         if self._onNodeAdded is not None:
             self._onNodeAdded(node)
-        self._updateProcessOrder()
+        self._invalidateExecutionPlan()
         return node
 
     def removeEffectNode(self, nodeUid):
-        """Removes effect node with given effect from FilterGraph
-        
+        """Removes effect node with given uid from FilterGraph
+
         Arguments:
-            effectToRemove {effect.Effect} -- Effect to remove
+            nodeUid {str} -- Uid of the node to remove
         """
-        node = next(node for node in self.__filterNodes if node.uid == nodeUid)
-        effectToRemove = node.effect
-        
+        node = self._lookup(self.__filterNodes, nodeUid)  # type: Node
+
         # Remove connections
-        connections = [con for con in self.__filterConnections if con.fromNode.effect == effectToRemove
-                       or con.toNode.effect == effectToRemove]
-        for con in connections:
-            self.__filterConnections.remove(con)
-            if self._onConnectionRemoved is not None:
-                self._onConnectionRemoved(con)
+        for con in node._incomingConnections + node._outgoingConnections:
+            self._removeConnection(con)
         # Remove Node
-        if node is not None:
-            self.__filterNodes.remove(node)
-            if self._onNodeRemoved is not None:
-                self._onNodeRemoved(node)
-            if node == self._outputNode:
-                self._outputNode = None
-            if node in self.__processOrder:
-                self.__processOrder.remove(node)
-                self._updateProcessOrder()
-
-    def addConnection(self, fromEffect, fromEffectChannel, toEffect, toEffectChannel):
+        self._removeFromIndex(self.__filterNodes, node)
+        self.__nodesByEffect.pop(id(node.effect), None)
+        if self._onNodeRemoved is not None:
+            self._onNodeRemoved(node)
+        if node == self._outputNode:
+            self._outputNode = None
+        self._updateTimings.pop(node, None)
+        self._processTimings.pop(node, None)
+        self._invalidateExecutionPlan()
+
+    def addConnection(self, fromEffect, fromEffectChannel, toEffect, toEffectChannel, uid=None):
         """Adds a connection between two filters
         """
         # find fromNode
-        fromNode = next(node for node in self.__filterNodes if node.effect == fromEffect)  # type: Node
+        fromNode = self.__nodesByEffect[id(fromEffect)]  # type: Node
         # find toNode
-        toNode = next(node for node in self.__filterNodes if node.effect == toEffect)  # type: Node
-        # construct connection
-        newConnection = Connection(fromNode, fromEffectChannel, toNode, toEffectChannel)
-        newConnection.uid = uuid.uuid4().hex
-        if self._connectionWillMakeGraphCyclic(newConnection):
-            raise RuntimeError("Connection would make graph cyclic")
-        self.__filterConnections.append(newConnection)
-        if self._onConnectionAdded is not None:
-            self._onConnectionAdded(newConnection)
-        toNode._incomingConnections.append(newConnection)
-        self._updateProcessOrder()
-        return newConnection
+        toNode = self.__nodesByEffect[id(toEffect)]  # type: Node
+        return self._addConnection(fromNode, fromEffectChannel, toNode, toEffectChannel, uid)
 
-    def addNodeConnection(self, fromNodeUid, fromEffectChannel, toNodeUid, toEffectChannel):
+    def addNodeConnection(self, fromNodeUid, fromEffectChannel, toNodeUid, toEffectChannel, uid=None):
         """Adds a connection between two filters based on node uid
         """
-        fromNode = next(node for node in self.__filterNodes if node.uid == fromNodeUid)
-        toNode = next(node for node in self.__filterNodes if node.uid == toNodeUid)
+        fromNode = self._lookup(self.__filterNodes, fromNodeUid)
+        toNode = self._lookup(self.__filterNodes, toNodeUid)
+        return self._addConnection(fromNode, fromEffectChannel, toNode, toEffectChannel, uid)
+
+    def _addConnection(self, fromNode, fromEffectChannel, toNode, toEffectChannel, uid):
         newConnection = Connection(fromNode, fromEffectChannel, toNode, toEffectChannel)
-        newConnection.uid = uuid.uuid4().hex
+        newConnection.uid = uid if uid is not None else uuid.uuid4().hex
         if self._connectionWillMakeGraphCyclic(newConnection):
             raise RuntimeError("Connection would make graph cyclic")
-        self.__filterConnections.append(newConnection)
+        self.__filterConnections[newConnection.uid] = newConnection
         if self._onConnectionAdded is not None:
             self._onConnectionAdded(newConnection)
         toNode._incomingConnections.append(newConnection)
-        self._updateProcessOrder()
+        fromNode._outgoingConnections.append(newConnection)
+        self._invalidateExecutionPlan()
         return newConnection
 
     def removeConnection(self, conUid):
-        con = next(con for con in self.__filterConnections if con.uid == conUid)
-        if con is not None:
-            self.__filterConnections.remove(con)
-            if self._onConnectionRemoved is not None:
-                self._onConnectionRemoved(con)
-            con.toNode._incomingConnections.remove(con)
-        else:
-            print("Could not remove connection {}".format(conUid))
+        con = self._lookup(self.__filterConnections, conUid)
+        self._removeConnection(con)
+
+    def _removeConnection(self, con):
+        self._removeFromIndex(self.__filterConnections, con)
+        if self._onConnectionRemoved is not None:
+            self._onConnectionRemoved(con)
+        con.toNode._incomingConnections.remove(con)
+        con.fromNode._outgoingConnections.remove(con)
+        self._invalidateExecutionPlan()
 
     def getLEDOutput(self):
         return self._outputNode
 
-    def addModulationSource(self, modulationSource):
+    def addModulationSource(self, modulationSource, uid=None):
         """Adds a modulation source
         """
         modSourceNode = ModulationSourceNode(modulationSource)
-        modSourceNode.uid = uuid.uuid4().hex
-        self.__modulationsources.append(modSourceNode)
+        modSourceNode.uid = uid if uid is not None else uuid.uuid4().hex
+        self.__modulationsources[modSourceNode.uid] = modSourceNode
+        self.__modulationsBySource[modSourceNode] = []
         if self._onModulationSourceAdded is not None:
             self._onModulationSourceAdded(modSourceNode)
         return modSourceNode
@@ -421,29 +921,28 @@ class FilterGraph(Updateable):
     def removeModulationSource(self, modSourceUid):
         """Removes a modulation source with the given uid
         """
-        modSourceNode = next(modSource for modSource in self.__modulationsources if modSource.uid == modSourceUid)
-
-        if modSourceNode is None:
-            return
+        modSourceNode = self._lookup(self.__modulationsources, modSourceUid)
 
-        mods = [mod for mod in self.__modulations if mod.modulationSource == modSourceNode]
         # delete mods
-        for mod in mods:
-            self.removeModulation(mod.uid)
+        for mod in list(self.__modulationsBySource[modSourceNode]):
+            self._removeModulation(mod)
 
         # delete modSourceNode
-        self.__modulationsources.remove(modSourceNode)
+        self._removeFromIndex(self.__modulationsources, modSourceNode)
+        del self.__modulationsBySource[modSourceNode]
         if self._onModulationSourceRemoved is not None:
             self._onModulationSourceRemoved(modSourceNode)
 
-    def addModulation(self, modSourceUid, targetNodeUid, targetParam=None, amount=0, inverted=False):
+    def addModulation(self, modSourceUid, targetNodeUid, targetParam=None, amount=0, inverted=False, uid=None):
         """Adds a modulation driven by a modulationSource
         """
-        modSource = next(modSource for modSource in self.__modulationsources if modSource.uid == modSourceUid)
-        targetNode = next(node for node in self.__filterNodes if node.uid == targetNodeUid)
+        modSource = self._lookup(self.__modulationsources, modSourceUid)
+        targetNode = self._lookup(self.__filterNodes, targetNodeUid)
         newMod = Modulation(modSource, amount, inverted, targetNode, targetParam)
-        newMod.uid = uuid.uuid4().hex
-        self.__modulations.append(newMod)
+        newMod.uid = uid if uid is not None else uuid.uuid4().hex
+        self.__modulations[newMod.uid] = newMod
+        self.__modulationsBySource[modSource].append(newMod)
+        self._invalidateModulationTable()
         if self._onModulationAdded is not None:
             self._onModulationAdded(newMod)
         return newMod
@@ -451,129 +950,154 @@ class FilterGraph(Updateable):
     def removeModulation(self, modUid):
         """Removes a modulation driven by a modulationSource
         """
-        mod = next(mod for mod in self.__modulations if mod.uid == modUid)  # type: Modulation
-        if mod is not None:
-            # Reset parameter offset
-            if mod.targetParameter is not None:
-                mod.targetEffect.setParameterOffset(mod.targetParameter, mod.targetEffect.getParameterDefinition(), 0)
+        mod = self._lookup(self.__modulations, modUid)  # type: Modulation
+        self._removeModulation(mod)
 
-            # Remove modulation
-            self.__modulations.remove(mod)
-            if self._onModulationRemoved is not None:
-                self._onModulationRemoved(mod)
+    def _removeModulation(self, mod):
+        # Reset parameter offset
+        if mod.targetParameter is not None:
+            mod.targetEffect.setParameterOffset(mod.targetParameter, mod.targetEffect.getParameterDefinition(), 0)
+
+        # Remove modulation
+        self._removeFromIndex(self.__modulations, mod)
+        self.__modulationsBySource[mod.modulationSource].remove(mod)
+        self._invalidateModulationTable()
+        if self._onModulationRemoved is not None:
+            self._onModulationRemoved(mod)
 
     def propagateNumPixels(self, num_pixels, num_rows=1):
         if self.getLEDOutput() is not None:
             self.getLEDOutput().effect.setNumOutputPixels(num_pixels)
             self.getLEDOutput().effect.setNumOutputRows(num_rows)
-            self._updateProcessOrder()
+            if self.__executionPlan is not None:
+                # Topology unchanged, only pixels need to be propagated
+                self.__executionPlan.propagateNumPixels()
+                self._assignPixelBuffers(self.__executionPlan)
+            else:
+                self._getExecutionPlan()
 
     def getConnections(self):
-        return self.__filterConnections
+        return list(self.__filterConnections.values())
 
     def getNodes(self):
-        return self.__filterNodes
+        return list(self.__filterNodes.values())
 
     def getModulationSources(self):
-        return self.__modulationsources
-    
+        return list(self.__modulationsources.values())
+
     def getModulations(self):
-        return self.__modulations
+        return list(self.__modulations.values())
+
+    def getNode(self, nodeUid):
+        """Returns the node with the given uid, raises KeyError if not found
+        """
+        return self._lookup(self.__filterNodes, nodeUid)
+
+    def getConnection(self, conUid):
+        """Returns the connection with the given uid, raises KeyError if not found
+        """
+        return self._lookup(self.__filterConnections, conUid)
+
+    def getModulationSource(self, modSourceUid):
+        """Returns the modulation source node with the given uid, raises KeyError if not found
+        """
+        return self._lookup(self.__modulationsources, modSourceUid)
+
+    def getModulation(self, modUid):
+        """Returns the modulation with the given uid, raises KeyError if not found
+        """
+        return self._lookup(self.__modulations, modUid)
 
     def updateNodeParameter(self, nodeUid, updateParameters):
-        node = next(node for node in self.__filterNodes if node.uid == nodeUid)
+        node = self._lookup(self.__filterNodes, nodeUid)
         node.effect.updateParameter(updateParameters)
-        print(jsonpickle.encode(node.effect))
         if self._onNodeUpdate is not None:
             self._onNodeUpdate(node, updateParameters)
         return node
 
     def updateModulationSourceParameter(self, modSourceUid, updateParameters):
-        mod = next(mod for mod in self.__modulationsources
-                   if mod.uid == modSourceUid)  # type: ModulationSourceNode
+        mod = self._lookup(self.__modulationsources, modSourceUid)  # type: ModulationSourceNode
         mod.modulator.updateParameter(updateParameters)
         if self._onModulationSourceUpdate is not None:
             self._onModulationSourceUpdate(mod, updateParameters)
         return mod
 
     def updateModulationParameter(self, modUid, updateParameters):
-        mod = next(mod for mod in self.__modulations if mod.uid == modUid)  # type: Modulation
+        mod = self._lookup(self.__modulations, modUid)  # type: Modulation
         mod.updateParameter(updateParameters)
+        self._invalidateModulationTable()
         if self._onModulationUpdate is not None:
             self._onModulationUpdate(mod, updateParameters)
         return mod
 
-    def _updateProcessOrder(self):
-        processOrder = []
-        if self._outputNode is None:
-            print("No output node")
-            return
-
-        unprocessedNodes = self.__filterNodes.copy()
-        processOrder.append(self._outputNode)
-        unprocessedNodes.remove(self._outputNode)
-
-        fatalError = False
-
-        while not fatalError and len(unprocessedNodes) > 0:
-            sizeBefore = len(unprocessedNodes)
-            curProcessOrder = processOrder.copy()
-
-            for node in unprocessedNodes.copy():
-                # find connections
-                cons = [con for con in self.__filterConnections if con.fromNode == node]
-                # check all nodes after this node have been processed
-                satisfied = True
-                for con in cons:
-                    if con.toNode not in curProcessOrder:
-                        satisfied = False
-                        continue
+    @staticmethod
+    def _lookup(index, uid):
+        """Returns the item with the given uid from one of the uid indexes
 
-                if satisfied:
-                    processOrder.append(node)
-                    unprocessedNodes.remove(node)
-
-            sizeAfter = len(unprocessedNodes)
-            fatalError = sizeAfter == sizeBefore
+        Uids assigned after an item was added are picked up by rebuilding the index.
+        Raises KeyError if no item with this uid exists.
+        """
+        item = index.get(uid)
+        if item is None or item.uid != uid:
+            FilterGraph._reindex(index)
+            item = index[uid]
+        return item
+
+    @staticmethod
+    def _removeFromIndex(index, item):
+        if index.get(item.uid) is not item:
+            FilterGraph._reindex(index)
+        del index[item.uid]
+
+    @staticmethod
+    def _reindex(index):
+        items = list(index.values())
+        index.clear()
+        for item in items:
+            index[item.uid] = item
+
+    def _invalidateExecutionPlan(self):
+        """Marks the execution plan as outdated after a change in topology
+        """
+        self.__executionPlan = None
 
-        # Check remaining unprocessed nodes for circular connections
-        # for node in unprocessedNodes:
-        #     cons = [con for con in self.__filterConnections if con.fromNode == node]
-        #     for con in cons:
-        #         if con.toNode in self.__processOrder:
-        #             raise RuntimeError("Circular connection detected")
+    def _getExecutionPlan(self):
+        """Returns the execution plan, compiling it if the topology changed since the last call
+        """
+        if self.__executionPlan is None:
+            plan = ExecutionPlan(self.__filterNodes.values(), self._outputNode)
+            plan.propagateNumPixels()
+            self._assignPixelBuffers(plan)
+            self.__executionPlan = plan
+        return self.__executionPlan
+
+    def _invalidateModulationTable(self):
+        """Marks the modulation table as outdated, parameters of the old table are reset to their original values
+        """
+        if self.__modulationTable is not None:
+            self.__modulationTable.restore()
+        self.__modulationTable = None
 
-        processOrder.reverse()
+    def _getModulationTable(self):
+        if self.__modulationTable is None:
+            self.__modulationTable = ModulationTable(self.__modulations.values())
+        return self.__modulationTable
 
-        # Reset number of pixels
-        for node in self.__filterNodes:
-            if node is not self.getLEDOutput():
-                node.effect.setNumOutputPixels(None)
-        # Propagate num pixels and num cols
-        for node in reversed(processOrder):
-            # find connections to the current node
-            inputConnections = [con for con in self.__filterConnections if con.toNode == node]
-            # print("{} input connections found for node {}".format(len(inputConnections), node.effect))
-            for con in inputConnections:
-                num_pixels = node.effect.getNumInputPixels(con.toChannel)
-                num_rows = node.effect.getNumInputRows(con.toChannel)
-                # find node
-                iNode = con.fromNode
-                # propagate pixels
-                if iNode is not None:
-                    iNode.effect.setNumOutputRows(num_rows)
-                    iNode.effect.setNumOutputPixels(num_pixels)
-
-        # Debug output
-        for node in processOrder.copy():
-            if node.effect._num_pixels is None:
-                processOrder.remove(node)
-        # persist
-        self.__processOrder = processOrder
+    def _assignPixelBuffers(self, plan):
+        """Hands out pool buffers to all nodes processing in place
+        """
+        self._bufferPool.retain(plan.processOrder)
+        for node in plan.processOrder:
+            if isinstance(node.effect, effect.Effect) and node.effect.processesInPlace():
+                num_pixels = node.effect.getNumOutputPixels()
+                node.effect.setOutputPixelBuffers(
+                    [self._bufferPool.getBuffer(node, channel, num_pixels) for channel in range(node.numOutputChannels)])
 
     def _getNodesInOrder(self):
         # For testing only
-        return self.__processOrder
+        if self._outputNode is None:
+            return []
+        return self._getExecutionPlan().processOrder
 
     def _connectionWillMakeGraphCyclic(self, connection):
         targetNode = connection.toNode
@@ -581,36 +1105,74 @@ class FilterGraph(Updateable):
         if targetNode == curNode:
             return True
         # traverse predecessors and check if connection.toNode is one of them
-        return self._checkHasPredecessor(curNode, targetNode, [])
+        return self._checkHasPredecessor(curNode, targetNode, set())
 
     def _checkHasPredecessor(self, curNode, targetNode, visitedNodes):
         if targetNode == curNode:
             return True
-        predecessors = [con for con in self.__filterConnections if con.toNode == curNode]
         furtherNodes = []
-        for con in predecessors:
+        for con in curNode._incomingConnections:
             node = con.fromNode
             if node is targetNode:
                 return True
             if node not in visitedNodes:
                 furtherNodes.append(node)
-        visitedNodes.append(curNode)
+        visitedNodes.add(curNode)
         for node in furtherNodes:
             if self._checkHasPredecessor(node, targetNode, visitedNodes):
                 return True
         return False
 
+    def getSnapshot(self):
+        """Returns a compact description of the graph made of plain data
+
+        Effects and modulation sources are described by class and state, connections and modulations by uid.
+        Buffers and timings aren't part of the snapshot. Use fromSnapshot to rebuild the graph in another process.
+        """
+        return {
+            'nodes': [_describe(node.effect, node.uid) for node in self.__filterNodes.values()],
+            'connections': [con.__getstate__() for con in self.__filterConnections.values()],
+            'modulationSources': [_describe(mod.modulator, mod.uid) for mod in self.__modulationsources.values()],
+            'modulations': [mod.__getstate__() for mod in self.__modulations.values()],
+            'recordTimings': self.recordTimings,
+            'numThreads': self.numThreads,
+            'contentRoot': self._contentRoot,
+        }
+
+    @staticmethod
+    def fromSnapshot(snapshot):
+        """Creates a FilterGraph from a snapshot returned by getSnapshot()
+        """
+        fg = FilterGraph(recordTimings=snapshot['recordTimings'], numThreads=snapshot['numThreads'])
+        fg._contentRoot = snapshot['contentRoot']
+        for node in snapshot['nodes']:
+            fg.addEffectNode(_instantiate(node), uid=node['uid'])
+        for con in snapshot['connections']:
+            fg.addNodeConnection(con['from_node_uid'], con['from_node_channel'], con['to_node_uid'], con['to_node_channel'],
+                                 uid=con['uid'])
+        for mod in snapshot['modulationSources']:
+            fg.addModulationSource(_instantiate(mod), uid=mod['uid'])
+        for mod in snapshot['modulations']:
+            fg.addModulation(mod['modulation_source_uid'],
+                             mod['target_node_uid'],
+                             mod['target_param'],
+                             mod['amount'],
+                             mod['inverted'],
+                             uid=mod['uid'])
+        return fg
+
     def __getstate__(self):
         state = {}
-        nodes = [node for node in self.__filterNodes]
+        nodes = [node for node in self.__filterNodes.values()]
         state['nodes'] = nodes
         connections = []
-        for con in self.__filterConnections:
+        for con in self.__filterConnections.values():
             connections.append(con.__getstate__())
         state['connections'] = connections
         state['recordTimings'] = self.recordTimings
-        state['modulationSources'] = [mod for mod in self.__modulationsources]
-        state['modulations'] = [con.__getstate__() for con in self.__modulations]
+        state['numThreads'] = self.numThreads
+        state['modulationSources'] = [mod for mod in self.__modulationsources.values()]
+        state['modulations'] = [con.__getstate__() for con in self.__modulations.values()]
         state['_contentRoot'] = self._contentRoot
         return state
 
@@ -620,26 +1182,27 @@ class FilterGraph(Updateable):
             self._contentRoot = state['_contentRoot']
         if 'recordTimings' in state:
             self.recordTimings = state['recordTimings']
+        self.numThreads = state.get('numThreads', 1)
         if 'nodes' in state:
             nodes = state['nodes']
             for node in nodes:
-                newnode = self.addEffectNode(node.effect)
-                newnode.uid = node.uid
+                self.addEffectNode(node.effect, uid=node.uid)
         if 'connections' in state:
             connections = state['connections']
             for con in connections:
                 fromChannel = con['from_node_channel']
                 toChannel = con['to_node_channel']
-                newcon = self.addNodeConnection(con['from_node_uid'], fromChannel, con['to_node_uid'], toChannel)
-                newcon.uid = con['uid']
+                self.addNodeConnection(con['from_node_uid'], fromChannel, con['to_node_uid'], toChannel, uid=con['uid'])
         if 'modulationSources' in state:
             modSources = state['modulationSources']
             for mod in modSources:
-                newModSource = self.addModulationSource(mod.modulator)
-                newModSource.uid = mod.uid
+                self.addModulationSource(mod.modulator, uid=mod.uid)
         if 'modulations' in state:
             mods = state['modulations']
             for mod in mods:
-                newMod = self.addModulation(mod['modulation_source_uid'], mod['target_node_uid'], mod['target_param'],
-                                            mod['amount'], mod['inverted'])
-                newMod.uid = mod['uid']
\ No newline at end of file
+                self.addModulation(mod['modulation_source_uid'],
+                                   mod['target_node_uid'],
+                                   mod['target_param'],
+                                   mod['amount'],
+                                   mod['inverted'],
+                                   uid=mod['uid'])
\ No newline at end of file
@@ -5,14 +5,21 @@ from typing import List, Dict
 import audioled.devices
 import audioled.audio
 import audioled.filtergraph
+from audioled import cpubudget, tracing
 import time
 import multiprocessing as mp
 import traceback
 import ctypes
 
+import collections
+import copy
+import importlib
 import os
+import pickle
+import queue
+import threading
+import uuid
 from functools import wraps
-import numpy as np
 
 
 def ensure_parent(func):
@@ -26,8 +33,9 @@ def ensure_parent(func):
 
 
 class PublishQueue(object):
-    def __init__(self):
+    def __init__(self, createQueue=mp.Queue):
         self._queues = []  # type: List[mp.JoinableQueue]
+        self._createQueue = createQueue
         self._creator_pid = os.getpid()
 
     def __getstate__(self):
@@ -39,8 +47,9 @@ class PublishQueue(object):
         self.__dict__.update(state)
 
     @ensure_parent
-    def register(self):
-        q = mp.JoinableQueue()
+    def register(self, q=None):
+        if q is None:
+            q = self._createQueue()
         self._queues.append(q)
         return q
 
@@ -63,44 +72,263 @@ class PublishQueue(object):
         for q in self._queues:
             q.join_thread()
 
-    @ensure_parent
+
+class ProcessBackend(object):
+    """Runs filtergraph workers and outputs in processes of their own
+
+    Filtergraphs of different devices are processed in parallel on multiple cores.
+    """
+    name = 'process'
+    separateProcesses = True
+
+    def createQueue(self):
+        return mp.Queue()
+
+    def createEvent(self):
+        return mp.Event()
+
+    def start(self, target, args, daemon=False):
+        p = mp.Process(target=target, args=args, daemon=daemon)
+        p.start()
+        return p
+
+
+class _CopyingQueue(queue.Queue):
+    """Queue between threads passing copies of the items, like a multiprocessing queue
+    """
+    def put(self, item, block=True, timeout=None):
+        super().put(pickle.loads(pickle.dumps(item)), block, timeout)
+
+    def close(self):
+        pass
+
+    def join_thread(self):
+        pass
+
+
+class _WorkerThread(object):
+    """Thread with the part of the multiprocessing.Process interface used by the project
+    """
+    def __init__(self, target, args):
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=target, args=args, daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
     def join(self, timeout=None):
-        # Join without timeout
-        if timeout is None:
-            for q in self._queues:
-                q.join()
-            return
-        # Join with timeout
-        stop = time.time() + timeout
-        all_done = False
-        while not all_done and time.time() < stop:
-            time.sleep(0.001)
-            all_done = True
-            for q in self._queues:
-                if not q._unfinished_tasks._semlock._is_zero():
-                    all_done = False
-        if all_done:
-            for q in self._queues:
-                q.join()
-            return
-        raise TimeoutError
+        self._thread.join(timeout)
+
+    def terminate(self):
+        # Threads can't be killed, they exit when their queue ends
+        pass
+
+
+class ThreadBackend(object):
+    """Runs filtergraph workers and outputs as threads of the project process
+
+    Saves the memory of one interpreter with all effect modules per device on small devices.
+    Messages are copied like between processes, so workers never share effects with the project.
+    Filtergraphs don't run in parallel because of the GIL, only while numpy or an output releases it.
+    """
+    name = 'thread'
+    separateProcesses = False
+
+    def createQueue(self):
+        return _CopyingQueue()
+
+    def createEvent(self):
+        return threading.Event()
+
+    def start(self, target, args, daemon=False):
+        # Threads never keep the interpreter alive
+        return _WorkerThread(target, args)
+
+
+executionBackends = {
+    ProcessBackend.name: ProcessBackend,
+    ThreadBackend.name: ThreadBackend,
+}
+
+
+class FrameDeadlineMissed(TimeoutError):
+    def __init__(self, frameIndex, missed):
+        super().__init__("Frame {} missed by {}".format(frameIndex, ", ".join(missed)))
+        self.frameIndex = frameIndex
+        self.missed = missed
+
+
+class FrameSync(object):
+    """Synchronizes frames between the project and its worker or output processes
+
+    Every participant stores the index of its last finished frame in a shared counter and
+    releases a semaphore, so the project can block until all participants finished a frame
+    or the deadline has passed, without polling the queues.
+
+    Participants are registered in the project before their process is started and get the
+    FrameSync together with their index on start.
+    """
+    def __init__(self, maxParticipants=64):
+        self._done = mp.Semaphore(0)
+        self._frames = mp.RawArray(ctypes.c_longlong, maxParticipants)
+        self._times = mp.RawArray(ctypes.c_double, maxParticipants)
+        self._frameIndex = mp.RawValue(ctypes.c_longlong, 0)
+        self._waitIndex = mp.RawValue(ctypes.c_longlong, 0)
+        self._creator_pid = os.getpid()
+        self._participants = {}  # type: Dict[int, str]
+        self._missedFrames = {}  # type: Dict[str, int]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_participants'] = {}
+        state['_missedFrames'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @ensure_parent
+    def register(self, name):
+        index = 0
+        while index in self._participants:
+            index += 1
+        if index >= len(self._frames):
+            raise RuntimeError("Too many participants for frame sync")
+        self._frames[index] = -1
+        self._participants[index] = name
+        self._missedFrames.setdefault(name, 0)
+        return index
+
+    @ensure_parent
+    def unregister(self, index):
+        self._participants.pop(index, None)
+
+    @ensure_parent
+    def reset(self):
+        """Removes all participants, the missed frames are kept
+        """
+        self._participants = {}
+
+    @ensure_parent
+    def startFrame(self, frameIndex, pipelineDepth=0):
+        """Starts the frame, the project then waits for frame frameIndex - pipelineDepth
+        """
+        # Set before the frame index, so participants never see a newer frame with an outdated wait index
+        self._waitIndex.value = frameIndex - pipelineDepth
+        self._frameIndex.value = frameIndex
+
+    def getFrameIndex(self):
+        """Returns the index of the frame currently started by the project
+        """
+        return self._frameIndex.value
+
+    def getWaitIndex(self):
+        """Returns the oldest frame the project still waits for, older frames can be skipped
+        """
+        return self._waitIndex.value
+
+    def signal(self, index, frameIndex):
+        """Signals that the participant with the given index has finished the frame
+        """
+        self._times[index] = time.perf_counter()
+        self._frames[index] = frameIndex
+        self._done.release()
+
+    def signalReady(self, index):
+        """Signals that the participant has started and is ready for the next frame
+        """
+        self.signal(index, self.getFrameIndex())
+
+    @ensure_parent
+    def wait(self, frameIndex, timeout, indices=None):
+        """Waits until all participants finished the given frame
+
+        Raises:
+            FrameDeadlineMissed -- If some participants didn't finish the frame within timeout seconds
+        """
+        if indices is None:
+            indices = list(self._participants.keys())
+        deadline = time.perf_counter() + timeout
+        # Drop releases of frames that were already waited for, their counters are set before the release
+        while self._done.acquire(False):
+            pass
+        pending = [i for i in indices if self._frames[i] < frameIndex]
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self._done.acquire(True, remaining):
+                break
+            pending = [i for i in pending if self._frames[i] < frameIndex]
+        if pending:
+            missed = [self._participants.get(i, str(i)) for i in pending]
+            for name in missed:
+                self._missedFrames[name] = self._missedFrames.get(name, 0) + 1
+            raise FrameDeadlineMissed(frameIndex, missed)
+
+    @ensure_parent
+    def getFinishTime(self, frameIndex):
+        """Returns the time.perf_counter() at which the last participant finished the given frame
+
+        Returns None if no participant's last finished frame is frameIndex.
+        """
+        times = [self._times[i] for i in self._participants if self._frames[i] == frameIndex]
+        return max(times) if times else None
+
+    @ensure_parent
+    def getMissedFrames(self):
+        return dict(self._missedFrames)
 
 
 class UpdateMessage:
-    def __init__(self, dt, audioBuffer):
+    def __init__(self, dt, frameIndex=None):
         self.dt = dt
-        self.audioBuffer = audioBuffer
+        self.frameIndex = frameIndex
 
 
 class ReplaceFiltergraphMessage:
-    def __init__(self, deviceId, slotId, filtergraph):
-        self.filtergraph = filtergraph
+    """Replaces the filtergraph of a worker
+
+    The graph is sent as snapshot, see FilterGraph.getSnapshot(). If the worker has the graph cached,
+    only its hash is sent and snapshot is None.
+    """
+    def __init__(self, deviceId, slotId, graphHash, snapshot=None):
+        self.graphHash = graphHash
+        self.snapshot = snapshot
         self.slotId = slotId
         self.deviceId = deviceId
 
     def __str__(self):
-        return "FiltergraphMessage - deviceId: {}, slotId: {}, filtergraph: {}".format(self.deviceId, self.slotId,
-                                                                                       self.filtergraph)
+        return "FiltergraphMessage - deviceId: {}, slotId: {}, hash: {}, cached: {}".format(
+            self.deviceId, self.slotId, self.graphHash, self.snapshot is None)
+
+
+class AssignWorkerMessage:
+    def __init__(self, deviceId, slotId, graphHash, snapshot, outputDevice, syncIndex, blasThreads=None):
+        self.deviceId = deviceId
+        self.slotId = slotId
+        self.graphHash = graphHash
+        self.snapshot = snapshot
+        self.outputDevice = outputDevice
+        self.syncIndex = syncIndex
+        self.blasThreads = blasThreads
+
+    def __str__(self):
+        return "AssignWorkerMessage - deviceId: {}, slotId: {}, outputDevice: {}".format(self.deviceId, self.slotId,
+                                                                                         self.outputDevice)
+
+
+class ReleaseWorkerMessage:
+    def __str__(self):
+        return "ReleaseWorkerMessage"
+
+
+class ReplaceOutputDeviceMessage:
+    def __init__(self, deviceId, outputDevice):
+        self.deviceId = deviceId
+        self.outputDevice = outputDevice
+
+    def __str__(self):
+        return "ReplaceOutputDeviceMessage - deviceId: {}, outputDevice: {}".format(self.deviceId, self.outputDevice)
 
 
 class NodeMessage:
@@ -151,18 +379,46 @@ class ConnectionMessage:
             self.slotId, self.conUid, self.operation, self.params)
 
 
+class ParameterUpdateMessage:
+    """Latest parameter values of nodes, modulations and modulation sources, collected during a frame
+
+    Updates are tuples of (target, slotId, uid, parameters) with target 'node', 'modulation' or 'modulationSource'.
+    """
+    def __init__(self, updates):
+        self.updates = updates
+
+    def __str__(self):
+        return "ParameterUpdateMessage - updates: {}".format(self.updates)
+
+
+class TimingsMessage:
+    def __init__(self, slotId, operation, params=None):
+        self.slotId = slotId
+        self.operation = operation
+        self.params = params
+
+    def __str__(self):
+        return "TimingsMessage - slotId: {}, operation: {}, params: {}".format(self.slotId, self.operation, self.params)
+
+
 def worker_process_updateMessage(filtergraph: FilterGraph, outputDevice: audioled.devices.LEDController, slotId: int,
-                                 event_loop, message: UpdateMessage):
+                                 event_loop, message: UpdateMessage, audioRing: audioled.audio.AudioRingBuffer = None):
     dt = message.dt
-    audioBuffer = message.audioBuffer
     # print("got item {} in process {}".format(dt, os.getpid()))
 
-    # TODO: Hack to propagate audio?
-    audioled.audio.GlobalAudio.buffer = audioBuffer
+    # Read latest audio chunk from shared memory
+    if audioRing is not None:
+        audioBuffer, sequence = audioRing.readLatest()
+        if audioBuffer is not None:
+            # Worker threads of the thread backend share GlobalAudio
+            audioled.audio.GlobalAudio.setFrameAudio(audioBuffer, sequence)
 
+    traceArgs = {'frame': message.frameIndex, 'slot': slotId}
     # Update Filtergraph
-    filtergraph.update(dt, event_loop)
-    filtergraph.process()
+    with tracing.span('FilterGraph.update', traceArgs):
+        filtergraph.update(dt, event_loop)
+    with tracing.span('FilterGraph.process', traceArgs):
+        filtergraph.process()
     # Propagate to outDevice
     try:
         if filtergraph.getLEDOutput() is None:
@@ -170,9 +426,12 @@ def worker_process_updateMessage(filtergraph: FilterGraph, outputDevice: audiole
         fgBuffer = filtergraph.getLEDOutput()._outputBuffer
         if fgBuffer is None or len(fgBuffer) <= 0:
             return
-        outputDevice.show(fgBuffer[0])
+        with tracing.span('device.show', traceArgs):
+            outputDevice.show(fgBuffer[0])
     except Exception as e:
         print("Error propagating to device: {}".format(e))
+    finally:
+        tracing.flush()
 
 
 def worker_process_nodeMessage(filtergraph: FilterGraph, outputDevice: audioled.devices.LEDController, slotId: int,
@@ -183,8 +442,7 @@ def worker_process_nodeMessage(filtergraph: FilterGraph, outputDevice: audioled.
         return
     print("Process node message: {}".format(message))
     if message.operation == 'add':
-        node = filtergraph.addEffectNode(message.params)
-        node.uid = message.nodeUid
+        filtergraph.addEffectNode(message.params, uid=message.nodeUid)
     elif message.operation == 'remove':
         filtergraph.removeEffectNode(message.nodeUid)
     elif message.operation == 'update':
@@ -199,12 +457,12 @@ def worker_process_modulationMessage(filtergraph: FilterGraph, outputDevice: aud
     print("Process modulation message: {}".format(message))
     if message.operation == 'add':
         mod = message.params  # type: audioled.filtergraph.Modulation
-        newMod = filtergraph.addModulation(modSourceUid=mod.modulationSource.uid,
-                                           targetNodeUid=mod.targetNode.uid,
-                                           targetParam=mod.targetParameter,
-                                           amount=mod.amount,
-                                           inverted=mod.inverted)
-        newMod.uid = mod.uid
+        filtergraph.addModulation(modSourceUid=mod.modulationSource.uid,
+                                  targetNodeUid=mod.targetNode.uid,
+                                  targetParam=mod.targetParameter,
+                                  amount=mod.amount,
+                                  inverted=mod.inverted,
+                                  uid=mod.uid)
     elif message.operation == 'remove':
         filtergraph.removeModulation(message.modUid)
     elif message.operation == 'update':
@@ -219,8 +477,7 @@ def worker_process_modulationSourceMessage(filtergraph: FilterGraph, outputDevic
     print("Process modulation source message: {}".format(message))
     if message.operation == 'add':
         modSource = message.params
-        newModSource = filtergraph.addModulationSource(modSource)
-        newModSource.uid = modSource.uid
+        filtergraph.addModulationSource(modSource, uid=modSource.uid)
     elif message.operation == 'remove':
         filtergraph.removeModulationSource(message.modSourceUid)
     elif message.operation == 'update':
@@ -235,76 +492,307 @@ def worker_process_connectionMessage(filtergraph: FilterGraph, outputDevice: aud
     print("Process connection message: {}".format(message))
     if message.operation == 'add':
         con = message.params  # type: Dict[str, str]
-        newCon = filtergraph.addNodeConnection(con['from_node_uid'], con['from_node_channel'], con['to_node_uid'],
-                                               con['to_node_channel'])
-        newCon.uid = con['uid']
+        filtergraph.addNodeConnection(con['from_node_uid'],
+                                      con['from_node_channel'],
+                                      con['to_node_uid'],
+                                      con['to_node_channel'],
+                                      uid=con['uid'])
     elif message.operation == 'remove':
         filtergraph.removeConnection(message.conUid)
 
 
+def worker_process_parameterUpdateMessage(filtergraph: FilterGraph, outputDevice: audioled.devices.LEDController,
+                                          slotId: int, message: ParameterUpdateMessage):
+    for target, updateSlotId, uid, parameters in message.updates:
+        if updateSlotId != slotId:
+            continue
+        if target == 'node':
+            filtergraph.updateNodeParameter(uid, parameters)
+        elif target == 'modulation':
+            filtergraph.updateModulationParameter(uid, parameters)
+        elif target == 'modulationSource':
+            filtergraph.updateModulationSourceParameter(uid, parameters)
+
+
+def worker_process_timingsMessage(filtergraph: FilterGraph, deviceId: int, slotId: int, timingsQueue: mp.Queue,
+                                  message: TimingsMessage, audioRing: audioled.audio.AudioRingBuffer = None):
+    if message.operation == 'get':
+        # Every worker answers the request, so the project doesn't have to wait for the timeout
+        timings = filtergraph.getTimings() if message.slotId == slotId else None
+        if timings is not None and audioRing is not None:
+            timings['audio'] = audioRing.getStats()
+        timingsQueue.put((message.params, deviceId, timings))
+    elif message.operation == 'record' and message.slotId == slotId:
+        filtergraph.setRecordTimings(message.params)
+
+
+class FiltergraphCache(object):
+    """Least recently used filtergraphs of a worker by snapshot hash
+
+    The project keeps a copy of the cache of each worker without the graphs. Both sides apply the same
+    operations in the same order, so the project knows which graphs don't have to be sent again.
+    """
+    def __init__(self, maxSize=8):
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()
+
+    def __contains__(self, graphHash):
+        return graphHash in self._entries
+
+    def get(self, graphHash):
+        return self._entries.get(graphHash)
+
+    def put(self, graphHash, filtergraph):
+        self._entries[graphHash] = filtergraph
+        self._entries.move_to_end(graphHash)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def pop(self, graphHash):
+        """Removes a graph that was modified after it was cached
+        """
+        self._entries.pop(graphHash, None)
+
+
+def _modifiesSlot(message, slotId):
+    if isinstance(message, (NodeMessage, ModulationMessage, ModulationSourceMessage, ConnectionMessage)):
+        return message.slotId == slotId
+    if isinstance(message, ParameterUpdateMessage):
+        return any(update[1] == slotId for update in message.updates)
+    if isinstance(message, TimingsMessage):
+        return message.operation == 'record' and message.slotId == slotId
+    return False
+
+
+def _getFiltergraph(graphCache: FiltergraphCache, graphHash, snapshot):
+    """Returns the filtergraph from the snapshot or the cache, None if it isn't cached
+    """
+    if snapshot is not None:
+        filtergraph = FilterGraph.fromSnapshot(snapshot)
+    else:
+        filtergraph = graphCache.get(graphHash)
+        if filtergraph is None:
+            print("Filtergraph {} not cached".format(graphHash))
+            return None
+    graphCache.put(graphHash, filtergraph)
+    return filtergraph
+
+
+def _getVirtualOutput(device):
+    while isinstance(device, audioled.devices.PanelWrapper):
+        device = device.device
+    if isinstance(device, audioled.devices.VirtualOutput):
+        return device
+    return None
+
+
+class _WorkerState(object):
+    """Filtergraph, output device and frame state of worker(), changed by the messages it processes
+    """
+    def __init__(self, filtergraph: FilterGraph, outputDevice: audioled.devices.LEDController, deviceId: int,
+                 slotId: int, timingsQueue: mp.Queue, audioRing: audioled.audio.AudioRingBuffer, frameSync: FrameSync,
+                 syncIndex: int, graphCache: FiltergraphCache, graphHash, event_loop):
+        self.filtergraph = filtergraph
+        self.outputDevice = outputDevice
+        self.virtualOutput = _getVirtualOutput(outputDevice)
+        self.deviceId = deviceId
+        self.slotId = slotId
+        self.timingsQueue = timingsQueue
+        self.audioRing = audioRing
+        self.frameSync = frameSync
+        self.syncIndex = syncIndex
+        self.graphCache = graphCache
+        self.graphHash = graphHash
+        self.event_loop = event_loop
+        # Time of the frames skipped to catch up with the project
+        self.skippedDt = 0.
+
+
+def _worker_updateMessage(state: _WorkerState, message: UpdateMessage):
+    frameSync = state.frameSync
+    if frameSync is not None and message.frameIndex < frameSync.getWaitIndex():
+        # Missed the deadline of this frame, skip it to catch up with the project
+        state.skippedDt += message.dt
+        return
+    message.dt += state.skippedDt
+    state.skippedDt = 0.
+    if state.virtualOutput is not None:
+        state.virtualOutput.setFrameIndex(message.frameIndex)
+    try:
+        worker_process_updateMessage(state.filtergraph, state.outputDevice, state.slotId, state.event_loop, message,
+                                     state.audioRing)
+    finally:
+        if frameSync is not None:
+            frameSync.signal(state.syncIndex, message.frameIndex)
+
+
+def _worker_replaceFiltergraphMessage(state: _WorkerState, message: ReplaceFiltergraphMessage):
+    if message.deviceId != state.deviceId:
+        return
+    filtergraph = _getFiltergraph(state.graphCache, message.graphHash, message.snapshot)
+    if filtergraph is None:
+        return
+    state.filtergraph = filtergraph
+    state.graphHash = message.graphHash
+    state.slotId = message.slotId
+    filtergraph.propagateNumPixels(state.outputDevice.getNumPixels(), state.outputDevice.getNumRows())
+
+
+def _worker_replaceOutputDeviceMessage(state: _WorkerState, message: ReplaceOutputDeviceMessage):
+    if message.deviceId == state.deviceId:
+        # End of a scene transition, render to the device directly instead of the staging buffer
+        state.outputDevice = message.outputDevice
+        state.virtualOutput = _getVirtualOutput(message.outputDevice)
+
+
+def _worker_releaseWorkerMessage(state: _WorkerState, message: ReleaseWorkerMessage):
+    state.outputDevice.shutdown()
+    print("process {} released".format(os.getpid()))
+    return True
+
+
+# Message handlers of worker(), return True if the worker was released
+_workerHandlers = {
+    UpdateMessage: _worker_updateMessage,
+    ParameterUpdateMessage: lambda state, message: worker_process_parameterUpdateMessage(
+        state.filtergraph, state.outputDevice, state.slotId, message),
+    NodeMessage: lambda state, message: worker_process_nodeMessage(
+        state.filtergraph, state.outputDevice, state.slotId, message),
+    ModulationMessage: lambda state, message: worker_process_modulationMessage(
+        state.filtergraph, state.outputDevice, state.slotId, message),
+    ModulationSourceMessage: lambda state, message: worker_process_modulationSourceMessage(
+        state.filtergraph, state.outputDevice, state.slotId, message),
+    ConnectionMessage: lambda state, message: worker_process_connectionMessage(
+        state.filtergraph, state.outputDevice, state.slotId, message),
+    TimingsMessage: lambda state, message: worker_process_timingsMessage(
+        state.filtergraph, state.deviceId, state.slotId, state.timingsQueue, message, state.audioRing),
+    ReplaceFiltergraphMessage: _worker_replaceFiltergraphMessage,
+    ReplaceOutputDeviceMessage: _worker_replaceOutputDeviceMessage,
+    ReleaseWorkerMessage: _worker_releaseWorkerMessage,
+}
+
+
+def _processWorkerMessages(q: PublishQueue, state: _WorkerState):
+    """Processes the messages of worker() until the queue is closed, returns True if the worker was released
+    """
+    for message in iter(q.get, None):
+        try:
+            if _modifiesSlot(message, state.slotId):
+                # Cached graph doesn't match its hash anymore
+                state.graphCache.pop(state.graphHash)
+            handler = _workerHandlers.get(type(message))
+            if handler is None:
+                print("Message not supported: {}".format(message))
+            elif handler(state, message):
+                return True
+        except audioled.filtergraph.NodeException:
+            # TODO: Propagate NodeException to project
+            print("Continuing on NodeException")
+    return False
+
+
 def worker(q: PublishQueue, filtergraph: FilterGraph, outputDevice: audioled.devices.LEDController, deviceId: int,
-           slotId: int):
+           slotId: int, timingsQueue: mp.Queue = None, tracer: tracing.Tracer = None,
+           audioRing: audioled.audio.AudioRingBuffer = None, frameSync: FrameSync = None, syncIndex: int = None,
+           graphCache: FiltergraphCache = None, graphHash=None):
     """Worker process for specific filtergraph for outputDevice
     
+    Returns True if the worker was released by ReleaseWorkerMessage and can be reused, False if it has to exit.
+
     Arguments:
         q {PublishQueue} -- [description]
         filtergraph {FilterGraph} -- [description]
         outputDevice {audioled.devices.LEDController} -- [description]
         slotId {int} -- [description]
+        audioRing {AudioRingBuffer} -- Shared memory audio chunks, None if no audio device is used
+        frameSync {FrameSync} -- Frame synchronization with the project, signalled with syncIndex
+        graphCache {FiltergraphCache} -- Cache of the worker, filtergraph is stored there with graphHash
     """
+    if graphCache is None:
+        graphCache = FiltergraphCache()
     try:
         print("process {} start".format(os.getpid()))
+        if tracer is not None:
+            tracing.setTracer(tracer)
+            tracer.setProcessName("worker device {} slot {}".format(deviceId, slotId))
+        if audioRing is not None:
+            # Not inherited with the spawn start method, lossless audio inputs read from it
+            audioled.audio.GlobalAudio.ringBuffer = audioRing
         event_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(event_loop)
         filtergraph.propagateNumPixels(outputDevice.getNumPixels(), outputDevice.getNumRows())
-        for message in iter(q.get, None):
-            try:
-                if isinstance(message, UpdateMessage):
-                    worker_process_updateMessage(filtergraph, outputDevice, slotId, event_loop, message)
-                elif isinstance(message, NodeMessage):
-                    worker_process_nodeMessage(filtergraph, outputDevice, slotId, message)
-                elif isinstance(message, ModulationMessage):
-                    worker_process_modulationMessage(filtergraph, outputDevice, slotId, message)
-                elif isinstance(message, ModulationSourceMessage):
-                    worker_process_modulationSourceMessage(filtergraph, outputDevice, slotId, message)
-                elif isinstance(message, ConnectionMessage):
-                    worker_process_connectionMessage(filtergraph, outputDevice, slotId, message)
-                elif isinstance(message, ReplaceFiltergraphMessage):
-                    if message.deviceId == deviceId:
-                        filtergraph = message.filtergraph
-                        slotId = message.slotId
-                        filtergraph.propagateNumPixels(outputDevice.getNumPixels(), outputDevice.getNumRows())
-                else:
-                    print("Message not supported: {}".format(message))
-            except audioled.filtergraph.NodeException:
-                # TODO: Propagate NodeException to project
-                print("Continuing on NodeException")
-            finally:
-                # print("{} done".format(os.getpid()))
-                # q.task_done()
-                # TODO: Investigate the task_done() called too many times error further
-                # Quick fix seems to be:
-                with q._cond:
-                    if not q._unfinished_tasks.acquire(True):
-                        raise ValueError('task_done() called too many times')
-                    if q._unfinished_tasks._semlock._is_zero():
-                        q._cond.notify_all()
-        outputDevice.shutdown()
+        state = _WorkerState(filtergraph, outputDevice, deviceId, slotId, timingsQueue, audioRing, frameSync, syncIndex,
+                             graphCache, graphHash, event_loop)
+        if frameSync is not None:
+            frameSync.signalReady(syncIndex)
+        if _processWorkerMessages(q, state):
+            return True
+        state.outputDevice.shutdown()
         print("process {} exit".format(os.getpid()))
     except Exception as e:
         traceback.print_exc()
         print("process {} exited due to: {}".format(os.getpid(), e))
     except:
         print("process interrupted")
+    return False
+
+
+# Modules with effects, imported by pool workers before they signal readiness
+_effectModules = [
+    'audioled.audio', 'audioled.audioreactive', 'audioled.colors', 'audioled.effects', 'audioled.generative',
+    'audioled.input', 'audioled.modulation', 'audioled.panelize'
+]
 
 
-def output(q, outputDevice: audioled.devices.LEDController, virtualDevice: audioled.devices.VirtualOutput):
+def poolWorker(q, ready, timingsQueue: mp.Queue = None, tracer: tracing.Tracer = None,
+               audioRing: audioled.audio.AudioRingBuffer = None, frameSync: FrameSync = None):
+    """Pre-spawned worker process of the WorkerPool
+
+    Imports all effect modules and signals readiness with the ready event.
+    Filtergraph and output device are then handed over by AssignWorkerMessage and processed by worker()
+    until the worker is released again.
+    """
+    print("pool process {} start".format(os.getpid()))
+    for moduleName in _effectModules:
+        importlib.import_module(moduleName)
+    # Filtergraphs of previous assignments, kept across assignments
+    graphCache = FiltergraphCache()
+    ready.set()
+    for message in iter(q.get, None):
+        if isinstance(message, AssignWorkerMessage):
+            if message.blasThreads is not None:
+                cpubudget.limitBlasThreads(message.blasThreads)
+            filtergraph = _getFiltergraph(graphCache, message.graphHash, message.snapshot)
+            if filtergraph is None:
+                filtergraph = FilterGraph()
+            if not worker(q, filtergraph, message.outputDevice, message.deviceId, message.slotId, timingsQueue, tracer,
+                          audioRing, frameSync, message.syncIndex, graphCache, message.graphHash):
+                break
+        else:
+            print("Message not supported by idle worker: {}".format(message))
+    print("pool process {} exit".format(os.getpid()))
+
+
+def output(q, outputDevice: audioled.devices.LEDController, virtualDevice: audioled.devices.VirtualOutput,
+           tracer: tracing.Tracer = None, frameSync: FrameSync = None, syncIndex: int = None, blasThreads: int = None):
     try:
         print("output process {} start".format(os.getpid()))
+        if blasThreads is not None:
+            cpubudget.limitBlasThreads(blasThreads)
+        if tracer is not None:
+            tracing.setTracer(tracer)
+            tracer.setProcessName("output {}".format(outputDevice))
+        if frameSync is not None:
+            frameSync.signalReady(syncIndex)
         for message in iter(q.get, None):
-            npArray = np.ctypeslib.as_array(virtualDevice._shared_array.get_obj()).reshape(3, -1)
-            outputDevice.show(npArray.reshape(3, -1, order='C'))
-            q.task_done()
+            if frameSync is not None and message < frameSync.getFrameIndex():
+                # A newer frame is already waiting
+                continue
+            with tracing.span('output.show', {'frame': message}):
+                outputDevice.show(virtualDevice.getFramePixels(message))
+            tracing.flush()
+            if frameSync is not None:
+                frameSync.signal(syncIndex, message)
         outputDevice.shutdown()
         print("output process {} exit".format(os.getpid()))
     except Exception as e:
@@ -314,7 +802,184 @@ def output(q, outputDevice: audioled.devices.LEDController, virtualDevice: audio
         print("process interrupted")
 
 
+class PoolWorker(object):
+    def __init__(self, process: mp.Process, queue: mp.Queue, ready: mp.Event, audioRing):
+        self.process = process
+        self.queue = queue
+        self.ready = ready
+        self.audioRing = audioRing
+        self.syncIndex = None
+        # Copy of the graph cache of the worker, without the graphs
+        self.graphCache = FiltergraphCache()
+        self.slotId = None
+        self.graphHash = None
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+
+class WorkerPool(object):
+    """Pool of pre-spawned worker processes
+
+    Workers are started on the first acquire. From then on numSpareWorkers workers are kept ready ahead of time,
+    so activating a scene or changing devices only costs handing over the filtergraph.
+    Released workers are kept for the next assignment up to numSpareWorkers, further ones are stopped.
+    Shared state like the frame sync is passed on start, so it has to live as long as the pool.
+    Workers are started with the given execution backend, as processes by default.
+    """
+    def __init__(self, timingsQueue: mp.Queue, tracer: tracing.Tracer, frameSync: FrameSync, numSpareWorkers=1,
+                 backend=None):
+        self.numSpareWorkers = numSpareWorkers
+        self._timingsQueue = timingsQueue
+        self._tracer = tracer
+        self._frameSync = frameSync
+        self._backend = backend if backend is not None else ProcessBackend()
+        self._idle = []  # type: List[PoolWorker]
+        # Spare workers are only kept once the pool is in use
+        self._inUse = False
+
+    def _spawn(self):
+        audioRing = audioled.audio.GlobalAudio.ringBuffer
+        q = self._backend.createQueue()
+        ready = self._backend.createEvent()
+        # Worker threads record to the tracer of the project process
+        tracer = self._tracer if self._backend.separateProcesses else None
+        p = self._backend.start(poolWorker,
+                                args=(q, ready, self._timingsQueue, tracer, audioRing, self._frameSync),
+                                daemon=True)
+        return PoolWorker(p, q, ready, audioRing)
+
+    def acquire(self, timeout=1.0, retries=5):
+        """Returns a ready worker, idle workers are reused, new ones are spawned if none is left
+        """
+        self._inUse = True
+        for _ in range(retries):
+            worker = self._idle.pop(0) if self._idle else self._spawn()
+            if worker.audioRing is not audioled.audio.GlobalAudio.ringBuffer or not worker.is_alive():
+                # Audio device changed since the worker was spawned
+                self.discard(worker)
+                continue
+            if not worker.ready.wait(timeout):
+                print("Worker process {} didn't start in time!".format(worker.process.pid))
+                self.discard(worker)
+                continue
+            return worker
+        raise RuntimeError("Unable to start worker process")
+
+    def release(self, worker: PoolWorker):
+        if len(self._idle) >= self.numSpareWorkers:
+            self.discard(worker)
+            return
+        worker.queue.put(ReleaseWorkerMessage())
+        if worker.is_alive():
+            self._idle.append(worker)
+
+    def discard(self, worker: PoolWorker):
+        worker.queue.put(None)
+        worker.process.join(0.1)
+        if worker.is_alive():
+            worker.process.terminate()
+
+    def prespawn(self):
+        """Starts workers until numSpareWorkers idle workers are available, if the pool is in use
+        """
+        if not self._inUse:
+            return
+        self._idle = [worker for worker in self._idle if worker.is_alive()]
+        while len(self._idle) < self.numSpareWorkers:
+            self._idle.append(self._spawn())
+
+    def shutdown(self):
+        for worker in self._idle:
+            worker.queue.put(None)
+        for worker in self._idle:
+            worker.process.join(1)
+        self._idle = []
+        self._inUse = False
+
+
+# Blend curves of scene transitions, mapping the progress in [0, 1] to the weight of the incoming scene
+transitionCurves = {
+    'linear': lambda x: x,
+    'easeIn': lambda x: x * x,
+    'easeOut': lambda x: 1. - (1. - x) * (1. - x),
+    'smoothstep': lambda x: x * x * (3. - 2. * x),
+}
+
+
+class DeviceTransition(object):
+    """Outgoing and incoming worker of an output device during a scene transition
+
+    The incoming worker renders to a staging output with its own shared pixel array,
+    which is blended into the pixels of the output device.
+    """
+    def __init__(self, outgoing: PoolWorker, incoming: PoolWorker, device, stagingDevice):
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.device = device
+        self.stagingDevice = stagingDevice
+
+    def blend(self, frameIndex, weight):
+        virtualOutput = _getVirtualOutput(self.device)
+        pixels = virtualOutput.getFramePixels(frameIndex)
+        stagingPixels = _getVirtualOutput(self.stagingDevice).getFramePixels(frameIndex)
+        region = slice(virtualOutput.start_index, virtualOutput.start_index + virtualOutput.num_pixels)
+        pixels[:, region] = pixels[:, region] * (1. - weight) + stagingPixels[:, region] * weight
+
+
+class SceneTransition(object):
+    """Crossfade from the filtergraphs of the active scene to the ones of the next scene
+
+    Both scenes are rendered by their own worker processes for the duration of the transition.
+    The blend weight of each frame is determined when its update is sent.
+    """
+    def __init__(self, duration, curve, startFrame):
+        if curve not in transitionCurves:
+            raise ValueError("Unknown transition curve {}".format(curve))
+        self.duration = duration
+        self.curve = curve
+        self.startFrame = startFrame
+        self.finishFrame = None
+        self.elapsed = 0.
+        self.devices = {}  # type: Dict[int, DeviceTransition]
+        self.blendTimings = audioled.filtergraph.LatencyHistogram()
+        self._weights = {}  # type: Dict[int, float]
+
+    def advance(self, dt, frameIndex):
+        """Advances the transition by dt for the given frame, returns True if the transition is complete
+        """
+        self.elapsed += dt
+        if self.elapsed >= self.duration:
+            return True
+        self._weights[frameIndex] = transitionCurves[self.curve](self.elapsed / self.duration)
+        return False
+
+    def getWeight(self, frameIndex):
+        """Returns the weight of the incoming scene for the given frame, None if the frame isn't blended
+        """
+        for index in [i for i in self._weights if i < frameIndex]:
+            self._weights.pop(index)
+        return self._weights.pop(frameIndex, None)
+
+    def getProgress(self):
+        return min(1., self.elapsed / self.duration)
+
+    def getStats(self):
+        return {
+            'duration': self.duration,
+            'curve': self.curve,
+            'progress': self.getProgress(),
+            'devices': sorted(self.devices.keys()),
+            'blend': self.blendTimings.getStats(),
+        }
+
+
 class Project(Updateable):
+    # Execution backend of projects, see executionBackends
+    defaultBackend = ProcessBackend.name
+    # Arguments of cpubudget.CpuBudget, applied when a project is loaded or activated again
+    defaultCpuBudget = {}
+
     def __init__(self, name='Empty project', description='', device=None):
         self.slots = [None for i in range(127)]
         self.activeSceneId = 0
@@ -334,15 +999,43 @@ class Project(Updateable):
             self.activeSceneId
         except AttributeError:
             self.activeSceneId = self.activeSlotId
+        try:
+            self.transitionDuration
+        except AttributeError:
+            self.transitionDuration = 0.
+        try:
+            self.transitionCurve
+        except AttributeError:
+            self.transitionCurve = 'linear'
         self._previewDevice = None  # type: audioled.devices.LEDController
         self._previewDeviceIndex = 0
         self._contentRoot = None
         self._devices = []
         self._filterGraphForDeviceIndex = {}
         self._filtergraphProcesses = {}
+        self._workerSlots = {}
+        self._workerDevices = {}
         self._outputProcesses = {}
-        self._publishQueue = PublishQueue()
-        self._showQueue = PublishQueue()
+        self._backend = executionBackends[Project.defaultBackend]()
+        self._publishQueue = PublishQueue(self._backend.createQueue)
+        self._showQueue = PublishQueue(self._backend.createQueue)
+        self._timingsQueue = self._backend.createQueue()
+        self._tracer = tracing.Tracer()
+        self._tracer.setProcessName("project")
+        tracing.setTracer(self._tracer)
+        self._frameIndex = 0
+        self._frameSync = FrameSync()
+        self._showSync = FrameSync()
+        self._workerPool = WorkerPool(self._timingsQueue, self._tracer, self._frameSync, backend=self._backend)
+        self._cpuBudget = cpubudget.CpuBudget(**Project.defaultCpuBudget)
+        self._frameDeadline = 0.1
+        self._pipelineDepth = 0
+        self._frameStartTimes = {}  # type: Dict[int, float]
+        self._frameLatency = audioled.filtergraph.LatencyHistogram()
+        self._pendingParameterUpdates = {}
+        self._parameterLock = threading.Lock()
+        self._transition = None  # type: SceneTransition
+        self._lastTransition = None  # type: SceneTransition
         self._lock = mp.Lock()
         self._processingEnabled = True
 
@@ -377,6 +1070,17 @@ class Project(Updateable):
             print("Active scene {}".format(self.activeSceneId))
             self.activateScene(self.activeSceneId)
 
+    def deactivate(self):
+        """Stops processing and all workers, e.g. when another project is activated
+
+        The devices are reset, so the next setDevice activates the scene again
+        with the current defaultCpuBudget.
+        """
+        self.stopProcessing()
+        self._workerPool.shutdown()
+        self._devices = []
+        self._cpuBudget = cpubudget.CpuBudget(**Project.defaultCpuBudget)
+
     def setDevice(self, device: audioled.devices.MultiOutputWrapper):
         print("setting device")
         if not isinstance(device, audioled.devices.MultiOutputWrapper):
@@ -402,19 +1106,37 @@ class Project(Updateable):
                 print("Skipping update, couldn't acquire lock")
                 return
             try:
-                self._sendUpdateCommand(dt)
-                self._updatePreviewDevice(dt, event_loop)
-                # Wait for previous show command done
-                if self._showQueue is not None:
-                    self._showQueue.join(1)
-                # Wait for all updates
-                if self._publishQueue is not None:
-                    self._publishQueue.join(1)
-                # Send show command and return
-                self._sendShowCommand()
-
-            except TimeoutError:
-                print("Update timeout. Forcing reset")
+                self._frameIndex += 1
+                # Frame to be shown, in pipelined mode workers render ahead of the output
+                showIndex = self._frameIndex - self._pipelineDepth
+                traceArgs = {'frame': self._frameIndex}
+                with tracing.span('Project.update', traceArgs):
+                    # Pixel bank of this frame has to be transmitted before it is rendered again
+                    with tracing.span('wait for output bank', traceArgs):
+                        self._waitForShow(self._frameIndex - audioled.devices.NUM_PIXEL_BANKS)
+                    self._frameSync.startFrame(self._frameIndex, self._pipelineDepth)
+                    self._advanceTransition(dt)
+                    self._sendParameterUpdates()
+                    with tracing.span('sendUpdateCommand', traceArgs):
+                        self._sendUpdateCommand(dt)
+                    self._updatePreviewDevice(dt, event_loop)
+                    # Wait for previous show command done
+                    with tracing.span('wait for output', traceArgs):
+                        self._waitForShow(showIndex - 1)
+                    # Outgoing workers of a finished transition don't render this frame
+                    self._endTransition(showIndex)
+                    # Wait for all updates of the frame to be shown
+                    with tracing.span('wait for workers', traceArgs):
+                        self._waitForFrame(self._frameSync, showIndex)
+                    self._blendTransition(showIndex)
+                    # Send show command and return
+                    if showIndex > self._showSync.getFrameIndex():
+                        self._sendShowCommand(showIndex)
+                if self._tracer.isEnabled():
+                    self._tracer.collect()
+
+            except FrameDeadlineMissed as e:
+                print("{}, process died. Forcing reset".format(e))
                 self.stopProcessing()
                 if self.activeSceneId is not None:
                     self.activateScene(self.activeSceneId)
@@ -429,18 +1151,144 @@ class Project(Updateable):
         """
         self._processPreviewDevice()
 
+    def _waitForFrame(self, frameSync: FrameSync, frameIndex):
+        """Waits until the processes of frameSync finished the frame
+
+        Processes missing the deadline are reported and skipped, they catch up by dropping frames.
+        FrameDeadlineMissed is only raised if a process died.
+        """
+        try:
+            frameSync.wait(frameIndex, self._frameDeadline)
+        except FrameDeadlineMissed as e:
+            processes = list(self._filtergraphProcesses.values()) + list(self._outputProcesses.values())
+            if not all(p.is_alive() for p in processes):
+                raise
+            print("{}, continuing without it".format(e))
+
+    def _waitForShow(self, frameIndex):
+        """Waits until the output processes showed the given frame, or the last frame sent to them
+
+        The time from sending the update of the frame until it was shown is recorded as frame latency.
+        """
+        frameIndex = min(frameIndex, self._showSync.getFrameIndex())
+        self._waitForFrame(self._showSync, frameIndex)
+        start = self._frameStartTimes.pop(frameIndex, None)
+        if start is None:
+            return
+        for index in [i for i in self._frameStartTimes if i < frameIndex]:
+            self._frameStartTimes.pop(index)
+        end = self._showSync.getFinishTime(frameIndex)
+        if end is not None:
+            self._frameLatency.record(end - start)
+
+    def setPipelineDepth(self, depth):
+        """Sets the number of frames workers render ahead of the output processes
+
+        With depth 0, rendering waits for all workers before the frame is shown.
+        With depth 1, frame N is rendered while frame N - 1 is transmitted, which adds one frame of latency.
+        """
+        if depth < 0 or depth >= audioled.devices.NUM_PIXEL_BANKS:
+            raise ValueError("Pipeline depth has to be between 0 and {}".format(audioled.devices.NUM_PIXEL_BANKS - 1))
+        self._lock.acquire()
+        try:
+            self._pipelineDepth = depth
+            self._frameLatency.reset()
+        finally:
+            self._lock.release()
+
+    def getPipelineDepth(self):
+        return self._pipelineDepth
+
+    def getFrameSyncStats(self):
+        """Returns the missed frame deadlines per worker and output process and the latency from update to show
+        """
+        return {
+            'frame': self._frameIndex,
+            'deadline': self._frameDeadline,
+            'pipelineDepth': self._pipelineDepth,
+            'backend': self._backend.name,
+            'latency': self._frameLatency.getStats(),
+            'workers': self._frameSync.getMissedFrames(),
+            'outputs': self._showSync.getMissedFrames(),
+            'transition': self._getTransitionStats(),
+        }
+
+    def _getTransitionStats(self):
+        transition = self._transition if self._transition is not None else self._lastTransition
+        if transition is None:
+            return None
+        stats = transition.getStats()
+        stats['active'] = transition is self._transition
+        return stats
+
+    def setTransition(self, duration, curve='linear'):
+        """Sets the default transition of activateScene
+
+        Arguments:
+            duration {float} -- Duration of the crossfade in seconds, 0 switches scenes without transition
+            curve {str} -- Blend curve, one of transitionCurves
+        """
+        if duration < 0:
+            raise ValueError("Transition duration has to be positive")
+        if curve not in transitionCurves:
+            raise ValueError("Unknown transition curve {}".format(curve))
+        self.transitionDuration = duration
+        self.transitionCurve = curve
+
+    def setCpuBudget(self, workerCores=None, outputCores=None, blasThreads=1, outputNiceness=None):
+        """Sets the CPU cores, BLAS threads and output priority of the worker and output processes
+
+        See cpubudget.CpuBudget for the defaults. Processing is restarted to apply the budget.
+        """
+        cpuBudget = cpubudget.CpuBudget(workerCores, outputCores, blasThreads, outputNiceness)
+        self.stopProcessing()
+        self._cpuBudget = cpuBudget
+        if self.activeSceneId is not None:
+            self.activateScene(self.activeSceneId)
+
+    def setBackend(self, name):
+        """Sets the execution backend of the workers and outputs, one of executionBackends
+
+        'process' runs every filtergraph and output in a process of its own, 'thread' runs them as threads
+        of the project process to save memory. Processing is restarted with new workers.
+        """
+        if name not in executionBackends:
+            raise ValueError("Unknown execution backend {}".format(name))
+        if name == self._backend.name:
+            return
+        self.stopProcessing()
+        self._workerPool.shutdown()
+        self._backend = executionBackends[name]()
+        self._timingsQueue = self._backend.createQueue()
+        self._workerPool = WorkerPool(self._timingsQueue, self._tracer, self._frameSync, backend=self._backend)
+        if self.activeSceneId is not None:
+            self.activateScene(self.activeSceneId)
+
+    def getBackend(self):
+        return self._backend.name
+
+    def getCpuLayout(self):
+        """Returns the CPU budget and the cores and niceness of the worker and output processes by pid
+        """
+        return self._cpuBudget.getLayout()
+
     def setFiltergraphForSlot(self, slotId, filterGraph):
         print("Set {} for slot {}".format(filterGraph, slotId))
         if isinstance(filterGraph, FilterGraph):
             filterGraph._contentRoot = self._contentRoot
             self.slots[slotId] = filterGraph
 
-    def activateScene(self, sceneId):
+    def activateScene(self, sceneId, transitionDuration=None, transitionCurve=None):
         """Activates a scene
 
         Scene: Project Slot per Output Device
+
+        Devices changing their slot crossfade from the previous scene for transitionDuration seconds,
+        both filtergraphs are rendered in parallel by separate worker processes meanwhile.
+        Without transitionDuration and transitionCurve, the defaults set by setTransition are used.
         """
         print("activate scene {}".format(sceneId))
+        transitionDuration, transitionCurve = self._getTransitionSettings(transitionDuration, transitionCurve)
 
         # TODO: Make configurable
         self._previewDeviceIndex = None
@@ -451,45 +1299,82 @@ class Project(Updateable):
         try:
             # Create new publish queue
             if self._publishQueue is None:
-                self._publishQueue = PublishQueue()
+                self._publishQueue = PublishQueue(self._backend.createQueue)
             # Create new show queue
             if self._showQueue is None:
-                self._showQueue = PublishQueue()
+                self._showQueue = PublishQueue(self._backend.createQueue)
+            # Complete a running transition before starting the next one
+            self._finishTransition()
+            transition = None
+            if transitionDuration > 0:
+                transition = SceneTransition(transitionDuration, transitionCurve, self._frameIndex + 1)
 
             # Instanciate new scene
-            dIdx = 0
-            for device in self._devices:
-                # Get slot Id associated with this device
-                try:
-                    slotId = self.outputSlotMatrix[str(dIdx)][str(sceneId)]
-                except Exception:
-                    # Backwards compatibility: Init with slotId = sceneId
-                    if str(dIdx) not in self.outputSlotMatrix:
-                        self.outputSlotMatrix[str(dIdx)] = {}
-                    if sceneId not in self.outputSlotMatrix[str(dIdx)]:
-                        self.outputSlotMatrix[str(dIdx)][str(sceneId)] = sceneId
-                    slotId = sceneId
-
+            for dIdx, device in enumerate(self._devices):
+                slotId = self._getSceneSlotId(dIdx, sceneId)
                 # Get filtergraph
                 filterGraph = self.getSlot(slotId)
-
                 if dIdx == self._previewDeviceIndex:
-                    dIdx += 1
                     continue
-
-                self._createOrUpdateProcess(dIdx, device, slotId, filterGraph)
-                dIdx += 1
+                self._activateDevice(transition, dIdx, device, slotId, filterGraph)
+            if transition is not None and transition.devices:
+                self._transition = transition
+            # Keep a spare worker for the next activation
+            self._workerPool.prespawn()
         finally:
             self._processingEnabled = True
             print("activate scene - releasing lock")
             self._lock.release()
 
+    def _getTransitionSettings(self, transitionDuration, transitionCurve):
+        """Returns transition duration and curve, the defaults set by setTransition for None
+        """
+        if transitionDuration is None:
+            transitionDuration = self.transitionDuration
+        if transitionCurve is None:
+            transitionCurve = self.transitionCurve
+        if transitionCurve not in transitionCurves:
+            raise ValueError("Unknown transition curve {}".format(transitionCurve))
+        return transitionDuration, transitionCurve
+
+    def _getSceneSlotId(self, dIdx, sceneId):
+        """Returns the slot of the device in the scene
+        """
+        try:
+            return self.outputSlotMatrix[str(dIdx)][str(sceneId)]
+        except Exception:
+            # Backwards compatibility: Init with slotId = sceneId
+            if str(dIdx) not in self.outputSlotMatrix:
+                self.outputSlotMatrix[str(dIdx)] = {}
+            if sceneId not in self.outputSlotMatrix[str(dIdx)]:
+                self.outputSlotMatrix[str(dIdx)][str(sceneId)] = sceneId
+            return sceneId
+
+    def _activateDevice(self, transition: SceneTransition, dIdx, device, slotId, filterGraph):
+        """Renders the filtergraph to the device, crossfading from its previous slot if a transition is given
+        """
+        if (transition is not None and dIdx in self._filtergraphProcesses and self._workerSlots.get(dIdx) != slotId
+                and self._startDeviceTransition(transition, dIdx, slotId, filterGraph)):
+            return
+        self._createOrUpdateProcess(dIdx, device, slotId, filterGraph)
+
     def _createOrUpdateProcess(self, dIdx, device, slotId, filterGraph):
         if dIdx in self._filtergraphProcesses:
             # Send command
             self._sendReplaceFiltergraphCommand(dIdx, slotId, filterGraph)
+            self._workerSlots[dIdx] = slotId
             return
-        # Create device
+        outputDevice, virtualDevice, fgDevice = self._createWorkerDevice(device)
+        self._assignWorker(dIdx, slotId, filterGraph, fgDevice)
+        # Start output process
+        if outputDevice is not None:
+            self._startOutputProcess(dIdx, outputDevice, virtualDevice)
+
+    def _createWorkerDevice(self, device):
+        """Returns the output device without output process yet, the virtual output and the device of the worker
+
+        The worker renders into the shared pixels of the virtual output, the output process shows them on the device.
+        """
         outputDevice = None
         virtualDevice = None
         fgDevice = None
@@ -500,7 +1385,6 @@ class Project(Updateable):
             fgDevice = device
             if realDevice not in self._outputProcesses:
                 outputDevice = realDevice
-            pass
         elif isinstance(device, audioled.devices.PanelWrapper):
             if isinstance(device.device, audioled.devices.VirtualOutput):
                 fgDevice = device  # PanelWrapper
@@ -510,90 +1394,196 @@ class Project(Updateable):
                     outputDevice = realDevice
             else:
                 oldPanelWrapper = device
-                
+
                 # Construct virtual output, TODO: Make sure device is realDevice...
                 realDevice = oldPanelWrapper.device
 
                 lock = mp.Lock()
-                array = mp.Array(ctypes.c_uint8, 3 * device.getNumPixels(), lock=lock)
+                array = audioled.devices.createSharedPixelArray(realDevice.getNumPixels())
                 virtualDevice = audioled.devices.VirtualOutput(device=realDevice,
-                                                        num_pixels=realDevice.getNumPixels(),
-                                                        shared_array=array,
-                                                        shared_lock=lock,
-                                                        num_rows=realDevice.getNumRows(),
-                                                        start_index=0)
+                                                               num_pixels=realDevice.getNumPixels(),
+                                                               shared_array=array,
+                                                               shared_lock=lock,
+                                                               num_rows=realDevice.getNumRows(),
+                                                               start_index=0)
 
                 oldPanelWrapper.setDevice(virtualDevice)
                 fgDevice = oldPanelWrapper
-
-            
         else:
             # New virtual output
             outputDevice = device
             lock = mp.Lock()
-            array = mp.Array(ctypes.c_uint8, 3 * device.getNumPixels(), lock=lock)
+            array = audioled.devices.createSharedPixelArray(device.getNumPixels())
             virtualDevice = audioled.devices.VirtualOutput(device=device,
-                                                    num_pixels=device.getNumPixels(),
-                                                    shared_array=array,
-                                                    shared_lock=lock,
-                                                    num_rows=device.getNumRows(),
-                                                    start_index=0)
+                                                           num_pixels=device.getNumPixels(),
+                                                           shared_array=array,
+                                                           shared_lock=lock,
+                                                           num_rows=device.getNumRows(),
+                                                           start_index=0)
             fgDevice = virtualDevice
-            realDevice =  device
+        return outputDevice, virtualDevice, fgDevice
 
-        # Start filtergraph process
+    def _assignWorker(self, dIdx, slotId, filterGraph, fgDevice):
+        """Hands over the filtergraph and the device to a worker process
+        """
         successful = False
         while not successful:
-            q = self._publishQueue.register()
-            p = mp.Process(target=worker, args=(q, filterGraph, fgDevice, dIdx, slotId))
-            p.start()
-            # Process sometimes doesn't start...
-            q.put(123)
-            time.sleep(0.1)
-            if not q._unfinished_tasks._semlock._is_zero():
+            poolWorker = self._workerPool.acquire()
+            syncIndex = self._frameSync.register("device {} slot {}".format(dIdx, slotId))
+            graphHash, snapshot = self._getGraphForWorker(poolWorker, slotId, filterGraph)
+            poolWorker.queue.put(
+                AssignWorkerMessage(dIdx, slotId, graphHash, snapshot, fgDevice, syncIndex, self._cpuBudget.blasThreads))
+            self._publishQueue.register(poolWorker.queue)
+            try:
+                self._frameSync.wait(self._frameSync.getFrameIndex(), 1.0, [syncIndex])
+                successful = True
+            except FrameDeadlineMissed:
                 print("Process didn't respond in time!")
-                self._publishQueue.unregister(q)
+                self._publishQueue.unregister(poolWorker.queue)
+                self._frameSync.unregister(syncIndex)
+                self._workerPool.discard(poolWorker)
+        poolWorker.syncIndex = syncIndex
+        if self._backend.separateProcesses:
+            # Threads share the cores of the project process
+            self._cpuBudget.placeWorker(poolWorker.process.pid, dIdx)
+        self._filtergraphProcesses[dIdx] = poolWorker
+        self._workerSlots[dIdx] = slotId
+        self._workerDevices[dIdx] = fgDevice
+        print('Assigned process {} to device {} with device {}'.format(poolWorker.process.pid, dIdx, fgDevice))
+
+    def _startOutputProcess(self, dIdx, outputDevice, virtualDevice):
+        """Starts the process showing the pixels of the virtual output on the output device
+        """
+        outSuccessful = False
+        while not outSuccessful:
+            q = self._showQueue.register()
+            syncIndex = self._showSync.register("output {}".format(dIdx))
+            tracer = self._tracer if self._backend.separateProcesses else None
+            p = self._backend.start(output,
+                                    args=(q, outputDevice, virtualDevice, tracer, self._showSync, syncIndex,
+                                          self._cpuBudget.blasThreads))
+            if self._backend.separateProcesses:
+                self._cpuBudget.placeOutput(p.pid, dIdx)
+            # Make sure process starts
+            try:
+                self._showSync.wait(self._showSync.getFrameIndex(), 1.0, [syncIndex])
+                outSuccessful = True
+            except FrameDeadlineMissed:
+                print("Output process didn't respond in time!")
+                self._showQueue.unregister(q)
+                self._showSync.unregister(syncIndex)
                 p.join(0.1)
                 if p.is_alive():
                     p.terminate()
-            else:
-                successful = True
-        self._filtergraphProcesses[dIdx] = p
-        print('Started process for device {} with device {}'.format(dIdx, fgDevice))
+        self._outputProcesses[outputDevice] = p
+        print("Started output process for device {}".format(outputDevice))
 
-        # Start output process
-        if outputDevice is not None:
-            outSuccessful = False
-            while not outSuccessful:
-                q = self._showQueue.register()
-                p = mp.Process(target=output, args=(q, outputDevice, virtualDevice))
-                p.start()
-                # Make sure process starts
-                q.put("test")
-                time.sleep(0.1)
-                if not q._unfinished_tasks._semlock._is_zero():
-                    print("Output process didn't respond in time!")
-                    self._showQueue.unregister(p)
-                    p.join(0.1)
-                    if p.is_alive():
-                        p.terminate()
-                else:
-                    outSuccessful = True
-                    q.put("first")
-            self._outputProcesses[outputDevice] = p
-            print("Started output process for device {}".format(outputDevice))
+    def _startDeviceTransition(self, transition: SceneTransition, dIdx, slotId, filterGraph):
+        """Starts a worker rendering the filtergraph of the next scene to a staging copy of the device
+
+        Returns False if no worker could be started, the device then switches without transition.
+        """
+        device = self._workerDevices[dIdx]
+        virtualOutput = _getVirtualOutput(device)
+        stagingDevice = copy.copy(virtualOutput)
+        stagingDevice._shared_array = audioled.devices.createSharedPixelArray(virtualOutput.device.getNumPixels())
+        if device is not virtualOutput:
+            # PanelWrapper
+            panelWrapper = copy.copy(device)
+            panelWrapper.setDevice(stagingDevice)
+            stagingDevice = panelWrapper
+        incoming = self._workerPool.acquire()
+        incoming.syncIndex = self._frameSync.register("device {} slot {}".format(dIdx, slotId))
+        graphHash, snapshot = self._getGraphForWorker(incoming, slotId, filterGraph)
+        incoming.queue.put(
+            AssignWorkerMessage(dIdx, slotId, graphHash, snapshot, stagingDevice, incoming.syncIndex,
+                                self._cpuBudget.blasThreads))
+        try:
+            self._frameSync.wait(self._frameSync.getFrameIndex(), 1.0, [incoming.syncIndex])
+        except FrameDeadlineMissed:
+            print("Transition process didn't respond in time!")
+            self._frameSync.unregister(incoming.syncIndex)
+            self._workerPool.discard(incoming)
+            return False
+        # Rendered in parallel to the outgoing worker, on the next worker core
+        if self._backend.separateProcesses:
+            self._cpuBudget.placeWorker(incoming.process.pid, dIdx)
+        self._publishQueue.register(incoming.queue)
+        transition.devices[dIdx] = DeviceTransition(self._filtergraphProcesses[dIdx], incoming, device, stagingDevice)
+        self._workerSlots[dIdx] = slotId
+        print('Assigned process {} to transition of device {}'.format(incoming.process.pid, dIdx))
+        return True
+
+    def _advanceTransition(self, dt):
+        transition = self._transition
+        if transition is None or transition.finishFrame is not None:
+            return
+        if transition.advance(dt, self._frameIndex):
+            self._switchTransition()
+
+    def _switchTransition(self):
+        """Hands the output devices over to the incoming workers
+
+        Outgoing workers still render the frames sent to them before and are released to the pool afterwards.
+        """
+        transition = self._transition
+        for dIdx, deviceTransition in transition.devices.items():
+            if self._publishQueue is not None:
+                self._publishQueue.unregister(deviceTransition.outgoing.queue)
+            self._workerPool.release(deviceTransition.outgoing)
+            self._cpuBudget.remove(deviceTransition.outgoing.process.pid)
+            deviceTransition.incoming.queue.put(ReplaceOutputDeviceMessage(dIdx, deviceTransition.device))
+            self._filtergraphProcesses[dIdx] = deviceTransition.incoming
+        transition.finishFrame = self._frameIndex - 1
+
+    def _endTransition(self, frameIndex):
+        """Stops waiting for the outgoing workers once the given frame isn't rendered by them anymore
+        """
+        transition = self._transition
+        if transition is None or transition.finishFrame is None or frameIndex <= transition.finishFrame:
+            return
+        for deviceTransition in transition.devices.values():
+            self._frameSync.unregister(deviceTransition.outgoing.syncIndex)
+        self._transition = None
+        self._lastTransition = transition
+        print("Transition to scene {} done".format(self.activeSceneId))
+
+    def _finishTransition(self):
+        """Completes a running transition immediately
+        """
+        transition = self._transition
+        if transition is None:
+            return
+        if transition.finishFrame is None:
+            self._switchTransition()
+        self._endTransition(transition.finishFrame + 1)
+
+    def _blendTransition(self, frameIndex):
+        transition = self._transition
+        if transition is None:
+            return
+        weight = transition.getWeight(frameIndex)
+        if weight is None:
+            return
+        start = time.perf_counter()
+        with tracing.span('transition blend', {'frame': frameIndex, 'weight': weight}):
+            for deviceTransition in transition.devices.values():
+                deviceTransition.blend(frameIndex, weight)
+        transition.blendTimings.record(time.perf_counter() - start)
 
     def stopProcessing(self):
         print('Stop processing')
         self._processingEnabled = False
         aquire = self._lock.acquire(block=True, timeout=1)
+        self._finishTransition()
+        self._workerSlots = {}
+        self._workerDevices = {}
+        self._cpuBudget.reset()
         if not aquire:
             print("Couldn't get lock. Force shutdown")
             try:
-                for p in self._filtergraphProcesses.values():
-                    p.join(0.1)
-                    if p.is_alive():
-                        p.terminate()
+                for poolWorker in self._filtergraphProcesses.values():
+                    self._workerPool.discard(poolWorker)
                 for p in self._outputProcesses.values():
                     p.join(0.1)
                     if p.is_alive():
@@ -604,17 +1594,19 @@ class Project(Updateable):
                 self._outputProcesses = {}
                 self._publishQueue = None
                 self._showQueue = None
+                self._frameSync.reset()
+                self._showSync.reset()
                 self._processingEnabled = True
             return
         # Normal shutdown
         try:
+            print("Releasing workers")
+            # Workers return to the pool, their queues are owned by the pool
+            for poolWorker in self._filtergraphProcesses.values():
+                self._workerPool.release(poolWorker)
+            self._filtergraphProcesses = {}
+            self._publishQueue = None
             print("Ending queue")
-            if self._publishQueue is not None:
-                self._publishQueue.publish(None)
-                self._publishQueue.close()
-                self._publishQueue.join_thread()
-                print('Publish queue ended')
-                self._publishQueue = None
             if self._showQueue is not None:
                 self._showQueue.publish(None)
                 self._showQueue.close()
@@ -622,14 +1614,12 @@ class Project(Updateable):
                 print("Show queue ended")
                 self._showQueue = None
             print("Ending processes")
-            for p in self._filtergraphProcesses.values():
-                p.join()
-            print("Filtergraph processes joined")
-            self._filtergraphProcesses = {}
             for p in self._outputProcesses.values():
                 p.join()
             print("Output processes joined")
             self._outputProcesses = {}
+            self._frameSync.reset()
+            self._showSync.reset()
             print('All processes joined')
         finally:
             print("stop processing - releasing lock")
@@ -673,6 +1663,64 @@ class Project(Updateable):
         fg._contentRoot = self._contentRoot
         return fg
 
+    def getSlotTimings(self, slotId, timeout=1.0):
+        """Collects the timings of the given slot from all processes running it
+
+        Returns:
+            {"deviceIndex": timings} -- Timings as returned by FilterGraph.getTimings() per output device
+        """
+        results = {}
+        if (self._previewDeviceIndex is not None and self._previewDeviceIndex < len(self._devices)
+                and slotId == self.activeSceneId):
+            results[str(self._previewDeviceIndex)] = self.getSlot(slotId).getTimings()
+        requestId = uuid.uuid4().hex
+        self._lock.acquire()
+        try:
+            if self._publishQueue is None:
+                return results
+            numWorkers = len(self._filtergraphProcesses)
+            if self._transition is not None and self._transition.finishFrame is None:
+                # Outgoing workers of the transition answer as well
+                numWorkers += len(self._transition.devices)
+            self._publishQueue.publish(TimingsMessage(slotId, 'get', requestId))
+        finally:
+            self._lock.release()
+        stop = time.time() + timeout
+        while numWorkers > 0 and time.time() < stop:
+            try:
+                replyId, deviceId, timings = self._timingsQueue.get(True, max(0., stop - time.time()))
+            except queue.Empty:
+                break
+            if replyId != requestId:
+                # Late reply to an earlier request
+                continue
+            numWorkers -= 1
+            if timings is not None:
+                results[str(deviceId)] = timings
+        return results
+
+    def setSlotRecordTimings(self, slotId, recordTimings):
+        """Enables or disables timing instrumentation for the given slot
+        """
+        self.getSlot(slotId).setRecordTimings(recordTimings)
+        self._lock.acquire()
+        try:
+            if self._publishQueue is not None:
+                self._publishQueue.publish(TimingsMessage(slotId, 'record', recordTimings))
+                self._invalidateGraphCaches(slotId)
+        finally:
+            self._lock.release()
+
+    def setTracing(self, enabled):
+        """Enables or disables tracing of the frame pipeline in all processes
+        """
+        self._tracer.setEnabled(enabled)
+
+    def getTrace(self):
+        """Returns the traced events of all processes as Chrome trace JSON object
+        """
+        return self._tracer.getTrace()
+
     def getSceneMatrix(self):
         numDevices = len(self._devices)
         retMatrix = {}
@@ -690,96 +1738,115 @@ class Project(Updateable):
         self.activateScene(self.activeSceneId)
 
     def _handleNodeAdded(self, node: audioled.filtergraph.Node):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(NodeMessage(self.activeSlotId, node.uid, 'add', node.effect))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(NodeMessage(self.activeSlotId, node.uid, 'add', node.effect))
 
     def _handleNodeRemoved(self, node: audioled.filtergraph.Node):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(NodeMessage(self.activeSlotId, node.uid, 'remove'))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(NodeMessage(self.activeSlotId, node.uid, 'remove'))
 
     def _handleNodeUpdate(self, node: audioled.filtergraph.Node, updateParameters):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(NodeMessage(self.activeSlotId, node.uid, 'update', updateParameters))
-        finally:
-            self._lock.release()
+        self._queueParameterUpdate('node', node.uid, updateParameters)
 
     def _handleModulationAdded(self, mod: audioled.filtergraph.Modulation):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationMessage(self.activeSlotId, mod.uid, 'add', mod))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(ModulationMessage(self.activeSlotId, mod.uid, 'add', mod))
 
     def _handleModulationRemoved(self, mod: audioled.filtergraph.Modulation):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationMessage(self.activeSlotId, mod.uid, 'remove'))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(ModulationMessage(self.activeSlotId, mod.uid, 'remove'))
 
     def _handleModulationUpdate(self, mod: audioled.filtergraph.Modulation, updateParameters):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationMessage(self.activeSlotId, mod.uid, 'update', updateParameters))
-        finally:
-            self._lock.release()
+        self._queueParameterUpdate('modulation', mod.uid, updateParameters)
 
     def _handleModulationSourceAdded(self, modSource: audioled.filtergraph.ModulationSourceNode):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationSourceMessage(self.activeSlotId, modSource.uid, 'add', modSource))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(ModulationSourceMessage(self.activeSlotId, modSource.uid, 'add', modSource))
 
     def _handleModulationSourceRemoved(self, modSource: audioled.filtergraph.ModulationSourceNode):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationSourceMessage(self.activeSlotId, modSource.uid, 'remove'))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(ModulationSourceMessage(self.activeSlotId, modSource.uid, 'remove'))
 
     def _handleModulationSourceUpdate(self, modSource: audioled.filtergraph.ModulationSourceNode, updateParameters):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ModulationSourceMessage(self.activeSlotId, modSource.uid, 'update', updateParameters))
-        finally:
-            self._lock.release()
+        self._queueParameterUpdate('modulationSource', modSource.uid, updateParameters)
 
     def _handleConnectionAdded(self, con: audioled.filtergraph.Connection):
-        self._lock.acquire()
-        try:
-            self._publishQueue.publish(ConnectionMessage(self.activeSlotId, con.uid, 'add', con.__getstate__()))
-        finally:
-            self._lock.release()
+        self._publishGraphChange(ConnectionMessage(self.activeSlotId, con.uid, 'add', con.__getstate__()))
 
     def _handleConnectionRemoved(self, con: audioled.filtergraph.Connection):
+        self._publishGraphChange(ConnectionMessage(self.activeSlotId, con.uid, 'remove'))
+
+    def _publishGraphChange(self, message):
         self._lock.acquire()
         try:
-            self._publishQueue.publish(ConnectionMessage(self.activeSlotId, con.uid, 'remove'))
+            # Keep the order of parameter updates and structural changes
+            self._sendParameterUpdates()
+            self._publishQueue.publish(message)
+            self._invalidateGraphCaches(message.slotId)
         finally:
             self._lock.release()
 
+    def _queueParameterUpdate(self, target, uid, updateParameters):
+        """Stores parameter updates until the next frame, only the latest value of each parameter is sent to the workers
+        """
+        with self._parameterLock:
+            for param, value in updateParameters.items():
+                if param.startswith('~'):
+                    # Original values are set by Effect.updateParameter in the workers
+                    continue
+                self._pendingParameterUpdates[(target, self.activeSlotId, uid, param)] = value
+
+    def _sendParameterUpdates(self):
+        """Publishes the pending parameter updates in one message, called once per frame
+        """
+        with self._parameterLock:
+            pending = self._pendingParameterUpdates
+            self._pendingParameterUpdates = {}
+        if not pending or self._publishQueue is None:
+            return
+        updates = {}
+        for (target, slotId, uid, param), value in pending.items():
+            updates.setdefault((target, slotId, uid), {})[param] = value
+        self._publishQueue.publish(ParameterUpdateMessage([key + (parameters, ) for key, parameters in updates.items()]))
+        for slotId in set(key[1] for key in updates):
+            self._invalidateGraphCaches(slotId)
+
     def _sendUpdateCommand(self, dt):
         if self._publishQueue is None:
             print("No publish queue. Possibly exiting")
             return
-        self._publishQueue.publish(UpdateMessage(dt, audioled.audio.GlobalAudio.buffer))
+        self._frameStartTimes[self._frameIndex] = time.perf_counter()
+        self._publishQueue.publish(UpdateMessage(dt, self._frameIndex))
 
-    def _sendShowCommand(self):
+    def _sendShowCommand(self, frameIndex):
         if self._showQueue is None:
             print("No show queue. Possibly exiting")
             return
-        self._showQueue.publish("show!")
+        self._showSync.startFrame(frameIndex)
+        self._showQueue.publish(frameIndex)
 
     def _sendReplaceFiltergraphCommand(self, dIdx, slotId, filtergraph):
-        self._publishQueue.publish(ReplaceFiltergraphMessage(dIdx, slotId, filtergraph))
+        poolWorker = self._filtergraphProcesses[dIdx]
+        graphHash, snapshot = self._getGraphForWorker(poolWorker, slotId, filtergraph)
+        poolWorker.queue.put(ReplaceFiltergraphMessage(dIdx, slotId, graphHash, snapshot))
+
+    def _getGraphForWorker(self, poolWorker: PoolWorker, slotId, filtergraph: FilterGraph):
+        """Returns hash and snapshot of the filtergraph to hand over to the worker
+
+        The snapshot is None if the worker has the graph cached.
+        """
+        snapshot = filtergraph.getSnapshot()
+        graphHash = audioled.filtergraph.getSnapshotHash(snapshot)
+        if graphHash in poolWorker.graphCache:
+            snapshot = None
+        poolWorker.graphCache.put(graphHash, None)
+        poolWorker.slotId = slotId
+        poolWorker.graphHash = graphHash
+        return graphHash, snapshot
+
+    def _invalidateGraphCaches(self, slotId):
+        """Removes the graph of the slot from the caches of the workers running it, called when the slot is modified
+        """
+        workers = list(self._filtergraphProcesses.values())
+        if self._transition is not None and self._transition.finishFrame is None:
+            workers += [deviceTransition.incoming for deviceTransition in self._transition.devices.values()]
+        for poolWorker in workers:
+            if poolWorker.slotId == slotId:
+                poolWorker.graphCache.pop(poolWorker.graphHash)
 
     def _updatePreviewDevice(self, dt, event_loop=asyncio.get_event_loop()):
         # Process preview in this process
@@ -0,0 +1,155 @@
+import math
+from timeit import default_timer as timer
+
+import jsonpickle
+import numpy as np
+from scipy.io import wavfile
+
+from audioled import audio
+from audioled.filtergraph import FilterGraph
+
+
+class SyntheticAudioSource(object):
+    """Reproducible audio signal: an exponential sine sweep with kick drum pulses and white noise
+
+    Samples are interleaved for num_channels channels, like the buffer of GlobalAudio.
+    """
+    def __init__(self, sample_rate=48000, num_channels=2, bpm=120., sweep_time=10., seed=0):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.bpm = bpm
+        self.sweep_time = sweep_time
+        self._random = np.random.RandomState(seed)
+        self._position = 0
+
+    def read(self, numSamples):
+        t = (self._position + np.arange(numSamples)) / self.sample_rate
+        self._position += numSamples
+        # Sweep from 40Hz to 8kHz
+        phase = 2 * np.pi * 40. * self.sweep_time / math.log(200.) * (np.exp(t / self.sweep_time * math.log(200.)) - 1)
+        signal = 0.3 * np.sin(phase)
+        # Kick drum on every beat
+        beat = np.mod(t, 60. / self.bpm)
+        signal += 0.5 * np.sin(2 * np.pi * 60. * beat) * np.exp(-beat * 20.)
+        signal += 0.05 * self._random.standard_normal(numSamples)
+        return np.repeat(signal, self.num_channels)
+
+
+class WavAudioSource(object):
+    """Audio signal read from a WAV file, samples are interleaved like the buffer of GlobalAudio
+
+    Integer samples are scaled to [-1, 1]. After the end of the file, silence is returned.
+    """
+    def __init__(self, filename, num_channels=None):
+        self.sample_rate, data = wavfile.read(filename, mmap=True)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if np.issubdtype(data.dtype, np.integer):
+            scale = float(np.iinfo(data.dtype).max)
+        else:
+            scale = 1.
+        self.num_channels = num_channels if num_channels is not None else data.shape[1]
+        self._data = data
+        self._scale = scale
+        self._position = 0
+
+    def read(self, numSamples):
+        chunk = np.asarray(self._data[self._position:self._position + numSamples], dtype=np.float64) / self._scale
+        self._position += numSamples
+        if len(chunk) < numSamples:
+            chunk = np.concatenate([chunk, np.zeros((numSamples - len(chunk), chunk.shape[1]))])
+        # Mix to requested number of channels
+        if chunk.shape[1] != self.num_channels:
+            chunk = np.repeat(np.mean(chunk, axis=1, keepdims=True), self.num_channels, axis=1)
+        return chunk.reshape(-1)
+
+
+class OfflineRenderer(object):
+    """Renders a FilterGraph headless and faster than realtime
+
+    The graph is driven by a virtual clock with fixed dt = 1 / fps and fed with audio chunks of
+    sample_rate / fps samples from the audio source. The graph is copied, so the given graph is not modified.
+    Random number generators are seeded, so rendering the same graph twice yields the same frames.
+    """
+    def __init__(self, filtergraph: FilterGraph, audioSource=None, num_pixels=300, num_rows=1, fps=60., seed=0):
+        self.filtergraph = jsonpickle.decode(jsonpickle.encode(filtergraph))  # type: FilterGraph
+        self.filtergraph.recordTimings = False
+        self.audioSource = audioSource if audioSource is not None else SyntheticAudioSource()
+        self.num_pixels = num_pixels
+        self.num_rows = num_rows
+        self.fps = fps
+        self.seed = seed
+        self.renderTime = None
+
+    def render(self, numFrames, outputFile=None, dtype=np.float32):
+        """Renders numFrames frames
+
+        Arguments:
+            numFrames {int} -- Number of frames to render
+
+        Keyword Arguments:
+            outputFile {str} -- .npy file the frames are written to as memory-mapped array, in memory if None
+            dtype -- Data type of the stored frames (default: {np.float32})
+
+        Returns:
+            array of shape (numFrames, 3, num_pixels) with the pixels of each frame
+        """
+        dt = 1. / self.fps
+        chunkLength = int(self.audioSource.sample_rate // self.fps)
+        np.random.seed(self.seed)
+        previousAudio = (audio.GlobalAudio.sample_rate, audio.GlobalAudio.chunk_rate)
+        audio.GlobalAudio.sample_rate = self.audioSource.sample_rate
+        audio.GlobalAudio.chunk_rate = self.fps
+        try:
+            self.filtergraph.propagateNumPixels(self.num_pixels, self.num_rows)
+            frames = None
+            start = timer()
+            for i in range(numFrames):
+                # Rendered audio isn't captured, filters of captured audio aren't shared with it
+                audio.GlobalAudio.setFrameAudio(self.audioSource.read(chunkLength))
+                self.filtergraph.update(dt)
+                self.filtergraph.process()
+                pixels = self._getPixels()
+                if frames is None:
+                    frames = self._allocate(numFrames, pixels.shape, outputFile, dtype)
+                frames[i] = pixels
+            self.renderTime = timer() - start
+        finally:
+            audio.GlobalAudio.setFrameAudio(None)
+            audio.GlobalAudio.sample_rate, audio.GlobalAudio.chunk_rate = previousAudio
+        if isinstance(frames, np.memmap):
+            frames.flush()
+        return frames
+
+    def getFramesPerSecond(self, numFrames):
+        if not self.renderTime:
+            return None
+        return numFrames / self.renderTime
+
+    def _getPixels(self):
+        ledOutput = self.filtergraph.getLEDOutput()
+        if ledOutput is None or ledOutput._outputBuffer[0] is None:
+            return np.zeros((3, self.num_pixels))
+        return ledOutput._outputBuffer[0]
+
+    @staticmethod
+    def _allocate(numFrames, shape, outputFile, dtype):
+        shape = (numFrames, ) + tuple(shape)
+        if outputFile is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(outputFile, mode='w+', dtype=dtype, shape=shape)
+
+
+def getSceneFiltergraph(project, sceneId, deviceIndex=0):
+    """Returns the FilterGraph a project shows on the given output device for a scene
+    """
+    try:
+        slotId = project.outputSlotMatrix[str(deviceIndex)][str(sceneId)]
+    except KeyError:
+        # Same fallback as Project.activateScene
+        slotId = sceneId
+    filtergraph = project.slots[slotId]
+    if filtergraph is None:
+        raise RuntimeError("Slot {} of scene {} is empty".format(slotId, sceneId))
+    filtergraph._contentRoot = project._contentRoot
+    return filtergraph
@@ -0,0 +1,97 @@
+import threading
+import time
+import traceback
+
+from audioled.filtergraph import LatencyHistogram
+
+
+class RenderLoop(object):
+    """Dedicated thread calling renderFrame(dt) at a target frame rate
+
+    Frames are scheduled at absolute deadlines on a grid of 1 / fps, so processing time doesn't add up to drift.
+    Each frame is counted as on time if it finished within its frame period, otherwise as late.
+    If the loop falls behind by whole frame periods, those frames are dropped instead of being rendered
+    in a burst to catch up. dt is the time since the last rendered frame, so animations keep their speed.
+    """
+    def __init__(self, renderFrame, fps=60.):
+        self.renderFrame = renderFrame
+        self._period = None
+        self.setFps(fps)
+        self._thread = None  # type: threading.Thread
+        self._stopEvent = threading.Event()
+        self._statsLock = threading.Lock()
+        self.resetStats()
+
+    def setFps(self, fps):
+        if fps <= 0:
+            raise ValueError("Frame rate has to be positive")
+        self._period = 1. / fps
+
+    def getFps(self):
+        return 1. / self._period
+
+    def start(self):
+        if self.isRunning():
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='render loop', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopEvent.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def resetStats(self):
+        with self._statsLock:
+            self._onTime = 0
+            self._late = 0
+            self._dropped = 0
+            self._frameTimes = LatencyHistogram()
+
+    def getStats(self):
+        """Returns target frame rate, frame counters and the distribution of frame times in seconds
+        """
+        with self._statsLock:
+            return {
+                'fps': self.getFps(),
+                'onTime': self._onTime,
+                'late': self._late,
+                'dropped': self._dropped,
+                'frameTime': self._frameTimes.getStats(),
+            }
+
+    def _run(self):
+        nextDeadline = time.perf_counter()
+        period = self._period
+        lastFrame = None
+        while not self._stopEvent.is_set():
+            if self._period != period:
+                # Frame rate changed, start a new grid
+                period = self._period
+                nextDeadline = time.perf_counter()
+            now = time.perf_counter()
+            if now < nextDeadline:
+                self._stopEvent.wait(nextDeadline - now)
+                continue
+            # Drop frames whose period already passed
+            behind = int((now - nextDeadline) / period)
+            nextDeadline += behind * period
+            dt = now - lastFrame if lastFrame is not None else period
+            lastFrame = now
+            try:
+                self.renderFrame(dt)
+            except Exception:
+                traceback.print_exc()
+            end = time.perf_counter()
+            nextDeadline += period
+            with self._statsLock:
+                self._dropped += behind
+                if end > nextDeadline:
+                    self._late += 1
+                else:
+                    self._onTime += 1
+                self._frameTimes.record(end - now)
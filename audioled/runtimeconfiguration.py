@@ -97,4 +97,53 @@ def addServerRuntimeArguments(parser: argparse.ArgumentParser):
         action='store_true',
         default=False,
         help="Perform strand test at start of server.",
-    )
\ No newline at end of file
+    )
+    parser.add_argument(
+        '--fps',
+        dest='fps',
+        type=float,
+        default=60.,
+        help='Target frame rate of the render loop (default: 60)',
+    )
+    parser.add_argument(
+        '--backend',
+        dest='backend',
+        choices=['process', 'thread'],
+        default='process',
+        help='Run filtergraphs and outputs in separate processes or as threads of one process to save memory '
+        '(default: process)',
+    )
+    parser.add_argument(
+        '--worker_cores',
+        dest='worker_cores',
+        default=None,
+        help='Comma separated CPU cores for filtergraph workers (default: all but the output cores)',
+    )
+    parser.add_argument(
+        '--output_cores',
+        dest='output_cores',
+        default=None,
+        help='Comma separated CPU cores for output processes (default: first core)',
+    )
+    parser.add_argument(
+        '--blas_threads',
+        dest='blas_threads',
+        type=int,
+        default=1,
+        help='Number of BLAS and OpenMP threads per process (default: 1)',
+    )
+    parser.add_argument(
+        '--output_niceness',
+        dest='output_niceness',
+        type=int,
+        default=None,
+        help='Niceness of output processes, negative values raise the priority and need root (default: unchanged)',
+    )
+
+
+def parseCores(cores):
+    """Parses a comma separated list of CPU cores, returns None for None
+    """
+    if cores is None:
+        return None
+    return [int(core) for core in cores.split(',')]
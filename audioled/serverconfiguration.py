@@ -6,7 +6,6 @@ import os.path
 import hashlib
 import io
 import multiprocessing
-import ctypes
 
 from audioled.devices import MultiOutputWrapper
 
@@ -148,7 +147,17 @@ class ServerConfiguration:
             self._projectMetadatas.pop(uid)
 
     def activateProject(self, uid):
-        proj = self.getProject(uid)
+        previous = self._activeProject
+        if previous is not None and previous is not self._projects.get(uid):
+            # Outputs are shared, the previous project has to stop rendering to them
+            previous.deactivate()
+        try:
+            proj = self.getProject(uid)
+        except Exception:
+            if previous is not None:
+                # Keep the previous project running
+                previous.setDevice(self._createOrReuseOutputDevice())
+            raise
         if proj is not None:
             self._config[CONFIG_ACTIVE_PROJECT] = uid
         return self.getActiveProjectOrDefault()
@@ -349,9 +358,7 @@ class ServerConfiguration:
                     firstDevice = deviceWrapper._devices[0]
                     multiDevices[referencedConf] = firstDevice
                     lock = multiprocessing.Lock()
-                    multiDeviceArrays[referencedConf] = multiprocessing.Array(ctypes.c_uint8,
-                                                                              3 * firstDevice.getNumPixels(),
-                                                                              lock=lock)
+                    multiDeviceArrays[referencedConf] = devices.createSharedPixelArray(firstDevice.getNumPixels())
                     multiDeviceLocks[referencedConf] = lock
                 realDevice = multiDevices[referencedConf]
                 virtualArray = multiDeviceArrays[referencedConf]
@@ -0,0 +1,166 @@
+import collections
+import ctypes
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from typing import Dict
+
+
+class Tracer(object):
+    """Opt-in tracer for the frame pipeline across processes
+
+    Spans are timestamped with time.perf_counter(), which is based on the system-wide monotonic clock,
+    so timestamps of the project, worker and output processes can be compared directly.
+    Child processes buffer their events and flush them to the collecting process over a queue.
+    The collected events are exported in Chrome trace event format, which can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+
+    The tracer has to be created in the collecting process and passed to child processes on start.
+    While disabled, recording a span only costs the check of a shared flag.
+    """
+    def __init__(self, maxEvents=50000):
+        self._enabled = mp.RawValue(ctypes.c_bool, False)
+        self._queue = mp.Queue()
+        self._creatorPid = os.getpid()
+        self.__initstate__()
+        self._collected = collections.deque(maxlen=maxEvents)
+
+    def __initstate__(self):
+        self._events = []
+        self._processName = None
+        self._processNames: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._collected = None
+
+    def __getstate__(self):
+        return {'_enabled': self._enabled, '_queue': self._queue, '_creatorPid': self._creatorPid}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__initstate__()
+
+    def isEnabled(self):
+        return self._enabled.value
+
+    def setEnabled(self, enabled):
+        """Enables or disables tracing in all processes, previously collected events are dropped when enabling
+        """
+        if enabled and not self._enabled.value:
+            self.collect()
+            with self._lock:
+                self._collected.clear()
+        self._enabled.value = enabled
+
+    def setProcessName(self, name):
+        self._processName = name
+        self._processNames[os.getpid()] = name
+
+    def record(self, name, start, end, args=None):
+        """Records a span with start and end in seconds of time.perf_counter()
+        """
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args is not None:
+            event['args'] = args
+        if os.getpid() == self._creatorPid:
+            with self._lock:
+                self._collected.append(event)
+        else:
+            self._events.append(event)
+
+    def flush(self):
+        """Sends the buffered events of a child process to the collecting process
+        """
+        if not self._events:
+            return
+        events = self._events
+        self._events = []
+        try:
+            self._queue.put_nowait((os.getpid(), self._processName, events))
+        except queue.Full:
+            print("Trace queue full, dropping {} events".format(len(events)))
+
+    def collect(self):
+        """Receives the events flushed by child processes, has to be called regularly in the collecting process
+        """
+        while True:
+            try:
+                pid, processName, events = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                if processName is not None:
+                    self._processNames[pid] = processName
+                self._collected.extend(events)
+
+    def getTrace(self):
+        """Returns the collected events as Chrome trace JSON object
+        """
+        self.collect()
+        with self._lock:
+            events = list(self._collected)
+            processNames = dict(self._processNames)
+        for pid, name in processNames.items():
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+class _Span(object):
+    def __init__(self, tracer, name, args):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer.record(self._name, self._start, time.perf_counter(), self._args)
+        return False
+
+
+class _NoSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_noSpan = _NoSpan()
+_tracer = None  # type: Tracer
+
+
+def setTracer(tracer):
+    """Sets the tracer used by span() and flush() in this process
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def getTracer():
+    return _tracer
+
+
+def span(name, args=None):
+    """Returns a context manager recording a span with the given name if tracing is enabled
+    """
+    tracer = _tracer
+    if tracer is None or not tracer._enabled.value:
+        return _noSpan
+    return _Span(tracer, name, args)
+
+
+def flush():
+    tracer = _tracer
+    if tracer is not None:
+        tracer.flush()
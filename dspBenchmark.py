@@ -0,0 +1,131 @@
+import argparse
+import itertools
+from timeit import default_timer as timer
+
+import numpy as np
+
+from audioled import dsp
+
+parser = argparse.ArgumentParser(description='MOLECOLE - DSP benchmark')
+parser.add_argument(
+    '-R',
+    '--repetitions',
+    dest='repetitions',
+    type=int,
+    default=1000,
+    help='number of repetitions per measurement (default: 1000)',
+)
+parser.add_argument(
+    '-B',
+    '--bins',
+    dest='bins',
+    type=int,
+    default=64,
+    help='number of filterbank bins (default: 64, as used by Spectrum)',
+)
+
+# (n_fft, fs, fmin, fmax), the first two are the bass and melody bands of Spectrum with default settings
+benchmarkSizes = [
+    (1024, 12000, 32.7, 261.0),
+    (1024, 12000, 261.0, 6000.0),
+    (4096, 48000, 20.0, 20000.0),
+]
+
+
+def loopFilterBank(n_filters, n_fft, fs, fmin_hz, fmax_hz):
+    """Bark filterbank filled with Python loops, the previous implementation of dsp.filter_bank
+    """
+    fmin_bark = 6.0 * np.arcsinh(fmin_hz / 600.0)
+    fmax_bark = 6.0 * np.arcsinh(fmax_hz / 600.0)
+    f_hz = 600.0 * np.sinh(np.linspace(fmin_bark, fmax_bark, n_filters + 2) / 6.0)
+    bins = np.floor((n_fft + 1.) * f_hz / fs)
+    filters = np.zeros((n_filters, n_fft // 2 + 1))
+    for m in range(1, n_filters + 1):
+        for k in range(int(bins[m - 1]), int(bins[m])):
+            filters[m - 1, k] = (k - bins[m - 1]) / (bins[m] - bins[m - 1])
+        for k in range(int(bins[m]), int(bins[m + 1])):
+            filters[m - 1, k] = (bins[m + 1] - k) / (bins[m + 1] - bins[m])
+    return filters
+
+
+def broadcastProduct(pow_spectrum, filters):
+    """Previous filterbank product of dsp.warped_psd, with a temporary of n_fft / 2 x bins
+    """
+    pow_spectrum = pow_spectrum.reshape(1, -1)
+    return np.sum(pow_spectrum[:, :, None] * filters.T[None, :, :], axis=1).reshape(-1)
+
+
+# (fs, fmax, n_overlaps, chunk length), Spectrum with default settings at 60 chunks per second
+stftSizes = [
+    (48000, 6000, 4, 800),
+    (44100, 6000, 4, 735),
+    (48000, 6000, 20, 800),
+]
+
+
+def generatorChain(chunks, fs, fmax, n_overlaps):
+    """Rolling window as chained generators, the previous implementation of dsp.preprocess
+    """
+    audio, fs = dsp.downsample(chunks, fs=fs, fmax=fmax)
+    audio = dsp.rollwin(audio, n_overlaps)
+    hanning_window = np.hanning(len(next(audio)))
+    audio = (x * hanning_window for x in audio)
+    return dsp.pad_zeros(audio)
+
+
+def measure(function, repetitions):
+    """Returns the average time of function() in microseconds
+    """
+    start = timer()
+    for _ in range(repetitions):
+        function()
+    return (timer() - start) / repetitions * 1e6
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print("{} bins, {} repetitions".format(args.bins, args.repetitions))
+    header = ("n_fft", "range Hz", "nonzero", "build loop", "build csr", "broadcast", "dense dot", "sparse")
+    print("{0:>6s} {1:>14s} {2:>8s} {3:>11s} {4:>11s} {5:>11s} {6:>11s} {7:>11s}".format(*header))
+    for n_fft, fs, fmin, fmax in benchmarkSizes:
+        pow_spectrum = dsp.power_spectrum(np.random.uniform(-0.5, 0.5, n_fft))
+        filters, _ = dsp.filter_bank(args.bins, n_fft, fs, fmin, fmax, 'bark')
+        sparse, _ = dsp.sparse_filter_bank(args.bins, n_fft, fs, fmin, fmax, 'bark')
+        if not np.allclose(broadcastProduct(pow_spectrum, filters), sparse.dot(pow_spectrum)):
+            raise RuntimeError("Sparse filterbank doesn't match the dense one")
+        buildRepetitions = max(1, args.repetitions // 100)
+        buildLoop = measure(lambda: loopFilterBank(args.bins, n_fft, fs, fmin, fmax), buildRepetitions)
+
+        def buildSparse():
+            dsp.sparse_filter_bank.cache_clear()
+            dsp.sparse_filter_bank(args.bins, n_fft, fs, fmin, fmax, 'bark')
+
+        buildCsr = measure(buildSparse, buildRepetitions)
+        broadcast = measure(lambda: broadcastProduct(pow_spectrum, filters), args.repetitions)
+        dense = measure(lambda: filters.dot(pow_spectrum), args.repetitions)
+        sparseTime = measure(lambda: sparse.dot(pow_spectrum), args.repetitions)
+        print("{0:6d} {1:>14s} {2:8d} {3:9.1f}us {4:9.1f}us {5:9.1f}us {6:9.1f}us {7:9.1f}us".format(
+            n_fft, "{:.0f}-{:.0f}".format(fmin, fmax), sparse.nnz, buildLoop, buildCsr, broadcast, dense,
+            sparseTime))
+    print("\nRolling window and power spectrum per chunk, {} repetitions".format(args.repetitions))
+    header = ("fs", "fmax", "overlaps", "fft size", "generators", "stft")
+    print("{0:>6s} {1:>6s} {2:>8s} {3:>8s} {4:>11s} {5:>11s}".format(*header))
+    for fs, fmax, n_overlaps, chunkLength in stftSizes:
+        chunk = np.random.uniform(-0.5, 0.5, chunkLength)
+        chain = generatorChain(itertools.repeat(chunk), fs, fmax, n_overlaps)
+        stft = dsp.STFT(fs, fmax, n_overlaps)
+        # Fill the rolling windows
+        for _ in range(n_overlaps):
+            expected = next(chain)
+            frame = stft.update(chunk)
+        if not np.allclose(expected, frame):
+            raise RuntimeError("STFT doesn't match the generator chain")
+        generators = measure(lambda: dsp.power_spectrum(next(chain)), args.repetitions)
+
+        def stftUpdate():
+            stft.update(chunk)
+            stft.spectrum()
+
+        stftTime = measure(stftUpdate, args.repetitions)
+        print("{0:6d} {1:6d} {2:8d} {3:8d} {4:9.1f}us {5:9.1f}us".format(
+            fs, fmax, n_overlaps, len(frame), generators, stftTime))
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import importlib
+import inspect
+import io
+import json
+import os
+import pkgutil
+import platform
+import re
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+import audioled
+from audioled import audio, effect, filtergraph
+
+# Effects opening external devices or network ports on creation
+excludedEffects = ['MidiKeyboard', 'CandyServer']
+
+_audioExpected = re.compile(r"Input (\d+): Audio input expected")
+
+parser = argparse.ArgumentParser(description='MOLECOLE - Effect benchmark')
+parser.add_argument(
+    '-G',
+    '--geometries',
+    dest='geometries',
+    default='300x1,1000x1,968x22',
+    help='comma separated list of <num_pixels>x<num_rows> (default: 300x1,1000x1,968x22)',
+)
+parser.add_argument(
+    '-F',
+    '--frames',
+    dest='frames',
+    type=int,
+    default=200,
+    help='number of measured frames per effect and geometry (default: 200)',
+)
+parser.add_argument(
+    '-E',
+    '--effect',
+    dest='effects',
+    action='append',
+    default=None,
+    help='only benchmark effects whose name contains the given string, can be given multiple times',
+)
+parser.add_argument(
+    '-o',
+    '--output',
+    dest='output',
+    default=None,
+    help='JSON file the results are written to',
+)
+parser.add_argument(
+    '-c',
+    '--compare',
+    dest='compare',
+    default=None,
+    help='JSON file of a previous run to compare the results with',
+)
+parser.add_argument(
+    '-t',
+    '--threshold',
+    dest='threshold',
+    type=float,
+    default=1.2,
+    help='ratio of p50 times reported as regression when comparing (default: 1.2)',
+)
+parser.add_argument(
+    '-v',
+    '--verbose',
+    dest='verbose',
+    action='store_true',
+    help='show the output printed by the effects',
+)
+
+
+def findEffects():
+    """Imports all modules of audioled and returns all Effect subclasses defined there, sorted by name
+    """
+    for moduleInfo in pkgutil.iter_modules(audioled.__path__):
+        try:
+            importlib.import_module('audioled.' + moduleInfo.name)
+        except Exception as e:
+            print("Skipping module {}: {}".format(moduleInfo.name, e))
+    classes = set()
+    work = [effect.Effect]
+    while work:
+        parent = work.pop()
+        for child in parent.__subclasses__():
+            if child not in classes:
+                classes.add(child)
+                work.append(child)
+    classes = [c for c in classes if c.__module__.startswith('audioled.') and not inspect.isabstract(c)]
+    return sorted(classes, key=getEffectName)
+
+
+def getEffectName(effectClass):
+    return "{}.{}".format(effectClass.__module__, effectClass.__name__)
+
+
+def parseGeometries(geometries):
+    result = []
+    for geometry in geometries.split(','):
+        num_pixels, _, num_rows = geometry.strip().partition('x')
+        result.append((int(num_pixels), int(num_rows or 1)))
+    return result
+
+
+def setupSyntheticAudio(sample_rate=48000, chunk_rate=60, num_channels=2):
+    """Feeds GlobalAudio with white noise instead of opening an audio device
+    """
+    audio.GlobalAudio.sample_rate = sample_rate
+    audio.GlobalAudio.chunk_rate = chunk_rate
+    audio.GlobalAudio.buffer = np.random.uniform(-0.5, 0.5, num_channels * sample_rate // chunk_rate)
+
+
+class EffectBench(object):
+    """Runs a single effect without a FilterGraph, feeding its inputs with synthetic pixels or audio
+
+    Inputs are pixel arrays unless the effect reports that it expects audio on a channel.
+    """
+    def __init__(self, effectClass, num_pixels, num_rows):
+        self.node = filtergraph.Node(effectClass())
+        self.effect = self.node.effect
+        self.effect.setNumOutputPixels(num_pixels)
+        self.effect.setNumOutputRows(num_rows)
+        self._audioChannels = set()
+        self._eventLoop = asyncio.get_event_loop()
+
+    def _createInputs(self):
+        for channel in range(self.effect.numInputChannels()):
+            if channel in self._audioChannels:
+                buffer = effect.AudioBuffer(audio.GlobalAudio.sample_rate)
+                buffer.audio = np.random.uniform(-0.5, 0.5, len(audio.GlobalAudio.buffer) // 2)
+            else:
+                num_pixels = self.effect.getNumInputPixels(channel) or self.effect.getNumOutputPixels()
+                buffer = np.random.uniform(0., 255., (3, num_pixels))
+            self.node._inputBuffer[channel] = buffer
+
+    def update(self, dt):
+        self.node.update(dt, self._eventLoop)
+
+    def process(self):
+        self.effect.process()
+
+    def runFrame(self, dt):
+        """Runs update and process once, returns the time of update and process in seconds
+        """
+        audio.GlobalAudio.buffer = np.random.uniform(-0.5, 0.5, len(audio.GlobalAudio.buffer))
+        self._createInputs()
+        start = timer()
+        self.update(dt)
+        updated = timer()
+        self.process()
+        processed = timer()
+        return updated - start, processed - updated
+
+    def warmUp(self, dt, frames):
+        """Runs a few frames, switching inputs to audio where the effect expects audio
+        """
+        for _ in range(self.effect.numInputChannels() + 1):
+            try:
+                self.runFrame(dt)
+                break
+            except (RuntimeError, filtergraph.NodeException) as e:
+                match = _audioExpected.search(str(e))
+                if match is None or int(match.group(1)) in self._audioChannels:
+                    raise
+                self._audioChannels.add(int(match.group(1)))
+        for _ in range(frames):
+            self.runFrame(dt)
+
+
+def benchmarkEffect(effectClass, num_pixels, num_rows, frames, dt=1. / 60):
+    result = {
+        'effect': getEffectName(effectClass),
+        'num_pixels': num_pixels,
+        'num_rows': num_rows,
+        'frames': frames,
+        'update': None,
+        'process': None,
+        'error': None,
+    }
+    np.random.seed(0)
+    try:
+        bench = EffectBench(effectClass, num_pixels, num_rows)
+        bench.warmUp(dt, min(20, frames))
+        updateTimings = filtergraph.LatencyHistogram()
+        processTimings = filtergraph.LatencyHistogram()
+        for _ in range(frames):
+            updateTime, processTime = bench.runFrame(dt)
+            updateTimings.record(updateTime)
+            processTimings.record(processTime)
+        result['audioInputs'] = sorted(bench._audioChannels)
+        result['update'] = updateTimings.getStats()
+        result['process'] = processTimings.getStats()
+    except Exception as e:
+        result['error'] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def getMetadata(args):
+    return {
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'frames': args.frames,
+        'geometries': args.geometries,
+    }
+
+
+def _resultKey(result):
+    return (result['effect'], result['num_pixels'], result['num_rows'])
+
+
+def compare(results, baseline, threshold):
+    """Prints the ratio of p50 times to the baseline results, returns the number of regressions
+    """
+    baselineResults = {_resultKey(r): r for r in baseline['results']}
+    regressions = 0
+    print("{0:50s} {1:>10s} {2:>10s} {3:>10s}".format("effect", "geometry", "update", "process"))
+    for result in results:
+        old = baselineResults.get(_resultKey(result))
+        if old is None or result['error'] is not None or old['error'] is not None:
+            continue
+        ratios = []
+        for stage in ['update', 'process']:
+            ratio = result[stage]['p50'] / old[stage]['p50'] if old[stage]['p50'] > 0 else 1.
+            ratios.append(ratio)
+        regression = max(ratios) > threshold
+        regressions += regression
+        print("{0:50s} {1:>10s} {2:9.2f}x {3:9.2f}x{4}".format(result['effect'], "{}x{}".format(
+            result['num_pixels'], result['num_rows']), ratios[0], ratios[1], "  REGRESSION" if regression else ""))
+    return regressions
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    setupSyntheticAudio()
+    effectClasses = findEffects()
+    effectClasses = [c for c in effectClasses if c.__name__ not in excludedEffects]
+    if args.effects is not None:
+        effectClasses = [c for c in effectClasses if any(name in c.__name__ for name in args.effects)]
+    geometries = parseGeometries(args.geometries)
+    print("{} effects, geometries {}, {} frames".format(len(effectClasses), args.geometries, args.frames))
+    header = ("effect", "geometry", "update p50 ms", "p99", "process p50 ms", "p99")
+    print("{0:50s} {1:>10s} {2:>14s} {3:>8s} {4:>14s} {5:>8s}".format(*header))
+    results = []
+    for effectClass in effectClasses:
+        for num_pixels, num_rows in geometries:
+            if args.verbose:
+                result = benchmarkEffect(effectClass, num_pixels, num_rows, args.frames)
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = benchmarkEffect(effectClass, num_pixels, num_rows, args.frames)
+            results.append(result)
+            geometry = "{}x{}".format(num_pixels, num_rows)
+            if result['error'] is not None:
+                print("{0:50s} {1:>10s} {2}".format(result['effect'], geometry, result['error']))
+                continue
+            update, process = result['update'], result['process']
+            print("{0:50s} {1:>10s} {2:14.3f} {3:8.3f} {4:14.3f} {5:8.3f}".format(
+                result['effect'], geometry, update['p50'] * 1000, update['p99'] * 1000, process['p50'] * 1000,
+                process['p99'] * 1000))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': getMetadata(args), 'results': results}, f, indent=2)
+        print("Results written to {}".format(args.output))
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print("{} regressions".format(regressions))
+        sys.exit(1 if regressions else 0)
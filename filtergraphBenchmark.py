@@ -0,0 +1,140 @@
+import argparse
+import os
+from timeit import default_timer as timer
+
+import numpy as np
+
+from audioled import audio, colors, configs, devices, effects, filtergraph, generative
+
+
+def createLayersGraph(num_layers=4):
+    """Creates num_layers independent SwimmingPool layers, blended by a tree of Combine effects
+    """
+    fg = filtergraph.FilterGraph()
+
+    led_out = devices.LEDOutput()
+    fg.addEffectNode(led_out)
+
+    layers = []
+    for i in range(num_layers):
+        color = colors.StaticRGBColor(55.0 * i % 255, 150.0, 236.0)
+        fg.addEffectNode(color)
+        pool = generative.SwimmingPool()
+        fg.addEffectNode(pool)
+        fg.addConnection(color, 0, pool, 0)
+        layers.append(pool)
+
+    while len(layers) > 1:
+        combine = effects.Combine(mode='lightenOnly')
+        fg.addEffectNode(combine)
+        fg.addConnection(layers.pop(0), 0, combine, 0)
+        fg.addConnection(layers.pop(0), 0, combine, 1)
+        layers.append(combine)
+
+    fg.addConnection(layers[0], 0, led_out, 0)
+    return fg
+
+
+# Configs with several independent branches
+benchmarkConfigs = {
+    'movingLights': configs.createMovingLightsGraph,
+    'spectrum': configs.createSpectrumGraph,
+    'movingLight': configs.createMovingLightGraph,
+    'layers': createLayersGraph,
+}
+
+parser = argparse.ArgumentParser(description='MOLECOLE - FilterGraph benchmark')
+parser.add_argument(
+    '-N',
+    '--num_pixels',
+    dest='num_pixels',
+    type=int,
+    default=300,
+    help='number of pixels (default: 300)',
+)
+parser.add_argument(
+    '-R',
+    '--num_rows',
+    dest='num_rows',
+    type=int,
+    default=1,
+    help='number of rows (default: 1)',
+)
+parser.add_argument(
+    '-T',
+    '--num_threads',
+    dest='num_threads',
+    type=int,
+    default=os.cpu_count(),
+    help='number of threads for the parallel run (default: number of cpus)',
+)
+parser.add_argument(
+    '-F',
+    '--frames',
+    dest='frames',
+    type=int,
+    default=500,
+    help='number of frames per run (default: 500)',
+)
+parser.add_argument(
+    '-C',
+    '--config',
+    dest='config',
+    default=None,
+    choices=list(benchmarkConfigs.keys()),
+    help='config to benchmark, default is all configs',
+)
+
+
+def setupSyntheticAudio(sample_rate=48000, chunk_rate=60, num_channels=2):
+    """Feeds GlobalAudio with white noise instead of opening an audio device
+    """
+    audio.GlobalAudio.sample_rate = sample_rate
+    audio.GlobalAudio.chunk_rate = chunk_rate
+    audio.GlobalAudio.buffer = np.random.uniform(-0.5, 0.5, num_channels * sample_rate // chunk_rate)
+
+
+def runFrames(fg: filtergraph.FilterGraph, frames, dt=1. / 60):
+    """Runs update and process for the given number of frames
+
+    Returns the process timings of all frames in seconds
+    """
+    timings = np.zeros(frames)
+    for i in range(frames):
+        audio.GlobalAudio.buffer = np.random.uniform(-0.5, 0.5, len(audio.GlobalAudio.buffer))
+        fg.update(dt)
+        time = timer()
+        fg.process()
+        timings[i] = timer() - time
+    return timings
+
+
+def benchmark(config, num_pixels, num_rows, num_threads, frames):
+    results = {}
+    for threads in [1, num_threads]:
+        fg = benchmarkConfigs[config]()
+        fg.recordTimings = False
+        fg.setNumThreads(threads)
+        fg.propagateNumPixels(num_pixels, num_rows)
+        # Warm up
+        runFrames(fg, min(50, frames))
+        results[threads] = runFrames(fg, frames)
+    levels = fg._getExecutionPlan().levels
+    return results, max(len(level) for level in levels)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    setupSyntheticAudio()
+    configNames = [args.config] if args.config is not None else list(benchmarkConfigs.keys())
+    print("{} pixels, {} rows, {} frames, {} threads, {} cpus".format(args.num_pixels, args.num_rows, args.frames,
+                                                                      args.num_threads, os.cpu_count()))
+    header = ("config", "max width", "serial avg ms", "parallel avg", "parallel p95", "speedup")
+    print("{0:15s} {1:>10s} {2:>14s} {3:>14s} {4:>14s} {5:>8s}".format(*header))
+    for config in configNames:
+        results, width = benchmark(config, args.num_pixels, args.num_rows, args.num_threads, args.frames)
+        serial = np.mean(results[1]) * 1000
+        parallel = np.mean(results[args.num_threads]) * 1000
+        parallelP95 = np.percentile(results[args.num_threads], 95) * 1000
+        print("{0:15s} {1:10d} {2:14.3f} {3:14.3f} {4:14.3f} {5:7.2f}x".format(
+            config, width, serial, parallel, parallelP95, serial / parallel))
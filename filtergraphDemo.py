@@ -86,6 +86,14 @@ parser.add_argument(
     default=False,
     help='Save config to config/',
 )
+parser.add_argument(
+    '-T',
+    '--num_threads',
+    dest='num_threads',
+    type=int,
+    default=1,
+    help='number of threads to process independent branches of the filtergraph (default: 1)',
+)
 
 args = parser.parse_args()
 
@@ -209,6 +217,7 @@ else:
     cur_graph = createFilterGraph(args.config, num_pixels)
     saveAndLoad(args.config, cur_graph)
 
+cur_graph.setNumThreads(args.num_threads)
 cur_graph.propagateNumPixels(num_pixels, num_rows)
 
 while True:
@@ -221,6 +230,7 @@ while True:
         config_idx = (config_idx) % len(configChoices)
         cur_graph = createFilterGraph(configChoices[config_idx], num_pixels)
         cur_graph = saveAndLoad(configChoices[config_idx], cur_graph)
+        cur_graph.setNumThreads(args.num_threads)
         cur_graph.propagateNumPixels(num_pixels)
         config_idx = config_idx + 1
         last_switch_time = current_time
@@ -0,0 +1,92 @@
+import argparse
+import os
+
+import jsonpickle
+
+from audioled import filtergraph, project, render
+
+parser = argparse.ArgumentParser(description='MOLECOLE - Offline FilterGraph renderer')
+parser.add_argument('files', nargs='+', help='FilterGraph or project json files, e.g. configs/*.json')
+parser.add_argument(
+    '-N',
+    '--num_pixels',
+    dest='num_pixels',
+    type=int,
+    default=300,
+    help='number of pixels (default: 300)',
+)
+parser.add_argument(
+    '-R',
+    '--num_rows',
+    dest='num_rows',
+    type=int,
+    default=1,
+    help='number of rows (default: 1)',
+)
+parser.add_argument(
+    '-F',
+    '--frames',
+    dest='frames',
+    type=int,
+    default=600,
+    help='number of frames to render (default: 600)',
+)
+parser.add_argument(
+    '--fps',
+    dest='fps',
+    type=float,
+    default=60.,
+    help='frames per second of the virtual clock (default: 60)',
+)
+parser.add_argument(
+    '--wav',
+    dest='wav',
+    default=None,
+    help='WAV file to use as audio input, default is a synthetic signal',
+)
+parser.add_argument(
+    '--scene',
+    dest='scene',
+    type=int,
+    default=None,
+    help='scene to render for project files, default is the active scene',
+)
+parser.add_argument(
+    '-o',
+    '--output_dir',
+    dest='output_dir',
+    default=None,
+    help='directory to store the rendered frames as .npy files, frames are discarded if not given',
+)
+
+
+def loadFiltergraph(filename, scene):
+    with open(filename, "r", encoding='utf-8-sig') as f:
+        content = jsonpickle.decode(f.read())
+    if isinstance(content, filtergraph.FilterGraph):
+        content._contentRoot = os.path.dirname(os.path.abspath(filename))
+        return content
+    if isinstance(content, project.Project):
+        return render.getSceneFiltergraph(content, scene if scene is not None else content.activeSceneId)
+    raise RuntimeError("Unsupported content in {}".format(filename))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.output_dir is not None and not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    print("{0:40s} {1:>10s} {2:>10s}".format("file", "fps", "realtime"))
+    for filename in args.files:
+        try:
+            fg = loadFiltergraph(filename, args.scene)
+            audioSource = render.WavAudioSource(args.wav) if args.wav is not None else render.SyntheticAudioSource()
+            renderer = render.OfflineRenderer(fg, audioSource, args.num_pixels, args.num_rows, args.fps)
+            outputFile = None
+            if args.output_dir is not None:
+                name = os.path.splitext(os.path.basename(filename))[0]
+                outputFile = os.path.join(args.output_dir, "{}.npy".format(name))
+            renderer.render(args.frames, outputFile)
+            fps = renderer.getFramesPerSecond(args.frames)
+            print("{0:40s} {1:10.1f} {2:9.1f}x".format(os.path.basename(filename)[0:40], fps, fps / args.fps))
+        except Exception as e:
+            print("{0:40s} failed: {1}".format(os.path.basename(filename)[0:40], e))
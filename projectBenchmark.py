@@ -0,0 +1,147 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+from audioled import devices, project
+from filtergraphBenchmark import benchmarkConfigs, setupSyntheticAudio
+
+parser = argparse.ArgumentParser(description='MOLECOLE - Project execution backend benchmark')
+parser.add_argument(
+    '-N',
+    '--num_pixels',
+    dest='num_pixels',
+    type=int,
+    default=300,
+    help='number of pixels per device (default: 300)',
+)
+parser.add_argument(
+    '-D',
+    '--num_devices',
+    dest='num_devices',
+    type=int,
+    default=2,
+    help='number of output devices, each rendered by its own worker (default: 2)',
+)
+parser.add_argument(
+    '-F',
+    '--frames',
+    dest='frames',
+    type=int,
+    default=300,
+    help='number of measured frames per backend (default: 300)',
+)
+parser.add_argument(
+    '-C',
+    '--config',
+    dest='config',
+    default='movingLights',
+    choices=list(benchmarkConfigs.keys()),
+    help='config rendered on every device (default: movingLights)',
+)
+parser.add_argument(
+    '-B',
+    '--backend',
+    dest='backend',
+    default=None,
+    choices=list(project.executionBackends.keys()),
+    help='benchmark a single backend and print the result as JSON, default is comparing all backends',
+)
+
+
+class NullDevice(devices.LEDController):
+    """Output device discarding the pixels, so only rendering and synchronization is measured
+    """
+    def show(self, pixels):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def _childPids(pid):
+    pids = []
+    for path in glob.glob('/proc/{}/task/*/children'.format(pid)):
+        with open(path) as f:
+            pids.extend(int(child) for child in f.read().split())
+    return pids + [grandchild for child in pids for grandchild in _childPids(child)]
+
+
+def _memoryKb(pid):
+    """Returns the proportional set size of a process, pages shared after fork are split between processes
+
+    Falls back to the resident set size on kernels without smaps_rollup.
+    """
+    for path, key in [('/proc/{}/smaps_rollup', 'Pss:'), ('/proc/{}/status', 'VmRSS:')]:
+        try:
+            with open(path.format(pid)) as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1])
+        except (IOError, OSError):
+            continue
+    return 0
+
+
+def getMemoryKb():
+    """Returns the memory of this process and all its children in kB and the number of processes
+    """
+    pids = [os.getpid()] + _childPids(os.getpid())
+    return sum(_memoryKb(pid) for pid in pids), len(pids)
+
+
+def benchmark(backend, config, num_pixels, num_devices, frames, dt=1. / 60):
+    setupSyntheticAudio()
+    project.Project.defaultBackend = backend
+    proj = project.Project()
+    proj.setFiltergraphForSlot(0, benchmarkConfigs[config]())
+    proj.setDevice(devices.MultiOutputWrapper([NullDevice(num_pixels) for _ in range(num_devices)]))
+    # Warm up
+    for _ in range(min(50, frames)):
+        proj.update(dt)
+    timings = np.zeros(frames)
+    for i in range(frames):
+        start = timer()
+        proj.update(dt)
+        timings[i] = timer() - start
+    memory, processes = getMemoryKb()
+    stats = proj.getFrameSyncStats()
+    proj.stopProcessing()
+    proj._workerPool.shutdown()
+    return {
+        'backend': backend,
+        'memoryKb': memory,
+        'processes': processes,
+        'avgMs': np.mean(timings) * 1000,
+        'p95Ms': np.percentile(timings, 95) * 1000,
+        'missedWorkerFrames': sum(stats['workers'].values()),
+        'missedOutputFrames': sum(stats['outputs'].values()),
+    }
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.backend is not None:
+        result = benchmark(args.backend, args.config, args.num_pixels, args.num_devices, args.frames)
+        print(json.dumps(result))
+        sys.exit(0)
+    # Every backend runs in a fresh interpreter, so memory of one run doesn't count for the other
+    print("{} devices with {} pixels, config {}, {} frames, {} cpus".format(
+        args.num_devices, args.num_pixels, args.config, args.frames, os.cpu_count()))
+    header = ("backend", "processes", "memory MB", "avg ms", "p95 ms", "missed")
+    print("{0:10s} {1:>10s} {2:>10s} {3:>10s} {4:>10s} {5:>8s}".format(*header))
+    for backend in sorted(project.executionBackends.keys()):
+        output = subprocess.check_output([
+            sys.executable, __file__, '--backend', backend, '--config', args.config, '--num_pixels',
+            str(args.num_pixels), '--num_devices', str(args.num_devices), '--frames', str(args.frames)
+        ])
+        # Workers print to the same output
+        result = json.loads([line for line in output.decode().splitlines() if line.startswith('{')][-1])
+        print("{0:10s} {1:10d} {2:10.1f} {3:10.3f} {4:10.3f} {5:8d}".format(
+            backend, result['processes'], result['memoryKb'] / 1024., result['avgMs'], result['p95Ms'],
+            result['missedWorkerFrames'] + result['missedOutputFrames']))
@@ -18,24 +18,19 @@ from flask import Flask, abort, jsonify, request, send_from_directory, redirect,
 from apscheduler.schedulers.background import BackgroundScheduler
 from werkzeug.serving import is_running_from_reloader
 
-from audioled import audio, effects, filtergraph, serverconfiguration, runtimeconfiguration, modulation, project
+from audioled import audio, effects, filtergraph, serverconfiguration, runtimeconfiguration, modulation, project, renderloop
 
 proj = None  # type: project.Project
 default_values = {}
 record_timings = False
 serverconfig = None
 
-POOL_TIME = 0.0  # Seconds
-
 # lock to control access to variable
 dataLock = threading.Lock()
-# thread handler
-ledThread = threading.Thread()
-stop_signal = False
+# render loop calling processLED
+render_loop = None  # type: renderloop.RenderLoop
+target_fps = 60.
 event_loop = None
-# timing
-current_time = None
-last_time = None
 # errors
 errors = []
 # count
@@ -71,12 +66,11 @@ def create_app():
 
     def interrupt():
         print('cancelling LED thread')
-        global ledThread
+        global render_loop
         global proj
-        # stop_signal = True
         try:
             proj.stopProcessing()
-            ledThread.join()
+            render_loop.stop()
         except RuntimeError:
             pass
 
@@ -104,14 +98,27 @@ def create_app():
         nodes = [node for node in fg.getNodes()]
         return jsonpickle.encode(nodes)
 
+    @app.route('/slot/<int:slotId>/timings', methods=['GET'])
+    def slot_slotId_timings_get(slotId):
+        global proj
+        return jsonpickle.encode(proj.getSlotTimings(slotId))
+
+    @app.route('/slot/<int:slotId>/timings', methods=['PUT'])
+    def slot_slotId_timings_update(slotId):
+        global proj
+        if not request.json or 'enabled' not in request.json:
+            abort(400)
+        proj.setSlotRecordTimings(slotId, bool(request.json['enabled']))
+        return "OK"
+
     @app.route('/slot/<int:slotId>/node/<nodeUid>', methods=['GET'])
     def slot_slotId_node_uid_get(slotId, nodeUid):
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            node = next(node for node in fg.getNodes() if node.uid == nodeUid)
+            node = fg.getNode(nodeUid)
             return jsonpickle.encode(node)
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node/<nodeUid>', methods=['DELETE'])
@@ -119,10 +126,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            node = next(node for node in fg.getNodes() if node.uid == nodeUid)
-            fg.removeEffectNode(node.uid)
+            fg.removeEffectNode(nodeUid)
             return "OK"
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node/<nodeUid>', methods=['PUT'])
@@ -135,7 +141,7 @@ def create_app():
             print(request.json)
             node = fg.updateNodeParameter(nodeUid, request.json)
             return jsonpickle.encode(node)
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node/<nodeUid>/parameterDefinition', methods=['GET'])
@@ -143,9 +149,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            node = next(node for node in fg.getNodes() if node.uid == nodeUid)
+            node = fg.getNode(nodeUid)
             return json.dumps(node.effect.getParameterDefinition())
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node/<nodeUid>/modulateableParameters', methods=['GET'])
@@ -153,9 +159,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            node = next(node for node in fg.getNodes() if node.uid == nodeUid)
+            node = fg.getNode(nodeUid)
             return json.dumps(node.effect.getModulateableParameters())
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node/<nodeUid>/effect', methods=['GET'])
@@ -163,9 +169,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            node = next(node for node in fg.getNodes() if node.uid == nodeUid)
+            node = fg.getNode(nodeUid)
             return json.dumps(getFullClassName(node.effect))
-        except StopIteration:
+        except KeyError:
             abort(404, "Node not found")
 
     @app.route('/slot/<int:slotId>/node', methods=['POST'])
@@ -221,11 +227,10 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            connection = next(connection for connection in fg.getConnections() if connection.uid == connectionUid)
-            fg.removeConnection(connection.uid)
+            fg.removeConnection(connectionUid)
             return "OK"
-        except StopIteration:
-            abort(404, "Node not found")
+        except KeyError:
+            abort(404, "Connection not found")
 
     @app.route('/slot/<int:slotId>/modulationSources', methods=['GET'])
     def slot_slotId_modulationSources_get(slotId):
@@ -239,10 +244,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            mod = next(mod for mod in fg.getModulationSources() if mod.uid == modulationSourceUid)
-            fg.removeModulationSource(mod.uid)
+            fg.removeModulationSource(modulationSourceUid)
             return "OK"
-        except StopIteration:
+        except KeyError:
             abort(404, "Modulation Source not found")
 
     @app.route('/slot/<int:slotId>/modulationSource/<modulationUid>', methods=['PUT'])
@@ -255,7 +259,7 @@ def create_app():
             print(request.json)
             mod = fg.updateModulationSourceParameter(modulationUid, request.json)
             return jsonpickle.encode(mod)
-        except StopIteration:
+        except KeyError:
             abort(404, "Modulation not found")
 
     @app.route('/slot/<int:slotId>/modulationSource/<modulationSourceUid>', methods=['GET'])
@@ -263,9 +267,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            mod = next(mod for mod in fg.getModulationSources() if mod.uid == modulationSourceUid)
+            mod = fg.getModulationSource(modulationSourceUid)
             return jsonpickle.encode(mod)
-        except StopIteration:
+        except KeyError:
             abort(404, "Modulation Source not found")
 
     @app.route('/slot/<int:slotId>/modulations', methods=['GET'])
@@ -299,9 +303,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            mod = next(mod for mod in fg.getModulations() if mod.uid == modulationUid)
+            mod = fg.getModulation(modulationUid)
             return jsonpickle.encode(mod)
-        except StopIteration:
+        except KeyError:
             abort(404, "Modulation not found")
 
     @app.route('/slot/<int:slotId>/modulation/<modulationUid>', methods=['PUT'])
@@ -314,7 +318,7 @@ def create_app():
             print(request.json)
             mod = fg.updateModulationParameter(modulationUid, request.json)
             return jsonpickle.encode(mod)
-        except StopIteration:
+        except KeyError:
             abort(404, "Modulation not found")
 
     @app.route('/slot/<int:slotId>/modulation/<modulationUid>', methods=['DELETE'])
@@ -322,13 +326,9 @@ def create_app():
         global proj
         fg = proj.getSlot(slotId)  # type: filtergraph.FilterGraph
         try:
-            mod = next(mod for mod in fg.getModulations() if mod.uid == modulationUid)
-            if mod is not None:
-                fg.removeModulation(modulationUid)
-                return "OK"
-            else:
-                abort(404, "Modulation not found")
-        except StopIteration:
+            fg.removeModulation(modulationUid)
+            return "OK"
+        except KeyError:
             abort(404, "Modulation not found")
 
     @app.route('/slot/<int:slotId>/configuration', methods=['GET'])
@@ -451,7 +451,10 @@ def create_app():
             abort(400)
         value = request.json['slot']
         # print("Activating slot {}".format(value))
-        proj.activateScene(value)
+        try:
+            proj.activateScene(value, request.json.get('transitionDuration'), request.json.get('transitionCurve'))
+        except ValueError as e:
+            abort(400, str(e))
         # proj.previewSlot(value)
         return "OK"
 
@@ -488,6 +491,99 @@ def create_app():
         global proj
         return json.dumps(proj.getSceneMatrix())
 
+    @app.route('/project/trace', methods=['PUT'])
+    def project_trace_put():
+        global proj
+        if not request.json or 'enabled' not in request.json:
+            abort(400)
+        proj.setTracing(bool(request.json['enabled']))
+        return "OK"
+
+    @app.route('/project/trace', methods=['GET'])
+    def project_trace_get():
+        global proj
+        return json.dumps(proj.getTrace())
+
+    @app.route('/project/pipeline', methods=['PUT'])
+    def project_pipeline_put():
+        global proj
+        if not request.json or 'depth' not in request.json:
+            abort(400)
+        try:
+            proj.setPipelineDepth(int(request.json['depth']))
+        except ValueError as e:
+            abort(400, str(e))
+        return "OK"
+
+    @app.route('/project/pipeline', methods=['GET'])
+    def project_pipeline_get():
+        global proj
+        return jsonify(proj.getFrameSyncStats())
+
+    @app.route('/project/transition', methods=['PUT'])
+    def project_transition_put():
+        global proj
+        if not request.json or 'duration' not in request.json:
+            abort(400)
+        try:
+            proj.setTransition(float(request.json['duration']), request.json.get('curve', 'linear'))
+        except ValueError as e:
+            abort(400, str(e))
+        return "OK"
+
+    @app.route('/project/transition', methods=['GET'])
+    def project_transition_get():
+        global proj
+        return jsonify({
+            'duration': proj.transitionDuration,
+            'curve': proj.transitionCurve,
+            'curves': sorted(project.transitionCurves.keys()),
+        })
+
+    @app.route('/project/cpu', methods=['PUT'])
+    def project_cpu_put():
+        global proj
+        if not request.json:
+            abort(400)
+        value = {
+            'workerCores': request.json.get('workerCores'),
+            'outputCores': request.json.get('outputCores'),
+            'blasThreads': int(request.json.get('blasThreads', 1)),
+            'outputNiceness': request.json.get('outputNiceness'),
+        }
+        try:
+            proj.setCpuBudget(**value)
+        except ValueError as e:
+            abort(400, str(e))
+        project.Project.defaultCpuBudget = value
+        return "OK"
+
+    @app.route('/project/cpu', methods=['GET'])
+    def project_cpu_get():
+        global proj
+        return jsonify(proj.getCpuLayout())
+
+    @app.route('/project/backend', methods=['PUT'])
+    def project_backend_put():
+        global proj
+        if not request.json or 'backend' not in request.json:
+            abort(400)
+        try:
+            proj.setBackend(request.json['backend'])
+        except ValueError as e:
+            abort(400, str(e))
+        # Projects activated later use the same backend
+        project.Project.defaultBackend = proj.getBackend()
+        return "OK"
+
+    @app.route('/project/backend', methods=['GET'])
+    def project_backend_get():
+        global proj
+        return jsonify({
+            'backend': proj.getBackend(),
+            'backends': sorted(project.executionBackends.keys()),
+        })
+
     @app.route('/project/assets/<path:path>', methods=['GET'])
     def project_assets_get(path):
         global serverconfig
@@ -613,22 +709,15 @@ def create_app():
 
         abort(404)
 
-    def processLED():
+    def processLED(dt):
         global proj
-        global ledThread
-        global stop_signal
         global event_loop
-        global last_time
-        global current_time
         global errors
         global count
         global record_timings
-        dt = 0
+        start_time = timer()
         try:
             with dataLock:
-                last_time = current_time
-                current_time = timer()
-                dt = current_time - last_time
                 count = count + 1
                 if event_loop is None:
                     event_loop = asyncio.new_event_loop()
@@ -650,30 +739,36 @@ def create_app():
             print("Unknown error: {}".format(e))
             traceback.print_tb(e.__traceback__)
         finally:
-            # Set the next thread to happen
-            real_process_time = timer() - current_time
-            timeToWait = max(POOL_TIME, 0.01 - real_process_time)
             if count == 100:
                 if record_timings:
                     proj.getSlot(proj.activeSlotId).printProcessTimings()
                     proj.getSlot(proj.activeSlotId).printUpdateTimings()
-                    print("Process time: {}".format(real_process_time))
-                    print("Waiting {}".format(timeToWait))
+                    print("Process time: {}".format(timer() - start_time))
+                    print("Render loop: {}".format(render_loop.getStats()))
                 count = 0
-            if not stop_signal:
-                ledThread = threading.Timer(timeToWait, processLED, ())
-                ledThread.start()
 
     def startLEDThread():
-        # Do initialisation stuff here
-        global ledThread
-        global last_time
-        global current_time
-        # Create your thread
-        current_time = timer()
-        ledThread = threading.Timer(POOL_TIME, processLED, ())
+        global render_loop
+        render_loop = renderloop.RenderLoop(processLED, target_fps)
         print('starting LED thread')
-        ledThread.start()
+        render_loop.start()
+
+    @app.route('/renderloop', methods=['GET'])
+    def renderloop_get():
+        global render_loop
+        return jsonify(render_loop.getStats())
+
+    @app.route('/renderloop', methods=['PUT'])
+    def renderloop_put():
+        global render_loop
+        if not request.json or 'fps' not in request.json:
+            abort(400)
+        try:
+            render_loop.setFps(float(request.json['fps']))
+        except ValueError as e:
+            abort(400, str(e))
+        render_loop.resetStats()
+        return "OK"
 
     # Initiate
 
@@ -758,6 +853,8 @@ if __name__ == '__main__':
 
     if args.process_timing:
         record_timings = True
+    target_fps = args.fps
+    project.Project.defaultBackend = args.backend
 
     # Adjust from configuration
 
@@ -775,7 +872,13 @@ if __name__ == '__main__':
     if args.strand:
         strandTest(serverconfig.createOutputDevice(), serverconfig.getConfiguration(serverconfiguration.CONFIG_NUM_PIXELS))
 
-    # Initialize project
+    # Initialize project, the CPU budget is applied when it starts processing
+    project.Project.defaultCpuBudget = {
+        'workerCores': runtimeconfiguration.parseCores(args.worker_cores),
+        'outputCores': runtimeconfiguration.parseCores(args.output_cores),
+        'blasThreads': args.blas_threads,
+        'outputNiceness': args.output_niceness,
+    }
     proj = serverconfig.getActiveProjectOrDefault()
 
     # Init defaults
@@ -786,4 +889,5 @@ if __name__ == '__main__':
     app.run(debug=False, host="0.0.0.0", port=args.port)
     print("End of server main")
     proj.stopProcessing()
-    stop_signal = True
+    if render_loop is not None:
+        render_loop.stop()
@@ -0,0 +1,105 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import unittest
+import numpy as np
+from audioled import analysis, dsp, effect
+
+
+class Test_AudioAnalysis(unittest.TestCase):
+    def test_identicalRequests_computedOnce(self):
+        buffer = effect.AudioBuffer(48000)
+        buffer.audio = np.random.uniform(-0.5, 0.5, 800)
+        peak = buffer.getFeature('peak', 50., 200.)
+        self.assertEqual(buffer.getFeature('peak', 50., 200.), peak)
+        buffer.getFeature('rms', 50., 200.)
+        # peak, rms and the shared bandpass
+        self.assertEqual(buffer.analysis.getStats()['computed'], 3)
+        self.assertEqual(buffer.analysis.getStats()['requested'], 5)
+
+    def test_newAudio_startsNewFrame(self):
+        buffer = effect.AudioBuffer(48000)
+        buffer.audio = np.ones(4) * 0.5
+        self.assertEqual(buffer.getFeature('peak', None, None), 0.5)
+        buffer.audio = np.ones(4) * 0.25
+        self.assertEqual(buffer.getFeature('peak', None, None), 0.25)
+
+    def test_bandpass_keepsStateAcrossFrames(self):
+        audio = np.random.uniform(-0.5, 0.5, 1600)
+        buffer = effect.AudioBuffer(48000)
+        bandpass = dsp.Bandpass(50., 200., 48000)
+        for chunk in np.split(audio, 2):
+            buffer.audio = chunk
+            np.testing.assert_array_almost_equal(buffer.getFeature('bandpass', 50., 200.),
+                                                 bandpass.filter(chunk, 48000))
+
+    def test_unusedState_dropped(self):
+        audioAnalysis = analysis.AudioAnalysis()
+        audioAnalysis.setAudio(np.zeros(4), 48000)
+        audioAnalysis.get('bandpass', 50., 200.)
+        for _ in range(analysis.AudioAnalysis.maxStateAge + 1):
+            audioAnalysis.setAudio(np.zeros(4), 48000)
+        self.assertEqual(audioAnalysis.getStats()['states'], 0)
+
+    def test_unknownFeature_raises(self):
+        with self.assertRaises(ValueError):
+            analysis.AudioAnalysis().get('loudness')
+
+
+class Test_FilterRegistry(unittest.TestCase):
+    def test_capturedChunk_filteredOnce(self):
+        audio = np.random.uniform(-0.5, 0.5, 1600)
+        bandpass = dsp.Bandpass(50., 300., 48000)
+        buffers = [effect.AudioBuffer(48000) for _ in range(3)]
+        for sequence, chunk in enumerate(np.split(audio, 2), 1):
+            expected = bandpass.filter(chunk, 48000)
+            for buffer in buffers:
+                source = analysis.Source(('test_filteredOnce', 0), chunk, 2., sequence, 1)
+                buffer.setAudio(chunk * 2., source)
+                np.testing.assert_array_almost_equal(buffer.getFeature('bandpass', 50., 300.), expected * 2.)
+
+    def test_multipleChunks_filteredInOrder(self):
+        registry = analysis.FilterRegistry()
+        key = (0, 50., 300., 3, 48000)
+        chunks = np.split(np.random.uniform(-0.5, 0.5, 2400), 3)
+        bandpass = dsp.Bandpass(50., 300., 48000)
+        expected = np.concatenate([bandpass.filter(chunk, 48000) for chunk in chunks])
+        registry.filter(key, chunks[0], 1)
+        # A reader of the last two chunks gets the kept output of the first one
+        filtered = registry.filter(key, np.concatenate(chunks[1:]), 3, numChunks=2)
+        self.assertEqual(registry.getStats()['computed'], 3)
+        np.testing.assert_array_almost_equal(filtered, expected[800:])
+        np.testing.assert_array_almost_equal(registry.filter(key, chunks[2], 3), expected[1600:])
+        self.assertEqual(registry.getStats()['computed'], 3)
+
+    def test_unusedFilter_dropped(self):
+        registry = analysis.FilterRegistry()
+        registry.filter((0, 50., 300., 3, 48000), np.zeros(4), 1)
+        registry.filter((0, 20., 60., 3, 48000), np.zeros(4), analysis.FilterRegistry.maxAge + 2)
+        self.assertEqual(registry.getStats()['filters'], 1)
+
+    def test_restartedSequence_resetsFilter(self):
+        registry = analysis.FilterRegistry()
+        key = (0, 50., 300., 3, 48000)
+        chunks = np.split(np.random.uniform(-0.5, 0.5, 1600), 4)
+        for sequence in range(1, 41):
+            registry.filter(key, chunks[0], sequence)
+        # New ring buffer, sequence numbers start at 1 again
+        bandpass = dsp.Bandpass(50., 300., 48000)
+        for sequence, chunk in enumerate(chunks[1:], 1):
+            np.testing.assert_array_almost_equal(registry.filter(key, chunk, sequence), bandpass.filter(chunk, 48000))
+
+    def test_laggingReader_keepsFilter(self):
+        registry = analysis.FilterRegistry()
+        key = (0, 50., 300., 3, 48000)
+        chunks = np.split(np.random.uniform(-0.5, 0.5, 1600), 4)
+        for sequence, chunk in enumerate(chunks, 1):
+            registry.filter(key, chunk, sequence)
+        filtered = registry.filter(key, chunks[1], 2)
+        self.assertEqual(registry.getStats()['computed'], 4)
+        self.assertTrue(np.any(filtered != 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
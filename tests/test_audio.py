@@ -0,0 +1,161 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import asyncio
+import multiprocessing as mp
+import threading
+import time
+import unittest
+import numpy as np
+from audioled import audio
+
+
+def readerProcess(ring, resultQueue):
+    chunk = ring.read()
+    resultQueue.put((ring.getSequence(), chunk.tolist()))
+
+
+class Test_AudioRingBuffer(unittest.TestCase):
+    def test_emptyRing_readsNone(self):
+        ring = audio.AudioRingBuffer(4)
+        self.assertIsNone(ring.read())
+
+    def test_read_returnsLatestChunkWithoutCopy(self):
+        ring = audio.AudioRingBuffer(4, numChunks=3)
+        ring.write(np.array([1., 2., 3., 4.], dtype=np.float32))
+        written = ring.write(np.array([5., 6.]))
+        chunk = ring.read()
+        np.testing.assert_array_equal(chunk, [5., 6.])
+        self.assertTrue(np.shares_memory(chunk, written))
+        self.assertEqual(ring.getSequence(), 2)
+
+    def test_readLatest_returnsSequence(self):
+        ring = audio.AudioRingBuffer(2)
+        self.assertEqual(ring.readLatest(), (None, 0))
+        ring.write(np.zeros(2))
+        ring.write(np.ones(2))
+        chunk, sequence = ring.readLatest()
+        np.testing.assert_array_equal(chunk, [1., 1.])
+        self.assertEqual(sequence, 2)
+
+    def test_skippedChunks_countedAsDropped(self):
+        ring = audio.AudioRingBuffer(2, numChunks=4)
+        ring.write(np.zeros(2))
+        ring.read()
+        ring.read()
+        self.assertEqual(ring.droppedChunks, 0)
+        for i in range(3):
+            ring.write(np.ones(2) * i)
+        np.testing.assert_array_equal(ring.read(), [2., 2.])
+        self.assertEqual(ring.droppedChunks, 2)
+        self.assertEqual(ring.getStats(), {'sequence': 4, 'dropped': 2})
+
+    def test_readSince_returnsAllChunksAsOneView(self):
+        ring = audio.AudioRingBuffer(2, numChunks=4)
+        for i in range(1, 6):
+            ring.write(np.ones(2) * i, timestamp=i / 10.)
+        samples, timestamps, sequence = ring.readSince(3)
+        self.assertEqual(samples.dtype, np.float32)
+        np.testing.assert_array_equal(samples, [4., 4., 5., 5.])
+        np.testing.assert_array_almost_equal(timestamps, [0.4, 0.5])
+        self.assertTrue(np.shares_memory(samples, ring._chunks))
+        self.assertEqual(sequence, 5)
+        # Chunks already overwritten are dropped
+        samples, _, _ = ring.readSince(1)
+        np.testing.assert_array_equal(samples, [3., 3., 4., 4., 5., 5.])
+        self.assertEqual(ring.droppedChunks, 1)
+        self.assertEqual(len(ring.readSince(5)[0]), 0)
+
+    def test_readLast_returnsLatestFrames(self):
+        ring = audio.AudioRingBuffer(4, numChunks=8, numChannels=2)
+        ring.write(np.arange(4))
+        ring.write(np.arange(4, 8))
+        np.testing.assert_array_equal(ring.readLast(3), [2., 3., 4., 5., 6., 7.])
+        np.testing.assert_array_equal(ring.readLast(10), np.arange(8))
+
+    def test_readerProcess_seesWrittenChunk(self):
+        ring = audio.AudioRingBuffer(3)
+        ring.write(np.array([0.5, 0.25, 0.125]))
+        resultQueue = mp.Queue()
+        p = mp.Process(target=readerProcess, args=(ring, resultQueue))
+        p.start()
+        sequence, chunk = resultQueue.get(timeout=10)
+        p.join()
+        self.assertEqual(sequence, 1)
+        self.assertEqual(chunk, [0.5, 0.25, 0.125])
+
+
+class Test_GlobalAudio(unittest.TestCase):
+    def tearDown(self):
+        audio.GlobalAudio.setFrameAudio(None)
+        audio.GlobalAudio.buffer = None
+        audio.GlobalAudio._captured = None
+
+    def test_frameAudio_localToThread(self):
+        captured = np.zeros(4)
+        audio.GlobalAudio._captured = (captured, 7)
+        audio.GlobalAudio.buffer = captured
+        frameAudio = np.ones(4)
+        results = []
+
+        def worker():
+            audio.GlobalAudio.setFrameAudio(frameAudio, 3)
+            results.append(audio.GlobalAudio.getFrameAudio())
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIs(results[0][0], frameAudio)
+        self.assertEqual(results[0][1], 3)
+        self.assertEqual(audio.GlobalAudio.getFrameAudio(), (captured, 7))
+
+    def test_captureTime_inPerfCounterClock(self):
+        before = time.perf_counter()
+        # Stream clock far from perf_counter, 10ms input latency
+        captureTime = audio.GlobalAudio._captureTime(480, {'input_buffer_adc_time': 1000.0, 'current_time': 1000.01})
+        self.assertAlmostEqual(captureTime, before - 0.01, delta=0.005)
+        # No ADC time reported
+        audio.GlobalAudio.sample_rate = 48000
+        try:
+            captureTime = audio.GlobalAudio._captureTime(480, {'input_buffer_adc_time': 0., 'current_time': 0.})
+        finally:
+            audio.GlobalAudio.sample_rate = None
+        self.assertAlmostEqual(captureTime, before - 0.01, delta=0.005)
+
+    def test_uncapturedBuffer_withoutSequence(self):
+        audio.GlobalAudio._captured = (np.zeros(4), 7)
+        audio.GlobalAudio.buffer = np.ones(4)
+        buffer, sequence = audio.GlobalAudio.getFrameAudio()
+        self.assertIs(buffer, audio.GlobalAudio.buffer)
+        self.assertIsNone(sequence)
+
+
+class Test_AudioInput(unittest.TestCase):
+    def tearDown(self):
+        audio.GlobalAudio.ringBuffer = None
+
+    def test_lossless_outputsAllChunksSinceLastFrame(self):
+        ring = audio.AudioRingBuffer(2, numChunks=8)
+        audio.GlobalAudio.ringBuffer = ring
+        audioInput = audio.AudioInput(num_channels=1, lossless=True)
+        loop = asyncio.new_event_loop()
+        try:
+            ring.write(np.zeros(2))
+            # The first frame starts with the latest chunk
+            loop.run_until_complete(audioInput.update(0.02))
+            np.testing.assert_array_equal(audioInput._buffer, [0., 0.])
+            self.assertEqual(audioInput._sequence, 1)
+            for i in range(1, 4):
+                ring.write(np.ones(2) * i)
+            loop.run_until_complete(audioInput.update(0.02))
+            np.testing.assert_array_equal(audioInput._buffer, [1., 1., 2., 2., 3., 3.])
+            self.assertEqual(audioInput._sequence, 4)
+            self.assertEqual(audioInput._chunkSequence, 4)
+            self.assertEqual(audioInput._numChunks, 3)
+        finally:
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import unittest
+from audioled import cpubudget
+
+
+class Test_CpuBudget(unittest.TestCase):
+    def test_defaultLayout_separatesOutputCore(self):
+        available = cpubudget.getAvailableCores()
+        budget = cpubudget.CpuBudget()
+        self.assertEqual(budget.outputCores, available[:1])
+        if len(available) > 1:
+            self.assertEqual(budget.workerCores, available[1:])
+        else:
+            self.assertEqual(budget.workerCores, available)
+
+    def test_unavailableCore_raises(self):
+        with self.assertRaises(ValueError):
+            cpubudget.CpuBudget(workerCores=[max(cpubudget.getAvailableCores()) + 1])
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), "CPU affinity not supported on this platform")
+    def test_workers_placedRoundRobin(self):
+        available = cpubudget.getAvailableCores()
+        budget = cpubudget.CpuBudget(workerCores=available, outputCores=available)
+        previousAffinity = os.sched_getaffinity(0)
+        try:
+            for deviceId in range(len(available) + 1):
+                budget.placeWorker(os.getpid(), deviceId)
+                self.assertEqual(os.sched_getaffinity(0), {available[deviceId % len(available)]})
+        finally:
+            os.sched_setaffinity(0, previousAffinity)
+        layout = budget.getLayout()
+        self.assertEqual(layout['processes'][str(os.getpid())]['device'], len(available))
+        budget.reset()
+        self.assertEqual(budget.getLayout()['processes'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
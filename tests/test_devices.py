@@ -0,0 +1,48 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import multiprocessing as mp
+import unittest
+import numpy as np
+from audioled import devices
+
+
+def showProcess(q):
+    virtualOutput = q.get()
+    virtualOutput.setFrameIndex(1)
+    virtualOutput.show(np.full((3, 2), 42))
+
+
+class Test_VirtualOutput(unittest.TestCase):
+    def test_framesWrittenToAlternatingBanks(self):
+        realDevice = devices.LEDController(num_pixels=4)
+        lock = mp.Lock()
+        array = devices.createSharedPixelArray(realDevice.getNumPixels())
+        first = devices.VirtualOutput(realDevice, 2, array, lock, start_index=0)
+        second = devices.VirtualOutput(realDevice, 2, array, lock, start_index=2)
+        self.assertEqual(first.getNumBanks(), devices.NUM_PIXEL_BANKS)
+        for frameIndex in [1, 2]:
+            for device in [first, second]:
+                device.setFrameIndex(frameIndex)
+                device.show(np.full((3, 2), frameIndex * 10 + device.start_index))
+        np.testing.assert_array_equal(first.getFramePixels(1), np.array([[10, 10, 12, 12]] * 3))
+        np.testing.assert_array_equal(first.getFramePixels(2), np.array([[20, 20, 22, 22]] * 3))
+        np.testing.assert_array_equal(first.getFramePixels(3), first.getFramePixels(1))
+
+    def test_sentByMessage_writesToSharedArray(self):
+        realDevice = devices.LEDController(num_pixels=2)
+        lock = mp.Lock()
+        virtualOutput = devices.VirtualOutput(realDevice, 2, devices.createSharedPixelArray(2), lock)
+        q = mp.Queue()
+        p = mp.Process(target=showProcess, args=(q, ))
+        p.start()
+        # Sent after process start, so the array can't be inherited
+        q.put(virtualOutput)
+        p.join(10)
+        np.testing.assert_array_equal(virtualOutput.getFramePixels(1), np.full((3, 2), 42))
+        np.testing.assert_array_equal(virtualOutput.getFramePixels(0), np.zeros((3, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
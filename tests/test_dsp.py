@@ -113,6 +113,44 @@ class TestDSP(unittest.TestCase):
         signal = np.array(list(signal))
         self.assertTrue((signal == 0).all())
 
+    def test_filter_bank_triangular(self):
+        """Verifies the filters of the sparse filterbank are triangles peaking at their center bin"""
+        filters, f = dsp.sparse_filter_bank(16, 1024, 12000, 261.0, 6000.0, 'bark')
+        self.assertEqual(filters.shape, (16, 513))
+        self.assertEqual(len(f), 16)
+        dense = filters.toarray()
+        self.assertTrue((dense >= 0).all())
+        self.assertTrue((dense.max(axis=1) == 1.0).all())
+        np.testing.assert_array_equal(dense, dsp.filter_bank(16, 1024, 12000, 261.0, 6000.0, 'bark')[0])
+
+    def test_warped_psd_sparse(self):
+        """Verifies the sparse product of warped_psd matches the dense filterbank"""
+        y = np.random.normal(size=1024)
+        filters, _ = dsp.filter_bank(24, 1024, 22050, 20.0, 11025.0, 'mel')
+        expected = filters.dot(dsp.power_spectrum(y))
+        np.testing.assert_allclose(dsp.warped_psd(y, 24, 22050, [20.0, 11025.0], 'mel'), expected)
+
+    def test_stft_rolling_window(self):
+        """Verifies the STFT frame is the hanning windowed rolling window of the downsampled chunks"""
+        stft = dsp.STFT(fs=48000, fmax=6000, n_overlaps=3)
+        self.assertEqual(stft.fs, 12000)
+        chunks = [np.random.uniform(-1, 1, 200) for _ in range(5)]
+        for chunk in chunks:
+            frame = stft.update(chunk)
+        # 3 chunks of 50 samples padded to 256
+        self.assertEqual(len(frame), 256)
+        window = np.concatenate([chunk[::4] for chunk in chunks[-3:]])
+        np.testing.assert_allclose(frame[:150], window * np.hanning(150))
+        self.assertTrue((frame[150:] == 0).all())
+        np.testing.assert_allclose(stft.spectrum(), dsp.power_spectrum(frame))
+
+    def test_stft_reuses_buffers(self):
+        stft = dsp.STFT(fs=1000, fmax=500, n_overlaps=2)
+        frame = stft.update(np.ones(3))
+        # Chunks of other lengths wrap around the circular buffer
+        self.assertIs(stft.update(np.ones(5)), frame)
+        np.testing.assert_allclose(frame[:6], np.hanning(6))
+
 
 if __name__ == '__main__':
     unittest.main()
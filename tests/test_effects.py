@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 import unittest
 import asyncio
+import numpy as np
 from audioled import effects, audio, audioreactive, colors, generative, panelize  # noqa: F401
 
 
@@ -52,6 +53,30 @@ class Test_Effects(unittest.TestCase):
                 print("Skipping {}".format(_class.__name__))
 
 
+class Test_Append(unittest.TestCase):
+    def _process(self, append, inputs):
+        append.setInputBuffer(inputs)
+        append.setOutputBuffer([None])
+        append.process()
+        return append._outputBuffer[0]
+
+    def test_shortInputs_paddedWithLastPixel(self):
+        append = effects.Append(num_channels=2, flip1=True)
+        append.setNumOutputPixels(6)
+        first = np.ones((3, 2))
+        second = np.array([[1., 2.], [3., 4.], [5., 6.]])
+        output = self._process(append, [first, second])
+        self.assertIs(output, append._getOutputPixelBuffer(0))
+        np.testing.assert_array_equal(output[0], [1., 1., 2., 1., 1., 1.])
+
+    def test_longInputs_keptCompletely(self):
+        append = effects.Append(num_channels=2)
+        append.setNumOutputPixels(4)
+        inputs = [np.ones((3, 3)), np.ones((3, 3)) * 2]
+        output = self._process(append, inputs)
+        np.testing.assert_array_equal(output, np.concatenate(inputs, axis=1))
+
+
 def inheritors(klass):
     subclasses = set()
     work = [klass]
@@ -2,8 +2,11 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import asyncio
 import unittest
-from audioled import filtergraph, devices
+import jsonpickle
+import numpy as np
+from audioled import filtergraph, devices, modulation, colors, effects, effect
 
 
 class Test_FilterGraph(unittest.TestCase):
@@ -130,6 +133,345 @@ class Test_FilterGraph(unittest.TestCase):
         self.assertEqual(n1._outputBuffer[0], 'test')
         self.assertEqual(n2._outputBuffer[1], 'test')
 
+    def test_executionPlan_diamondOrder(self):
+        fg = filtergraph.FilterGraph()
+        ef1 = MockEffect()
+        ef2 = MockEffect()
+        ef3 = MockEffect()
+        ef4 = MockEffect()
+        led = devices.LEDOutput()
+        led.setNumOutputPixels(100)
+        n1 = fg.addEffectNode(ef1)
+        n2 = fg.addEffectNode(ef2)
+        n3 = fg.addEffectNode(ef3)
+        n4 = fg.addEffectNode(ef4)
+        fg.addEffectNode(led)
+        fg.addConnection(ef1, 0, ef2, 0)
+        fg.addConnection(ef1, 1, ef3, 0)
+        fg.addConnection(ef2, 0, ef4, 0)
+        fg.addConnection(ef3, 0, ef4, 1)
+        fg.addConnection(ef4, 0, led, 0)
+        order = fg._getNodesInOrder()
+        self.assertEqual(len(order), 5)
+        self.assertTrue(order.index(n1) < order.index(n2) < order.index(n4))
+        self.assertTrue(order.index(n1) < order.index(n3) < order.index(n4))
+        self.assertEqual(ef1._num_pixels, 100)
+        levels = fg._getExecutionPlan().levels
+        self.assertEqual(levels[0], [n1])
+        self.assertEqual(set(levels[1]), set([n2, n3]))
+        self.assertEqual(levels[2], [n4])
+        self.assertEqual(len(levels), 4)
+
+    def test_parallelProcess_sameResultAsSerial(self):
+        results = []
+        for numThreads in [1, 4]:
+            fg = filtergraph.FilterGraph(numThreads=numThreads)
+            led = devices.LEDOutput()
+            fg.addEffectNode(led)
+            layers = []
+            for i in range(4):
+                color = colors.StaticRGBColor(r=10 * i, g=20, b=255 - 10 * i)
+                fg.addEffectNode(color)
+                layers.append(color)
+            while len(layers) > 1:
+                combine = effects.Combine(mode='lightenOnly')
+                fg.addEffectNode(combine)
+                fg.addConnection(layers.pop(0), 0, combine, 0)
+                fg.addConnection(layers.pop(0), 0, combine, 1)
+                layers.append(combine)
+            fg.addConnection(layers[0], 0, led, 0)
+            fg.propagateNumPixels(10)
+            self.assertEqual([len(level) for level in fg._getExecutionPlan().levels], [4, 2, 1, 1])
+            fg.update(0.01, asyncio.get_event_loop())
+            fg.process()
+            results.append(fg.getLEDOutput()._outputBuffer[0].copy())
+        np.testing.assert_array_equal(results[0], results[1])
+
+    def test_parallelProcess_sharedInputNotModifiedConcurrently(self):
+        results = []
+        for numThreads in [1, 4]:
+            fg = filtergraph.FilterGraph(numThreads=numThreads)
+            led = devices.LEDOutput()
+            fg.addEffectNode(led)
+            color = colors.StaticRGBColor(r=255, g=255, b=255)
+            colorNode = fg.addEffectNode(color)
+            # AfterGlow modifies its input, which is read by the mirror as well
+            afterGlow = effects.AfterGlow(glow_time=1.0)
+            afterGlowNode = fg.addEffectNode(afterGlow)
+            mirror = effects.Mirror()
+            mirrorNode = fg.addEffectNode(mirror)
+            append = effects.Append(num_channels=2)
+            fg.addEffectNode(append)
+            fg.addConnection(color, 0, afterGlow, 0)
+            fg.addConnection(color, 0, mirror, 0)
+            fg.addConnection(afterGlow, 0, append, 0)
+            fg.addConnection(mirror, 0, append, 1)
+            fg.addConnection(append, 0, led, 0)
+            fg.propagateNumPixels(10)
+            frames = []
+            for brightness in [255, 100, 50]:
+                fg.updateNodeParameter(colorNode.uid, {'r': brightness, 'g': brightness, 'b': brightness})
+                fg.update(0.1, asyncio.get_event_loop())
+                fg.process()
+                frames.append(fg.getLEDOutput()._outputBuffer[0].copy())
+            levels = fg._getExecutionPlan().levels
+            self.assertEqual(set(levels[1]), set([afterGlowNode, mirrorNode]))
+            batches = fg._splitSharedInputs(levels[1])
+            self.assertEqual([len(batch) for batch in batches], [1, 1])
+            results.append(frames)
+        np.testing.assert_array_equal(results[0], results[1])
+
+    def test_update_asyncEffectsDetected(self):
+        fg = filtergraph.FilterGraph(asyncUpdate=True)
+        asyncEffect = MockAsyncEffect()
+        color = colors.StaticRGBColor()
+        led = devices.LEDOutput()
+        n1 = fg.addEffectNode(asyncEffect)
+        n2 = fg.addEffectNode(color)
+        fg.addEffectNode(led)
+        fg.addConnection(asyncEffect, 0, led, 0)
+        fg.addConnection(color, 0, asyncEffect, 0)
+        fg.propagateNumPixels(10)
+        event_loop = asyncio.get_event_loop()
+        # First update is finished within the frame
+        fg.update(0.01, event_loop)
+        self.assertEqual(asyncEffect.numUpdates, 1)
+        self.assertTrue(n1._updatesAsync)
+        self.assertIs(n2._updatesAsync, False)
+        self.assertIs(fg.getLEDOutput()._updatesAsync, False)
+        # Further updates run on the update loop thread
+        fg.update(0.01, event_loop)
+        n1._pendingUpdate.result(timeout=1)
+        self.assertEqual(asyncEffect.numUpdates, 2)
+        fg.process()
+        self.assertEqual(fg.getLEDOutput()._outputBuffer[0].shape, (3, 10))
+
+    def test_executionPlan_onlyRebuiltOnTopologyChange(self):
+        fg = filtergraph.FilterGraph()
+        ef1 = MockEffect()
+        ef2 = MockEffect()
+        led = devices.LEDOutput()
+        led.setNumOutputPixels(100)
+        fg.addEffectNode(ef1)
+        n2 = fg.addEffectNode(ef2)
+        fg.addEffectNode(led)
+        con = fg.addConnection(ef1, 0, led, 0)
+        plan = fg._getExecutionPlan()
+        fg.propagateNumPixels(50)
+        self.assertIs(fg._getExecutionPlan(), plan)
+        self.assertEqual(ef1._num_pixels, 50)
+        fg.process()
+        self.assertIs(fg._getExecutionPlan(), plan)
+        # Unconnected node is not processed
+        self.assertNotIn(n2, fg._getNodesInOrder())
+        fg.removeConnection(con.uid)
+        self.assertIsNot(fg._getExecutionPlan(), plan)
+        self.assertEqual(len(fg._getNodesInOrder()), 1)
+
+    def test_uidLookup_works(self):
+        fg = filtergraph.FilterGraph()
+        ef1 = MockEffect()
+        ef2 = MockEffect()
+        n1 = fg.addEffectNode(ef1, uid='n1')
+        n2 = fg.addEffectNode(ef2)
+        self.assertIs(fg.getNode('n1'), n1)
+        # Uid assigned after adding is picked up
+        n2.uid = 'n2'
+        self.assertIs(fg.getNode('n2'), n2)
+        con = fg.addNodeConnection('n1', 0, 'n2', 0, uid='c1')
+        self.assertEqual(con.uid, 'c1')
+        self.assertIs(fg.getConnection('c1'), con)
+        self.assertEqual(n1._outgoingConnections, [con])
+        self.assertEqual(n2._incomingConnections, [con])
+        self.assertRaises(KeyError, fg.getNode, 'unknown')
+        self.assertRaises(KeyError, fg.getConnection, 'unknown')
+        self.assertRaises(KeyError, fg.removeConnection, 'unknown')
+        fg.removeEffectNode('n2')
+        self.assertEqual(n1._outgoingConnections, [])
+        self.assertEqual(fg.getConnections(), [])
+        self.assertRaises(KeyError, fg.getNode, 'n2')
+
+    def test_removeModulationSource_removesModulations(self):
+        fg = filtergraph.FilterGraph()
+        ef1 = MockEffect()
+        n1 = fg.addEffectNode(ef1)
+        modSource = fg.addModulationSource(modulation.ExternalLinearController())
+        mod = fg.addModulation(modSource.uid, n1.uid, uid='m1')
+        self.assertIs(fg.getModulationSource(modSource.uid), modSource)
+        self.assertIs(fg.getModulation('m1'), mod)
+        fg.updateModulationParameter('m1', {'amount': 0.5})
+        self.assertEqual(mod.amount, 0.5)
+        fg.removeModulationSource(modSource.uid)
+        self.assertEqual(fg.getModulations(), [])
+        self.assertEqual(fg.getModulationSources(), [])
+        self.assertRaises(KeyError, fg.updateModulationParameter, 'm1', {'amount': 0.5})
+        self.assertRaises(KeyError, fg.getModulation, 'm1')
+        self.assertRaises(KeyError, fg.getModulationSource, modSource.uid)
+
+    def test_modulations_summedAndClipped(self):
+        fg = filtergraph.FilterGraph()
+        color = colors.StaticRGBColor(r=100, g=100)
+        led = devices.LEDOutput()
+        n1 = fg.addEffectNode(color)
+        fg.addEffectNode(led)
+        fg.addConnection(color, 0, led, 0)
+        fg.propagateNumPixels(10)
+        source1 = fg.addModulationSource(modulation.ExternalLinearController(amount=0.5))
+        source2 = fg.addModulationSource(modulation.ExternalLinearController(amount=1.0))
+        fg.addModulation(source1.uid, n1.uid, 'r', amount=0.2)
+        mod2 = fg.addModulation(source2.uid, n1.uid, 'r', amount=0.05, inverted=True)
+        fg.addModulation(source2.uid, n1.uid, 'g', amount=1.0)
+        event_loop = asyncio.get_event_loop()
+        fg.update(0.01, event_loop)
+        self.assertAlmostEqual(color.r, 100 + 255 * (0.5 * 0.2 - 1.0 * 0.05))
+        self.assertEqual(color.g, 255)
+        self.assertAlmostEqual(color.getParameterOffset('r'), 0.05)
+        # Original value is used as base for the modulation
+        fg.updateNodeParameter(n1.uid, {'r': 50})
+        fg.update(0.01, event_loop)
+        self.assertAlmostEqual(color.r, 50 + 255 * 0.05)
+        # Remaining modulations are applied after removal
+        fg.removeModulation(mod2.uid)
+        self.assertEqual(color.r, 50)
+        fg.update(0.01, event_loop)
+        self.assertAlmostEqual(color.r, 50 + 255 * 0.1)
+        self.assertEqual(color.__getstate__()['r'], 50)
+
+    def test_snapshot_rebuildsGraphWithSameHash(self):
+        fg = filtergraph.FilterGraph()
+        color = colors.StaticRGBColor(r=100, g=100)
+        led = devices.LEDOutput()
+        n1 = fg.addEffectNode(color)
+        fg.addEffectNode(led)
+        fg.addConnection(color, 0, led, 0)
+        source = fg.addModulationSource(modulation.ExternalLinearController(amount=0.5))
+        fg.addModulation(source.uid, n1.uid, 'r', amount=0.2)
+        snapshot = fg.getSnapshot()
+        rebuilt = filtergraph.FilterGraph.fromSnapshot(snapshot)
+        self.assertEqual(filtergraph.getSnapshotHash(rebuilt.getSnapshot()), filtergraph.getSnapshotHash(snapshot))
+        self.assertEqual(rebuilt.getNode(n1.uid).effect.r, 100)
+        self.assertEqual(len(rebuilt.getConnections()), 1)
+        self.assertEqual(rebuilt.getModulations()[0].targetNode, rebuilt.getNode(n1.uid))
+        fg.updateNodeParameter(n1.uid, {'r': 50})
+        self.assertNotEqual(filtergraph.getSnapshotHash(fg.getSnapshot()), filtergraph.getSnapshotHash(snapshot))
+
+    def test_latencyHistogram_percentiles(self):
+        histogram = filtergraph.LatencyHistogram()
+        self.assertIsNone(histogram.getStats())
+        for i in range(1, 101):
+            histogram.record(i * 1e-4)
+        stats = histogram.getStats()
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['avg'], 50.5e-4)
+        self.assertEqual(stats['max'], 1e-2)
+        # Bucket resolution is 2**(1/8)
+        self.assertTrue(50e-4 <= stats['p50'] <= 50e-4 * 2**(1 / 8))
+        self.assertTrue(95e-4 <= stats['p95'] <= 95e-4 * 2**(1 / 8))
+        self.assertTrue(99e-4 <= stats['p99'] <= 1e-2)
+
+    def test_timings_onlyRecordedIfEnabled(self):
+        fg = filtergraph.FilterGraph()
+        color = colors.StaticRGBColor()
+        led = devices.LEDOutput()
+        n1 = fg.addEffectNode(color)
+        fg.addEffectNode(led)
+        fg.addConnection(color, 0, led, 0)
+        fg.propagateNumPixels(10)
+        event_loop = asyncio.get_event_loop()
+        fg.update(0.01, event_loop)
+        fg.process()
+        timings = fg.getTimings()
+        self.assertFalse(timings['enabled'])
+        self.assertIsNone(timings['frame'])
+        self.assertIsNone(timings['nodes'][n1.uid]['process'])
+        fg.setRecordTimings(True)
+        fg.frameBudget = 0
+        for i in range(3):
+            fg.update(0.01, event_loop)
+            fg.process()
+        timings = fg.getTimings()
+        self.assertEqual(timings['frame']['count'], 3)
+        self.assertEqual(timings['overruns'], 3)
+        self.assertEqual(timings['nodes'][n1.uid]['effect'], 'StaticRGBColor')
+        self.assertEqual(timings['nodes'][n1.uid]['update']['count'], 3)
+        self.assertEqual(timings['nodes'][n1.uid]['process']['count'], 3)
+
+    def test_uidLookup_afterSetState(self):
+        fg = filtergraph.FilterGraph()
+        ef1 = MockEffect()
+        ef2 = MockEffect()
+        n1 = fg.addEffectNode(ef1)
+        n2 = fg.addEffectNode(ef2)
+        con = fg.addConnection(ef1, 0, ef2, 0)
+        modSource = fg.addModulationSource(modulation.ExternalLinearController())
+        mod = fg.addModulation(modSource.uid, n2.uid)
+        restored = jsonpickle.decode(jsonpickle.encode(fg))
+        self.assertEqual(restored.getNode(n1.uid).uid, n1.uid)
+        restoredCon = restored.getConnections()[0]
+        self.assertEqual(restoredCon.uid, con.uid)
+        self.assertEqual(restored.getNode(n2.uid)._incomingConnections, [restoredCon])
+        self.assertEqual(restored.getModulationSource(modSource.uid).uid, modSource.uid)
+        self.assertEqual(restored.getModulation(mod.uid).targetNode, restored.getNode(n2.uid))
+        restored.updateModulationParameter(mod.uid, {'amount': 1.0})
+        restored.removeConnection(con.uid)
+        self.assertEqual(restored.getConnections(), [])
+
+    def test_bufferPool_inPlaceProcessing(self):
+        fg = filtergraph.FilterGraph()
+        color = colors.StaticRGBColor(r=10, g=20, b=30)
+        led = devices.LEDOutput(brightness=0.5)
+        n1 = fg.addEffectNode(color)
+        fg.addEffectNode(led)
+        fg.addConnection(color, 0, led, 0)
+        fg.propagateNumPixels(20)
+        event_loop = asyncio.get_event_loop()
+        fg.update(0.01, event_loop)
+        fg.process()
+        colorBuffer = n1._outputBuffer[0]
+        self.assertIs(colorBuffer, fg._bufferPool.getBuffer(n1, 0, 20))
+        self.assertEqual(colorBuffer.shape, (3, 20))
+        self.assertEqual(fg.getLEDOutput()._outputBuffer[0][2, 0], 15)
+        # Buffers are reused between frames
+        ledBuffer = fg.getLEDOutput()._outputBuffer[0]
+        fg.update(0.01, event_loop)
+        fg.process()
+        self.assertIs(n1._outputBuffer[0], colorBuffer)
+        self.assertIs(fg.getLEDOutput()._outputBuffer[0], ledBuffer)
+        # Reallocated with new number of pixels
+        fg.propagateNumPixels(30)
+        fg.update(0.01, event_loop)
+        fg.process()
+        self.assertEqual(n1._outputBuffer[0].shape, (3, 30))
+        self.assertEqual(fg.getLEDOutput()._outputBuffer[0].shape, (3, 30))
+
+
+class MockAsyncEffect(effect.Effect):
+    def __init__(self):
+        self.numUpdates = 0
+        self.__initstate__()
+
+    def numInputChannels(self):
+        return 1
+
+    def numOutputChannels(self):
+        return 1
+
+    @staticmethod
+    def getEffectDescription():
+        return "Passes its input through, awaiting in update."
+
+    async def update(self, dt):
+        await super().update(dt)
+        # Real asynchronous work needs a running event loop
+        asyncio.get_running_loop()
+        await asyncio.sleep(0.005)
+        self.numUpdates += 1
+
+    def process(self):
+        if self._outputBuffer is None or not self._inputBufferValid(0):
+            return
+        self._outputBuffer[0] = self._inputBuffer[0]
+
 
 class MockEffect(object):
     def __init__(self, outputValue=None):
@@ -0,0 +1,365 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+import unittest
+import numpy as np
+from audioled import colors, devices, effect, filtergraph, project
+
+
+def participantProcess(frameSync, syncIndex, frameIndex):
+    frameSync.signal(syncIndex, frameIndex)
+
+
+class RecordingDevice(devices.LEDController):
+    def __init__(self, num_pixels):
+        super().__init__(num_pixels)
+        self.shown = []
+
+    def show(self, pixels):
+        self.shown.append(pixels.copy())
+
+    def shutdown(self):
+        pass
+
+
+class SlowFrameCounter(effect.Effect):
+    """Outputs the sum of all dt as pixel value and takes longer than a frame to process
+    """
+    def __init__(self, duration=0.):
+        self.duration = duration
+        self.__initstate__()
+
+    def numInputChannels(self):
+        return 0
+
+    def numOutputChannels(self):
+        return 1
+
+    @staticmethod
+    def getEffectDescription():
+        return "Outputs the elapsed time slowly."
+
+    def process(self):
+        if self._outputBuffer is None:
+            return
+        time.sleep(self.duration)
+        self._outputBuffer[0] = np.full((3, self._num_pixels), self._t)
+
+
+class RecordingVirtualOutput(devices.VirtualOutput):
+    """Records the frame index and the pixels of every frame taken by the output
+    """
+    def __init__(self, device):
+        super().__init__(device, device.getNumPixels(), devices.createSharedPixelArray(device.getNumPixels()),
+                         mp.Lock())
+        self.shownFrames = []
+
+    def getFramePixels(self, frameIndex):
+        pixels = super().getFramePixels(frameIndex)
+        self.shownFrames.append((frameIndex, pixels[0, 0]))
+        return pixels
+
+
+class Test_FrameSync(unittest.TestCase):
+    def test_wait_returnsWhenAllParticipantsSignalled(self):
+        frameSync = project.FrameSync()
+        indices = [frameSync.register("device {}".format(i)) for i in range(2)]
+        frameSync.startFrame(1)
+        processes = [mp.Process(target=participantProcess, args=(frameSync, i, 1)) for i in indices]
+        for p in processes:
+            p.start()
+        frameSync.wait(1, 10.)
+        for p in processes:
+            p.join()
+        self.assertEqual(frameSync.getMissedFrames(), {'device 0': 0, 'device 1': 0})
+
+    def test_wait_reportsParticipantsMissingDeadline(self):
+        frameSync = project.FrameSync()
+        fast = frameSync.register("fast")
+        frameSync.register("slow")
+        frameSync.signal(fast, 1)
+        with self.assertRaises(project.FrameDeadlineMissed) as cm:
+            frameSync.wait(1, 0.01)
+        self.assertEqual(cm.exception.missed, ["slow"])
+        self.assertEqual(frameSync.getMissedFrames(), {'fast': 0, 'slow': 1})
+
+    def test_signalReady_usesCurrentFrame(self):
+        frameSync = project.FrameSync()
+        frameSync.startFrame(41)
+        index = frameSync.register("late")
+        frameSync.signalReady(index)
+        frameSync.wait(41, 0.01)
+
+    def test_unregisteredParticipant_notAwaited(self):
+        frameSync = project.FrameSync()
+        index = frameSync.register("removed")
+        frameSync.unregister(index)
+        frameSync.wait(1, 0.01)
+
+    def test_pipelinedWorker_rendersFrameProjectWaitsFor(self):
+        frameSync = project.FrameSync()
+        syncIndex = frameSync.register("worker")
+        event_loop = asyncio.new_event_loop()
+        state = project._WorkerState(filtergraph.FilterGraph(), RecordingDevice(4), 0, 0, None, None, frameSync,
+                                     syncIndex, project.FiltergraphCache(), None, event_loop)
+        try:
+            # Frame 5 started, the project still waits for frame 4 at pipeline depth 1
+            frameSync.startFrame(5, 1)
+            self.assertEqual(frameSync.getWaitIndex(), 4)
+            project._worker_updateMessage(state, project.UpdateMessage(0.1, 3))
+            self.assertEqual(state.skippedDt, 0.1)
+            project._worker_updateMessage(state, project.UpdateMessage(0.1, 4))
+            self.assertEqual(frameSync._frames[syncIndex], 4)
+            self.assertEqual(state.skippedDt, 0.)
+        finally:
+            event_loop.close()
+
+    def test_slowParticipant_waitBlocks(self):
+        frameSync = project.FrameSync()
+        fast = frameSync.register("fast")
+        slow = frameSync.register("slow")
+        # Releases of previous frames that were never waited for
+        for frameIndex in range(1, 1001):
+            frameSync.signal(fast, frameIndex)
+            frameSync.signal(slow, frameIndex)
+        frameSync.signal(fast, 1001)
+        acquires = []
+        done = frameSync._done
+
+        class CountingSemaphore(object):
+            def acquire(self, block=True, timeout=None):
+                if block:
+                    acquires.append(timeout)
+                return done.acquire(block, timeout)
+
+            def release(self):
+                done.release()
+
+        frameSync._done = CountingSemaphore()
+        timer = threading.Timer(0.05, frameSync.signal, args=(slow, 1001))
+        start = time.perf_counter()
+        timer.start()
+        frameSync.wait(1001, 10.)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.04)
+        self.assertLessEqual(len(acquires), 2)
+
+
+class Test_SceneTransition(unittest.TestCase):
+    def test_curves_startAtZeroAndEndAtOne(self):
+        for name, curve in project.transitionCurves.items():
+            self.assertAlmostEqual(curve(0.), 0., msg=name)
+            self.assertAlmostEqual(curve(1.), 1., msg=name)
+
+    def test_unknownCurve_raises(self):
+        with self.assertRaises(ValueError):
+            project.SceneTransition(1., 'bounce', 1)
+
+    def test_advance_recordsWeightPerFrame(self):
+        transition = project.SceneTransition(1., 'easeIn', 1)
+        self.assertFalse(transition.advance(0.5, 1))
+        self.assertTrue(transition.advance(0.5, 2))
+        self.assertIsNone(transition.getWeight(0))
+        self.assertAlmostEqual(transition.getWeight(1), 0.25)
+        self.assertIsNone(transition.getWeight(2))
+
+    def test_blend_mixesDeviceRegionOnly(self):
+        device = devices.LEDController(num_pixels=4)
+        output = devices.VirtualOutput(device, 2, devices.createSharedPixelArray(4), None, start_index=1)
+        staging = devices.VirtualOutput(device, 2, devices.createSharedPixelArray(4), None, start_index=1)
+        output.getFramePixels(3)[:] = 100.
+        staging.getFramePixels(3)[:] = 200.
+        project.DeviceTransition(None, None, output, staging).blend(3, 0.25)
+        np.testing.assert_array_equal(output.getFramePixels(3)[0], [100., 125., 125., 100.])
+        np.testing.assert_array_equal(output.getFramePixels(2)[0], [0., 0., 0., 0.])
+
+
+class Test_ParameterUpdates(unittest.TestCase):
+    def test_updates_coalescedPerParameter(self):
+        proj = project.Project()
+        fg = proj.getSlot(0)
+        node = fg.addEffectNode(colors.StaticRGBColor())
+        proj.previewSlot(0)
+        q = proj._publishQueue.register()
+        for value in [10., 20., 30.]:
+            fg.updateNodeParameter(node.uid, {'r': value})
+        fg.updateNodeParameter(node.uid, {'g': 5.})
+        proj._sendParameterUpdates()
+        proj._sendParameterUpdates()
+        message = q.get(timeout=1)
+        self.assertTrue(q.empty())
+        self.assertEqual(message.updates, [('node', 0, node.uid, {'r': 30., 'g': 5.})])
+
+    def test_pendingUpdates_sentBeforeNodeRemoved(self):
+        proj = project.Project()
+        fg = proj.getSlot(0)
+        node = fg.addEffectNode(colors.StaticRGBColor())
+        proj.previewSlot(0)
+        q = proj._publishQueue.register()
+        fg.updateNodeParameter(node.uid, {'r': 10.})
+        fg.removeEffectNode(node.uid)
+        self.assertIsInstance(q.get(timeout=1), project.ParameterUpdateMessage)
+        self.assertEqual(q.get(timeout=1).operation, 'remove')
+
+    def test_worker_appliesUpdatesOfItsSlot(self):
+        fg = filtergraph.FilterGraph()
+        node = fg.addEffectNode(colors.StaticRGBColor(r=1.))
+        message = project.ParameterUpdateMessage([('node', 0, node.uid, {'r': 2.}), ('node', 1, node.uid, {'r': 3.})])
+        project.worker_process_parameterUpdateMessage(fg, None, 0, message)
+        self.assertEqual(node.effect.r, 2.)
+
+
+class Test_FiltergraphCache(unittest.TestCase):
+    def test_leastRecentlyUsedEvicted(self):
+        cache = project.FiltergraphCache(maxSize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 1)
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+
+    def test_cachedGraph_sentAsHash(self):
+        proj = project.Project()
+        fg = proj.getSlot(0)
+        node = fg.addEffectNode(colors.StaticRGBColor())
+        fg.addEffectNode(colors.StaticRGBColor(r=1.))
+        other = proj.getSlot(1)
+        poolWorker = project.PoolWorker(None, None, None, None)
+        graphHash, snapshot = proj._getGraphForWorker(poolWorker, 0, fg)
+        self.assertIsNotNone(snapshot)
+        proj._getGraphForWorker(poolWorker, 1, other)
+        self.assertEqual(proj._getGraphForWorker(poolWorker, 0, fg), (graphHash, None))
+        # Modified graphs are sent again
+        proj._filtergraphProcesses[0] = poolWorker
+        proj.previewSlot(0)
+        proj._publishQueue.register()
+        fg.removeEffectNode(node.uid)
+        self.assertIsNotNone(proj._getGraphForWorker(poolWorker, 0, fg)[1])
+
+    def test_worker_cachesGraphsByHash(self):
+        cache = project.FiltergraphCache()
+        fg = filtergraph.FilterGraph()
+        fg.addEffectNode(colors.StaticRGBColor())
+        snapshot = fg.getSnapshot()
+        graphHash = filtergraph.getSnapshotHash(snapshot)
+        rebuilt = project._getFiltergraph(cache, graphHash, snapshot)
+        self.assertIs(project._getFiltergraph(cache, graphHash, None), rebuilt)
+        self.assertIsNone(project._getFiltergraph(cache, 'unknown', None))
+
+
+class Test_ExecutionBackends(unittest.TestCase):
+    def test_threadQueue_passesCopies(self):
+        q = project.ThreadBackend().createQueue()
+        message = project.ParameterUpdateMessage([('node', 0, 'uid', {'r': 1.})])
+        q.put(message)
+        received = q.get(timeout=1)
+        self.assertIsNot(received, message)
+        self.assertEqual(received.updates, message.updates)
+
+    def test_threadBackend_rendersInProjectProcess(self):
+        proj = project.Project()
+        proj.setBackend('thread')
+        fg = proj.getSlot(0)
+        color = colors.StaticRGBColor(r=255., g=0., b=0.)
+        ledOut = devices.LEDOutput()
+        fg.addEffectNode(color)
+        fg.addEffectNode(ledOut)
+        fg.addConnection(color, 0, ledOut, 0)
+        device = RecordingDevice(4)
+        try:
+            proj.setDevice(devices.MultiOutputWrapper([device]))
+            for _ in range(3):
+                proj.update(0.02)
+            self.assertEqual(proj._filtergraphProcesses[0].process.pid, os.getpid())
+            self.assertEqual(proj.getFrameSyncStats()['backend'], 'thread')
+        finally:
+            proj.stopProcessing()
+            proj._workerPool.shutdown()
+        self.assertGreater(len(device.shown), 0)
+        np.testing.assert_array_equal(device.shown[-1][0], [255.] * 4)
+
+    def test_pipelined_showsEveryFrameFromItsBank(self):
+        proj = project.Project()
+        proj.setBackend('thread')
+        proj.setPipelineDepth(1)
+        proj._frameDeadline = 1.0
+        fg = proj.getSlot(0)
+        counter = SlowFrameCounter(duration=0.02)
+        ledOut = devices.LEDOutput()
+        fg.addEffectNode(counter)
+        fg.addEffectNode(ledOut)
+        fg.addConnection(counter, 0, ledOut, 0)
+        virtualOutput = RecordingVirtualOutput(RecordingDevice(4))
+        try:
+            proj.setDevice(devices.MultiOutputWrapper([virtualOutput]))
+            for _ in range(20):
+                # Frame period shorter than the render time of the worker, dt counts frames
+                proj.update(1.)
+            stats = proj.getFrameSyncStats()
+        finally:
+            proj.stopProcessing()
+            proj._workerPool.shutdown()
+        self.assertGreater(len(virtualOutput.shownFrames), 10)
+        for frameIndex, value in virtualOutput.shownFrames:
+            # The bank holds the frame that is shown, not the one two frames before
+            self.assertEqual(value, frameIndex)
+        shownIndices = [frameIndex for frameIndex, _ in virtualOutput.shownFrames]
+        self.assertEqual(shownIndices, sorted(set(shownIndices)))
+        self.assertEqual(stats['pipelineDepth'], 1)
+        self.assertGreater(stats['latency']['count'], 0)
+
+    def test_unknownBackend_raises(self):
+        with self.assertRaises(ValueError):
+            project.Project().setBackend('gpu')
+
+
+class Test_WorkerPool(unittest.TestCase):
+    def setUp(self):
+        backend = project.ThreadBackend()
+        self.pool = project.WorkerPool(backend.createQueue(), None, project.FrameSync(), backend=backend)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_unusedPool_spawnsNothing(self):
+        self.pool.prespawn()
+        self.assertEqual(self.pool._idle, [])
+
+    def test_releasedWorkers_cappedAtSpareWorkers(self):
+        workers = [self.pool.acquire() for _ in range(3)]
+        for worker in workers:
+            self.pool.release(worker)
+        self.assertEqual(self.pool._idle, workers[:1])
+        for worker in workers[1:]:
+            worker.process.join(1)
+            self.assertFalse(worker.is_alive())
+
+    def test_deactivatedProject_stopsWorkers(self):
+        proj = project.Project()
+        proj.setBackend('thread')
+        proj.setDevice(devices.MultiOutputWrapper([RecordingDevice(4)]))
+        proj.update(0.02)
+        self.assertGreater(len(proj._workerPool._idle), 0)
+        proj.deactivate()
+        self.assertEqual(proj._workerPool._idle, [])
+        self.assertEqual(proj._filtergraphProcesses, {})
+
+    def test_defaultCpuBudget_appliedOnActivation(self):
+        proj = project.Project()
+        self.assertEqual(proj.getCpuLayout()['blasThreads'], 1)
+        project.Project.defaultCpuBudget = {'blasThreads': 2}
+        try:
+            proj.deactivate()
+        finally:
+            project.Project.defaultCpuBudget = {}
+        self.assertEqual(proj.getCpuLayout()['blasThreads'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import tempfile
+import unittest
+import numpy as np
+from audioled import render, filtergraph, colors, devices, generative
+
+
+class Test_Render(unittest.TestCase):
+    def _createGraph(self):
+        fg = filtergraph.FilterGraph()
+        color = colors.StaticRGBColor(r=100)
+        pool = generative.SwimmingPool()
+        led = devices.LEDOutput()
+        fg.addEffectNode(color)
+        fg.addEffectNode(pool)
+        fg.addEffectNode(led)
+        fg.addConnection(color, 0, pool, 0)
+        fg.addConnection(pool, 0, led, 0)
+        return fg
+
+    def test_render_isReproducible(self):
+        fg = self._createGraph()
+        frames1 = render.OfflineRenderer(fg, num_pixels=50).render(20)
+        frames2 = render.OfflineRenderer(fg, num_pixels=50).render(20)
+        self.assertEqual(frames1.shape, (20, 3, 50))
+        np.testing.assert_array_equal(frames1, frames2)
+        # Frames change over time
+        self.assertFalse(np.array_equal(frames1[0], frames1[-1]))
+
+    def test_render_toMemmappedFile(self):
+        fg = self._createGraph()
+        renderer = render.OfflineRenderer(fg, num_pixels=50)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, 'frames.npy')
+            frames = renderer.render(10, filename)
+            loaded = np.load(filename)
+            np.testing.assert_array_equal(loaded, frames)
+            del frames
+        self.assertTrue(renderer.getFramesPerSecond(10) > 0)
+
+    def test_syntheticAudio_interleaved(self):
+        source = render.SyntheticAudioSource(sample_rate=1000, num_channels=2)
+        chunk = source.read(100)
+        self.assertEqual(len(chunk), 200)
+        np.testing.assert_array_equal(chunk[0::2], chunk[1::2])
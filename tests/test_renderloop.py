@@ -0,0 +1,48 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import time
+import unittest
+from audioled import renderloop
+
+
+class Test_RenderLoop(unittest.TestCase):
+    def test_fastFrames_onTime(self):
+        dts = []
+        loop = renderloop.RenderLoop(dts.append, fps=100.)
+        loop.start()
+        time.sleep(0.3)
+        loop.stop()
+        stats = loop.getStats()
+        self.assertGreater(stats['onTime'], 15)
+        self.assertLessEqual(len(dts), 32)
+        self.assertEqual(stats['onTime'] + stats['late'], len(dts))
+        self.assertAlmostEqual(sum(dts[1:]) / len(dts[1:]), 0.01, delta=0.005)
+
+    def test_slowFrames_lateAndDropped(self):
+        dts = []
+
+        def slowFrame(dt):
+            dts.append(dt)
+            time.sleep(0.025)
+
+        loop = renderloop.RenderLoop(slowFrame, fps=100.)
+        loop.start()
+        time.sleep(0.3)
+        loop.stop()
+        stats = loop.getStats()
+        self.assertEqual(stats['onTime'], 0)
+        self.assertEqual(stats['late'], len(dts))
+        # Frames are dropped instead of rendered back to back
+        self.assertGreater(stats['dropped'], stats['late'])
+        self.assertGreaterEqual(min(dts[1:]), 0.025)
+
+    def test_invalidFps_raises(self):
+        loop = renderloop.RenderLoop(lambda dt: None)
+        with self.assertRaises(ValueError):
+            loop.setFps(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import multiprocessing as mp
+import time
+import unittest
+from audioled import tracing
+
+
+def childProcess(tracer):
+    tracing.setTracer(tracer)
+    tracer.setProcessName("child")
+    with tracing.span('child span', {'frame': 1}):
+        pass
+    tracing.flush()
+
+
+class Test_Tracing(unittest.TestCase):
+    def tearDown(self):
+        tracing.setTracer(None)
+
+    def test_disabledTracer_recordsNothing(self):
+        tracer = tracing.Tracer()
+        tracing.setTracer(tracer)
+        with tracing.span('span'):
+            pass
+        self.assertEqual(tracer.getTrace()['traceEvents'], [])
+
+    def test_spansOfChildProcess_collected(self):
+        tracer = tracing.Tracer()
+        tracer.setProcessName("parent")
+        tracing.setTracer(tracer)
+        tracer.setEnabled(True)
+        with tracing.span('parent span'):
+            p = mp.Process(target=childProcess, args=(tracer, ))
+            p.start()
+            p.join()
+        # Give the queue feeder thread of the child some time
+        stop = time.time() + 2
+        events = []
+        while time.time() < stop and len([e for e in events if e['ph'] == 'X']) < 2:
+            events = tracer.getTrace()['traceEvents']
+            time.sleep(0.01)
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(set(spans.keys()), set(['parent span', 'child span']))
+        self.assertEqual(spans['child span']['pid'], p.pid)
+        self.assertEqual(spans['child span']['args'], {'frame': 1})
+        # Child span lies within the parent span on the shared clock
+        self.assertTrue(spans['parent span']['ts'] <= spans['child span']['ts'])
+        self.assertTrue(spans['child span']['ts'] <= spans['parent span']['ts'] + spans['parent span']['dur'])
+        names = {e['pid']: e['args']['name'] for e in events if e['ph'] == 'M'}
+        self.assertEqual(names[p.pid], "child")